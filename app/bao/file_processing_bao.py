@@ -1,127 +1,185 @@
-from typing import Dict, Any, List, Optional
-from sqlalchemy.orm import Session
-from app.dao.file_upload_dao import FileUploadDAO, ProcessingLogDAO
+import asyncio
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from app.config import settings
+from app.dao.file_upload_dao import FileUploadDAO, ProcessingLogBuffer, ProcessingLogDAO
+from app.dao.mapping_memory_dao import MappingMemoryDAO
 from app.bao.llm_mapping_bao import LLMMappingBAO
 from app.utils.file_utils import FileProcessor
+from app.utils.column_profiler import profile_columns, profile_summary
+from app.utils.mapping_memory import mapping_memory
+from app.utils.metrics import MAPPING_MEMORY_LOOKUPS
+from app.utils.progress_events import AWAITING_CONFIRMATION_STATUS, RETRY_LATER_STATUS
+from app.utils.llm_resilience import LLMUnavailable
 from app.utils.logger import app_logger
-from app.database.connection import get_db_session
-from app.schemas.file_schemas import DataInsertResponse, FieldMapping, MappingResult, ProcessingStats, Unmappings
+from app.utils.tracing import traced
+from app.utils.stage_timer import StageTimer
+from app.database.connection import get_db_session, get_async_db_session
+from app.database.schema_registry import get_schema_registry
+from app.schemas.file_schemas import (
+    DataInsertResponse, FieldMapping, MappingPreviewResponse, MappingResult, PreviewIssue, PreviewTableRow,
+    ProcessingStats, RetryFailedResponse, Unmappings
+)
 from app.dao.data_inserting_dao import main as process_llm_mappings  
 from app.dao.llm_dao import LLMExtractedDataDAO
 
+# Created for every record by the loader (data_inserting_dao), even with nothing mapped to them
+ALWAYS_INSERTED_TABLES = ('vendor', 'customer', 'invoice')
+
 class FileProcessingBAO:
-    def __init__(self):
+    def __init__(self, file_processor: Optional[FileProcessor] = None,
+                 llm_mapping_bao: Optional[LLMMappingBAO] = None):
         self.file_upload_dao = FileUploadDAO()
         self.processing_log_dao = ProcessingLogDAO()
-        self.llm_mapping_bao = LLMMappingBAO()
-        self.file_processor = FileProcessor()
+        self.llm_mapping_bao = llm_mapping_bao or LLMMappingBAO()
+        self.file_processor = file_processor or FileProcessor()
         self.llm_data_dao = LLMExtractedDataDAO()
-        self.expected_schema = {
-            'invoice': {
-                'invoice_number': "String",
-                'issue_date': "Date",
-                'due_date': "Date",
-                'total_amount': "DECIMAL"
-            },
-            'vendor': {
-                'vendor_name': "String",
-                'email': "String",
-                'phone': "String",
-                'address': "Text"
-            },
-            'invoiceitem': {
-                'description': "Text",
-                'quantity': "Integer",
-                'unit_price': "DECIMAL",
-                'total_price': "DECIMAL"
-            },
-            'customer': {
-                'customer_name': "String",
-                'customer_email': "String",
-                'customer_phone': "String",
-                'customer_address': "Text"
-            },
-            'payment': {
-                'payment_date': "Date",
-                'amount_paid': "DECIMAL",
-                'payment_method': "String"
-            }
-        }
+        self.mapping_memory_dao = MappingMemoryDAO()
+        self.document_file_types = ("pdf", "docx", "doc")
+        self.schema_registry = get_schema_registry()
+        self.expected_schema = self.schema_registry.expected_schema
     
+    @traced(record_args=('file_upload_id',))
     async def process_uploaded_file(self, file_upload_id: int) -> Dict[str, Any]:
+        timer = StageTimer("process_uploaded_file", file_upload_id=file_upload_id)
+        log_buffer = ProcessingLogBuffer(file_upload_id)
         try:
-            with get_db_session() as db:
-                file_upload = self.file_upload_dao.get_by_id(db, file_upload_id)
-                if not file_upload:
-                    raise ValueError(f"File upload {file_upload_id} not found")
-                                
-                self.file_upload_dao.update_processing_status(db, file_upload_id, "Processing")                 
-                self.processing_log_dao.create_log(db, file_upload_id, "INFO", "Started file processing")
+            async with get_async_db_session() as db:
+                with timer.stage("load"):
+                    file_upload = await self.file_upload_dao.get_by_id(db, file_upload_id)
+                    if not file_upload:
+                        raise ValueError(f"File upload {file_upload_id} not found")
+                    timer.file_type = file_upload.file_type
+                                    
+                    await self.file_upload_dao.update_processing_status(db, file_upload_id, "Processing")                 
+                    log_buffer.add("INFO", "Started file processing")
                 
-                if file_upload.file_type == "pdf" or file_upload.file_type == "docx" or file_upload.file_type == "doc":
+                with timer.stage("reuse_lookup"):
+                    reused_result = await self.reuse_previous_result(db, file_upload, log_buffer)
+                if reused_result:
+                    # Out of Processing, so confirm-mappings can claim the upload
+                    await self.file_upload_dao.update_processing_status(db, file_upload_id, AWAITING_CONFIRMATION_STATUS)
+                    return reused_result
+                
+                with timer.stage("extract"):
                     extracted_context = await self.extract_data(file_upload)
-                    llm_result = await self.llm_mapping_bao.fetch_and_map_columns_with_llm(extracted_context)
+                if isinstance(extracted_context, dict) and extracted_context.get("skipped_tables"):
+                    # Only the largest table of a document is loaded; the others' rows are not
+                    skipped_tables = extracted_context["skipped_tables"]
+                    log_buffer.add("WARNING", f"Skipped {len(skipped_tables)} tables with other headers; only the largest table is loaded",
+                                   details={'skipped_tables': skipped_tables})
+                
+                if file_upload.file_type in self.document_file_types and not self.is_tabular(extracted_context):
+                    document_text = extracted_context["context"] if isinstance(extracted_context, dict) else extracted_context
+                    with timer.stage("llm_mapping"):
+                        llm_result = await self.llm_mapping_bao.fetch_and_map_columns_with_llm(document_text)
                     extra_columns = llm_result["unmapped_fields"]
                 
-                    self.file_upload_dao.add_unmapped_columns(db, file_upload_id, unmapped_columns={
-                        "unmapped_fields": extra_columns
-                    })
-                    
-                    self.llm_data_dao.insert_data(
-                        db,
-                        file_upload_id,
-                        data=llm_result["data"],
-                        extracted_fields=llm_result["extracted_fields"]
-                    )
+                    with timer.stage("save_mappings"):
+                        await self.record_llm_usage(db, file_upload_id, llm_result.pop("usage", None), log_buffer)
+                        await self.file_upload_dao.add_unmapped_columns(db, file_upload_id, unmapped_columns={
+                            "unmapped_fields": extra_columns
+                        })
+                        
+                        await self.llm_data_dao.insert_data(
+                            db,
+                            file_upload_id,
+                            data=llm_result["data"],
+                            extracted_fields=llm_result["extracted_fields"],
+                            mappings=llm_result["mappings"]
+                        )
                     
                     mappingss_and_schema = {
                     "mappings": llm_result["mappings"], 
                     "expected_schema": self.expected_schema,
                     "file_upload_id": file_upload_id
                     }
+                    await self.file_upload_dao.update_processing_status(db, file_upload_id, AWAITING_CONFIRMATION_STATUS)
                     return mappingss_and_schema
-                                
-                extracted_context = await self.extract_data(file_upload)
 
                 extracted_columns = extracted_context["columns"]
-                file_content = extracted_context["rows"][0] 
+                extracted_rows = extracted_context["rows"]
                 
-                if not file_content:
+                if not extracted_rows:
                     raise ValueError("No content extracted from the file") 
                 
-                llm_result = await self.llm_mapping_bao.map_columns_with_llm(extracted_columns, file_content)
-                if not llm_result:
-                    raise ValueError("LLM mapping returned empty result")
+                with timer.stage("memory_lookup"):
+                    remembered = await self.remembered_mappings(db, extracted_columns)
+                unknown_columns = [column for column in extracted_columns if column not in remembered]
+                if remembered:
+                    log_buffer.add("INFO", f"{len(remembered)} of {len(extracted_columns)} columns mapped from confirmed mappings",
+                                   details={'columns': list(remembered)})
+                
+                if unknown_columns:
+                    with timer.stage("profile"):
+                        column_profiles = await asyncio.to_thread(profile_columns, unknown_columns, extracted_rows)
+                        log_buffer.add("INFO", f"Profiled {len(unknown_columns)} columns: {profile_summary(column_profiles)}")
+                    
+                    with timer.stage("llm_mapping"):
+                        llm_result = await self.llm_mapping_bao.map_columns_with_llm(
+                            unknown_columns, column_profiles, document_context=extracted_context.get("context")
+                        )
+                    if not llm_result:
+                        raise ValueError("LLM mapping returned empty result")
+                else:
+                    llm_result = {"mappings": [], "unmapped_fields": []}
                 
-                llm_mappings = llm_result["mappings"]
+                llm_mappings = [
+                    {'source_field': column, 'target_table': table, 'target_column': target_column}
+                    for column, (table, target_column) in remembered.items()
+                ] + llm_result["mappings"]
                 extra_columns = llm_result["unmapped_fields"]
                 
-                self.file_upload_dao.add_unmapped_columns(db, file_upload_id, unmapped_columns={
-                    "unmapped_fields": extra_columns
-                })
+                with timer.stage("save_mappings"):
+                    await self.record_llm_usage(db, file_upload_id, llm_result.pop("usage", None), log_buffer)
+                    await self.file_upload_dao.add_unmapped_columns(db, file_upload_id, unmapped_columns={
+                        "unmapped_fields": extra_columns
+                    })
+                    
+                    await self.llm_data_dao.insert_data(
+                        db,
+                        file_upload_id,
+                        data=None,
+                        extracted_fields=extracted_columns,
+                        mappings=llm_mappings,
+                        sample_rows=extracted_rows[:settings.PREVIEW_SAMPLE_ROWS]
+                    )
 
                 mappingss_and_schema = {
                     "mappings": llm_mappings, 
                     "expected_schema": self.expected_schema,
                     "file_upload_id": file_upload_id
                 }
+                await self.file_upload_dao.update_processing_status(db, file_upload_id, AWAITING_CONFIRMATION_STATUS)
 
                 return mappingss_and_schema
                                                 
+        except LLMUnavailable as e:
+            # Documents have no local fallback: while the provider's circuit is open they cannot be mapped.
+            # The upload is marked for a later attempt instead of failed, and the caller gets the 503
+            summary = f"{e.detail}; upload the file again in {e.retry_after}s"
+            app_logger.warning(f"Processing of file {file_upload_id} deferred: {summary}")
+            log_buffer.add("WARNING", f"Processing deferred: {summary}", details={'retry_after': e.retry_after})
+            async with get_async_db_session() as db:
+                await self.file_upload_dao.update_processing_status(db, file_upload_id, RETRY_LATER_STATUS, summary)
+            raise
         except Exception as e:
             app_logger.error(f"Error processing file {file_upload_id}: {str(e)}")
-            with get_db_session() as db:
-                self.file_upload_dao.update_processing_status(db, file_upload_id, "Failed", str(e))
-                self.processing_log_dao.create_log(db, file_upload_id, "ERROR", f"Processing failed: {str(e)}")
+            log_buffer.add("ERROR", f"Processing failed: {str(e)}")
+            async with get_async_db_session() as db:
+                await self.file_upload_dao.update_processing_status(db, file_upload_id, "Failed", str(e))
             raise
+        finally:
+            await self.record_timings(file_upload_id, timer, log_buffer)
 
         
+    @traced(record_args=('file_upload_id',))
     async def confirm_user_mappings(self, file_upload_id: int, confirmed_mappings: List[Dict[str, Any]]) -> DataInsertResponse:
+        timer = StageTimer("confirm_user_mappings", file_upload_id=file_upload_id)
+        log_buffer = ProcessingLogBuffer(file_upload_id)
         try:
-            with get_db_session() as db:
-                self.processing_log_dao.create_log(
-                    db, file_upload_id, "INFO", "Starting database insertion with LLM mappings"
-                )
+            async with get_async_db_session() as db:
+                log_buffer.add("INFO", "Starting database insertion with LLM mappings")
                 
                 processed_mappings_list = []
                 for mapping in confirmed_mappings:
@@ -138,29 +196,47 @@ class FileProcessingBAO:
                     'mappings': processed_mappings_list
                 }
 
-                file_upload = self.file_upload_dao.get_by_id(db, file_upload_id)
-                
-                if file_upload.file_type == "pdf" or file_upload.file_type == "docx" or file_upload.file_type == "doc":
-                    llm_cache = self.llm_data_dao.get_data_by_id(db, file_upload_id)
+                with timer.stage("load"):
+                    file_upload = await self.file_upload_dao.get_by_id(db, file_upload_id)
+                    timer.file_type = file_upload.file_type
                     
-                    processing_stats = process_llm_mappings(
-                    file_content=llm_cache.data,
-                    mappings=processed_mappings,
-                    file_upload_id=file_upload_id,
-                    db_session=db
+                    llm_cache = await self.get_llm_cache(db, file_upload)
+                    # Clients may echo the LLM's "Header (Type)" names back; store and insert raw headers
+                    processed_mappings_list = self.schema_registry.canonical_mappings(
+                        processed_mappings_list, llm_cache.extracted_fields if llm_cache is not None else None
                     )
+                    processed_mappings['mappings'] = processed_mappings_list
+                    if llm_cache is not None and llm_cache.file_upload_id != file_upload_id:
+                        # Linked before reuse copied the cache row; never overwrite the source upload's mappings
+                        llm_cache = await self.llm_data_dao.copy_to_upload(db, llm_cache, file_upload_id)
+                    if llm_cache is not None:
+                        await self.llm_data_dao.update_mappings(db, file_upload_id, processed_mappings_list)
+                
+                # Documents mapped from their tables have no cached LLM rows and are re-extracted below
+                # The insert can run for minutes; make the events so far visible before it starts
+                await log_buffer.flush(db)
+                
+                if file_upload.file_type in self.document_file_types and llm_cache is not None and llm_cache.data is not None:
+                    with timer.stage("insert"):
+                        processing_stats = await self.insert_mapped_records(
+                            llm_cache.data, processed_mappings, file_upload_id
+                        )
                     
-                    self.processing_log_dao.create_log(
-                    db, file_upload_id, "INFO", 
-                    f"Database insertion completed. Success: {processing_stats['successful_records']}, "
-                    f"Failed: {processing_stats['failed_records']}"
-                    )
+                    with timer.stage("finalize"):
+                        log_buffer.add(
+                        "INFO", 
+                        f"Database insertion completed. Success: {processing_stats['successful_records']}, "
+                        f"Failed: {processing_stats['failed_records']}"
+                        )
+                        
+                        if processing_stats['failed_records'] == 0:
+                            final_status = "Completed" 
+                        else:
+                            final_status = "Partial success"
+                        await self.file_upload_dao.update_processing_status(db, file_upload_id, final_status)
                     
-                    if processing_stats['failed_records'] == 0:
-                        final_status = "Completed" 
-                    else:
-                        final_status = "Partial success"
-                    self.file_upload_dao.update_processing_status(db, file_upload_id, final_status)
+                    with timer.stage("learn"):
+                        await self.learn_confirmed_mappings(db, processed_mappings_list, processing_stats, log_buffer)
                 
                 
                     field_mappings = []
@@ -197,27 +273,35 @@ class FileProcessingBAO:
                     return response
                     
                 
-                extracted_context = await self.extract_data(file_upload)
-                file_content = extracted_context["rows"]            
-                
-                processing_stats = process_llm_mappings(
-                    file_content=file_content,
-                    mappings=processed_mappings,
-                    file_upload_id=file_upload_id,
-                    db_session=db
-                )
+                with timer.stage("extract"):
+                    extracted_context = await self.extract_data(file_upload)
+                file_content = extracted_context["rows"]
+                if llm_cache is None:
+                    processed_mappings_list = self.schema_registry.canonical_mappings(
+                        processed_mappings_list, extracted_context["columns"]
+                    )
+                    processed_mappings['mappings'] = processed_mappings_list
+
+                with timer.stage("insert"):
+                    processing_stats = await self.insert_mapped_records(
+                        file_content, processed_mappings, file_upload_id
+                    )
                 
-                self.processing_log_dao.create_log(
-                    db, file_upload_id, "INFO", 
-                    f"Database insertion completed. Success: {processing_stats['successful_records']}, "
-                    f"Failed: {processing_stats['failed_records']}"
-                )
+                with timer.stage("finalize"):
+                    log_buffer.add(
+                        "INFO", 
+                        f"Database insertion completed. Success: {processing_stats['successful_records']}, "
+                        f"Failed: {processing_stats['failed_records']}"
+                    )
+                    
+                    if processing_stats['failed_records'] == 0:
+                        final_status = "Completed" 
+                    else:
+                        final_status = "Partial success"
+                    await self.file_upload_dao.update_processing_status(db, file_upload_id, final_status)
                 
-                if processing_stats['failed_records'] == 0:
-                    final_status = "Completed" 
-                else:
-                    final_status = "Partial success"
-                self.file_upload_dao.update_processing_status(db, file_upload_id, final_status)
+                with timer.stage("learn"):
+                    await self.learn_confirmed_mappings(db, processed_mappings_list, processing_stats, log_buffer)
                 
                 field_mappings = []
                 for mapping in processed_mappings_list:
@@ -253,41 +337,296 @@ class FileProcessingBAO:
                 return response
                 
         except Exception as e:
+            log_buffer.add("ERROR", f"Error confirming mappings: {str(e)}")
             try:
-                with get_db_session() as db:
-                    self.processing_log_dao.create_log(
-                        db, file_upload_id, "ERROR", f"Error confirming mappings: {str(e)}"
-                    )
-                    self.file_upload_dao.update_processing_status(db, file_upload_id, "Failed")
+                async with get_async_db_session() as db:
+                    await self.file_upload_dao.update_processing_status(db, file_upload_id, "Failed")
             except:
                 pass
         
             raise e
+        finally:
+            await self.record_timings(file_upload_id, timer, log_buffer)
 
         
+    @traced()
+    async def reuse_previous_result(self, db, file_upload, log_buffer: ProcessingLogBuffer) -> Optional[Dict[str, Any]]:
+        if not file_upload.content_hash:
+            return None
+        
+        previous = await self.file_upload_dao.get_reusable_by_content_hash(
+            db, file_upload.content_hash, file_upload.file_type, file_upload.file_upload_id
+        )
+        if not previous:
+            return None
+        
+        llm_cache = await self.llm_data_dao.get_data_by_id(db, previous.file_upload_id)
+        await self.file_upload_dao.link_to_previous_upload(db, file_upload.file_upload_id, previous)
+        await self.llm_data_dao.copy_to_upload(db, llm_cache, file_upload.file_upload_id)
+        log_buffer.add(
+            "INFO", f"Identical content already processed in upload {previous.file_upload_id}; reusing its mappings"
+        )
+        return {
+            "mappings": llm_cache.mappings,
+            "expected_schema": self.expected_schema,
+            "file_upload_id": file_upload.file_upload_id
+        }
+        
+    async def get_llm_cache(self, db, file_upload):
+        # The upload's own cache row. Uploads linked to an identical one before reuse copied the row
+        # fall back to the source upload's, which callers must only read
+        llm_cache = await self.llm_data_dao.get_data_by_id(db, file_upload.file_upload_id)
+        if llm_cache is None and file_upload.reused_from_upload_id:
+            llm_cache = await self.llm_data_dao.get_data_by_id(db, file_upload.reused_from_upload_id)
+        return llm_cache
+        
+    @traced(record_args=('file_upload_id',))
+    async def preview_mappings(self, file_upload_id: int, mappings: List[Dict[str, Any]], rows: int) -> MappingPreviewResponse:
+        # Applies candidate mappings to the cached sample rows the way confirm_user_mappings would,
+        # coercion included, and reports the per-table rows and errors. Nothing is written
+        rows = min(rows, settings.PREVIEW_SAMPLE_ROWS)
+        async with get_async_db_session() as db:
+            file_upload = await self.file_upload_dao.get_by_id(db, file_upload_id)
+            if not file_upload:
+                raise ValueError(f"File upload {file_upload_id} not found")
+            llm_cache = await self.get_llm_cache(db, file_upload)
+        
+        if llm_cache is not None and llm_cache.sample_rows is not None:
+            sample = llm_cache.sample_rows[:rows]
+        elif llm_cache is not None and llm_cache.data is not None:
+            sample = llm_cache.data[:rows]
+        else:
+            # Uploads processed before samples were cached, and documents mapped from their tables
+            extracted_context = await self.extract_data(file_upload)
+            sample = extracted_context["rows"][:rows] if self.is_tabular(extracted_context) else []
+        columns = llm_cache.extracted_fields if llm_cache is not None and llm_cache.extracted_fields else None
+        
+        errors: List[PreviewIssue] = []
+        compiled, rejected = self.schema_registry.compile_mappings(mappings, self.schema_registry.date_orders(mappings, sample))
+        for mapping in rejected:
+            errors.append(PreviewIssue(message="Unknown target column", **mapping))
+        seen_targets: Dict[Tuple[str, str], str] = {}
+        for source_field, table, column, _ in compiled:
+            if columns is not None and source_field not in columns:
+                errors.append(PreviewIssue(source_field=source_field, target_table=table, target_column=column,
+                                           message="Source field is not an extracted column"))
+            if (table, column) in seen_targets:
+                errors.append(PreviewIssue(source_field=source_field, target_table=table, target_column=column,
+                                           message=f"Target also mapped from {seen_targets[(table, column)]}; the later value wins"))
+            seen_targets[(table, column)] = source_field
+        
+        tables: Dict[str, List[PreviewTableRow]] = {table: [] for table in self.schema_registry.tables}
+        failed_rows = 0
+        for index, record in enumerate(sample):
+            value_errors = []
+            transformed = self.schema_registry.transform(record, compiled, value_errors)
+            if value_errors:
+                failed_rows += 1
+                errors.extend(PreviewIssue(row=index, source_field=source_field, target_table=table,
+                                           target_column=column, message=message)
+                              for source_field, table, column, message in value_errors)
+                continue
+            # Mirrors the loader: vendor, customer and invoice rows are always created, items and
+            # payments only when something maps to them
+            for table, values in transformed.items():
+                if values or table in ALWAYS_INSERTED_TABLES:
+                    tables[table].append(PreviewTableRow(row=index, values=values))
+        
+        return MappingPreviewResponse(
+            file_upload_id=file_upload_id,
+            rows_previewed=len(sample),
+            valid_rows=len(sample) - failed_rows,
+            failed_rows=failed_rows,
+            tables=tables,
+            errors=errors
+        )
+        
+    @traced(record_args=('file_upload_id',))
+    async def retry_failed_records(self, file_upload_id: int, mappings: Optional[List[Dict[str, Any]]] = None,
+                                   values: Optional[Dict[int, Dict[str, Any]]] = None,
+                                   rows: Optional[List[int]] = None) -> RetryFailedResponse:
+        # Re-runs the loader over the rows the last insert could not load, with corrected mappings or
+        # values when given, and appends them to the upload. Rows loaded before are not touched
+        timer = StageTimer("retry_failed_records", file_upload_id=file_upload_id)
+        log_buffer = ProcessingLogBuffer(file_upload_id)
+        values = values or {}
+        mappings_replaced = mappings is not None
+        try:
+            async with get_async_db_session() as db:
+                with timer.stage("load"):
+                    file_upload = await self.file_upload_dao.get_by_id(db, file_upload_id)
+                    if not file_upload:
+                        raise ValueError(f"File upload {file_upload_id} not found")
+                    timer.file_type = file_upload.file_type
+                    
+                    failed_rows = await self.file_upload_dao.get_failed_rows(db, file_upload_id)
+                    row_indices = sorted(failed_rows if rows is None else set(rows) & failed_rows.keys())
+                    if not row_indices:
+                        raise ValueError(f"File upload {file_upload_id} has no failed rows to retry")
+                    
+                    llm_cache = await self.get_llm_cache(db, file_upload)
+                    if mappings is None:
+                        if llm_cache is None or not llm_cache.mappings:
+                            raise ValueError(f"File upload {file_upload_id} has no confirmed mappings to retry with")
+                        mappings = llm_cache.mappings
+                
+                log_buffer.add("INFO", f"Retrying {len(row_indices)} of {len(failed_rows)} failed rows",
+                               {'corrected_rows': len(values), 'mappings_replaced': mappings_replaced})
+                await log_buffer.flush(db)
+                
+                with timer.stage("extract"):
+                    if file_upload.file_type in self.document_file_types and llm_cache is not None and llm_cache.data is not None:
+                        extracted_rows = llm_cache.data
+                    else:
+                        extracted_rows = (await self.extract_data(file_upload))["rows"]
+                    records = []
+                    for row_index in row_indices:
+                        record = dict(extracted_rows[row_index])
+                        record.update(values.get(row_index, {}))
+                        records.append(record)
+                
+                with timer.stage("insert"):
+                    processing_stats = await self.insert_mapped_records(
+                        records, {'mappings': mappings}, file_upload_id, row_indices
+                    )
+                
+                with timer.stage("finalize"):
+                    remaining = len(failed_rows) - len(row_indices) + processing_stats['failed_records']
+                    log_buffer.add(
+                        "INFO",
+                        f"Retry completed. Success: {processing_stats['successful_records']}, "
+                        f"Failed: {processing_stats['failed_records']}, still failed overall: {remaining}"
+                    )
+                    final_status = "Completed" if remaining == 0 else "Partial success"
+                    await self.file_upload_dao.update_processing_status(db, file_upload_id, final_status)
+                
+                return RetryFailedResponse(
+                    file_upload_id=file_upload_id,
+                    retried_rows=row_indices,
+                    processing_stats=ProcessingStats(
+                        total_records=processing_stats.get('total_records', 0),
+                        successful_records=processing_stats.get('successful_records', 0),
+                        failed_records=processing_stats.get('failed_records', 0),
+                        errors=processing_stats.get('errors', [])
+                    ),
+                    remaining_failed_rows=remaining,
+                    status=final_status
+                )
+        
+        except Exception as e:
+            # The rows loaded before stay loaded, so the upload keeps its status
+            log_buffer.add("ERROR", f"Error retrying failed rows: {str(e)}")
+            raise
+        finally:
+            await self.record_timings(file_upload_id, timer, log_buffer)
+        
+    async def remembered_mappings(self, db, columns: List[str]) -> Dict[str, Tuple[str, str]]:
+        if not settings.MAPPING_MEMORY_ENABLED:
+            return {}
+        if mapping_memory.needs_refresh():
+            try:
+                mapping_memory.replace(await self.mapping_memory_dao.load_entries(db))
+            except Exception as e:
+                # Stale or empty memory only means more columns go to the LLM
+                app_logger.warning(f"Could not refresh mapping memory: {str(e)}")
+        remembered = {
+            column: target for column, target in mapping_memory.lookup_all(columns).items()
+            if self.schema_registry.has_target(*target)
+        }
+        MAPPING_MEMORY_LOOKUPS.labels('hit').inc(len(remembered))
+        MAPPING_MEMORY_LOOKUPS.labels('miss').inc(len(columns) - len(remembered))
+        return remembered
+
+    async def learn_confirmed_mappings(self, db, mappings: List[Dict[str, Any]], processing_stats: Dict[str, Any],
+                                       log_buffer: ProcessingLogBuffer):
+        # Called once the insert has run; a confirmation none of whose rows loaded teaches nothing
+        if not settings.MAPPING_MEMORY_ENABLED or not mappings:
+            return
+        if not processing_stats.get('successful_records'):
+            log_buffer.add("INFO", "No records were inserted; confirmed mappings are not remembered")
+            return
+        now = datetime.now()
+        try:
+            recorded = await self.mapping_memory_dao.record_confirmations(db, mappings, now)
+        except Exception as e:
+            # Learning is a side effect; the user's insert goes ahead without it
+            log_buffer.add("WARNING", f"Could not record confirmed mappings: {str(e)}")
+            return
+        for mapping in mappings:
+            mapping_memory.record(mapping['source_field'], mapping['target_table'], mapping['target_column'], now)
+        log_buffer.add("INFO", f"Remembered {recorded} confirmed mappings")
+
+    async def record_llm_usage(self, db, file_upload_id: int, usage: Optional[Dict[str, Any]],
+                               log_buffer: ProcessingLogBuffer):
+        if not usage:
+            return
+        if usage['source'] in ('coalesced', 'cached', 'local'):
+            log_buffer.add("INFO", f"LLM {usage['operation']}: answer reused ({usage['source']}), no tokens spent",
+                           details=usage)
+            return
+        await self.file_upload_dao.add_llm_usage(db, file_upload_id, usage['prompt_tokens'], usage['completion_tokens'])
+        log_buffer.add(
+            "INFO",
+            f"LLM {usage['operation']}: {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens",
+            details=usage
+        )
+        
+    async def record_timings(self, file_upload_id: int, timer: StageTimer,
+                             log_buffer: Optional[ProcessingLogBuffer] = None):
+        # End of the pipeline: the timings go out in the same insert as the run's remaining events
+        log_buffer = log_buffer or ProcessingLogBuffer(file_upload_id)
+        log_buffer.add("INFO", f"Stage timings for {timer.pipeline}", details=timer.finish())
+        try:
+            async with get_async_db_session() as db:
+                await log_buffer.flush(db, final=True)
+        except Exception as e:
+            # Timings are diagnostics; never let them replace the pipeline's own result or error
+            app_logger.error(f"Error recording stage timings for file {file_upload_id}: {str(e)}")
+        
+    @traced(record_args=('file_upload_id',))
+    async def insert_mapped_records(self, file_content: List[Dict[str, Any]], mappings: Dict[str, Any],
+                                    file_upload_id: int, row_indices: Optional[List[int]] = None) -> Dict[str, Any]:
+        # The row-by-row loader stays on the sync engine; run it in a worker thread so
+        # other requests on this worker keep being served while it commits
+        def run():
+            with get_db_session() as sync_db:
+                return process_llm_mappings(
+                    file_content=file_content,
+                    mappings=mappings,
+                    file_upload_id=file_upload_id,
+                    db_session=sync_db,
+                    row_indices=row_indices
+                )
+        return await asyncio.to_thread(run)
+        
+    def is_tabular(self, extracted_context: Any) -> bool:
+        return isinstance(extracted_context, dict) and bool(extracted_context.get("rows"))
+        
+    @traced()
     async def extract_data(self, file_upload) -> Dict[str, Any]:
         file_path = file_upload.file_path
         storage_location = file_upload.storage_location
         file_type = file_upload.file_type.lower()
                 
         try:
+            if file_type not in ['csv', 'xlsx', 'xls', 'tsv', 'pdf', 'docx', 'doc']:
+                raise ValueError(f"Unsupported file type: {file_type}")
+
+            file_name = file_upload.original_filename
             if file_type == 'csv':
-                data = self.file_processor.extract_data_from_csv(file_path, storage_location)
-                return data
+                extractor = self.file_processor.extract_data_from_csv
             elif file_type in ['xlsx', 'xls']:
-                data = self.file_processor.extract_data_from_excel(file_path, storage_location)
-                return data
+                extractor = self.file_processor.extract_data_from_excel
             elif file_type == 'tsv':
-                data = self.file_processor.extract_data_from_tsv(file_path, storage_location)
-                return data
+                extractor = self.file_processor.extract_data_from_tsv
             elif file_type == 'pdf':
-                text = self.file_processor.extract_text_from_pdf(file_path, storage_location)
-                return text
-            elif file_type in ['docx', 'doc']:
-                text = self.file_processor.extract_text_from_docx(file_path, storage_location)
-                return text
+                extractor = self.file_processor.extract_text_from_pdf
             else:
-                raise ValueError(f"Unsupported file type: {file_type}")
+                extractor = self.file_processor.extract_data_from_docx
+            
+            # Parsing is CPU-bound; keep it off the event loop
+            with await self.file_processor.open_stored_file(file_path, storage_location) as file:
+                return await asyncio.to_thread(extractor, file, file_name)
         except Exception as e:
             app_logger.error(f"Error extracting columns from {file_path}: {str(e)}")
             raise
\ No newline at end of file
@@ -1,188 +1,179 @@
-import openai
-from openai import AsyncOpenAI
-import google.generativeai as genai
 import json
-import re
-from typing import List, Dict, Any, Optional
-from sqlalchemy import String, Integer, Float, DECIMAL, Text, Date
+from functools import lru_cache
+from typing import Callable, List, Dict, Any, Optional
 from app.config import settings
+from app.database.schema_registry import get_schema_registry
 from app.utils.logger import app_logger
+from app.utils.startup_report import lazy_import
+from app.utils.llm_resilience import LLMUnavailable, ResilientCaller
+from app.utils.local_matcher import match_columns
+from app.utils.metrics import LLM_CALLS_COLLAPSED, LLM_LOCAL_FALLBACKS, LLM_PROMPTS_TRUNCATED, LLM_TOKENS
+from app.utils.prompt_builder import BuiltPrompt, PromptBuilder, estimate_tokens
+from app.utils.singleflight import AsyncSingleFlight
+from app.utils.tracing import span, traced
+from app.utils.ttl_cache import TTLCache
+
+GENAI_MODEL_NAME = "gemini-2.0-flash-exp"
+
+@lru_cache(maxsize=None)
+def get_genai_model():
+    # google.generativeai takes about a second to import; configure it once per process on first use
+    genai = lazy_import("google.generativeai")
+    genai.configure(api_key=settings.GENAI_API_KEY)
+    return genai.GenerativeModel(model_name=GENAI_MODEL_NAME)
+
+def token_usage(operation: str, prompt: BuiltPrompt, response: Any, response_text: str) -> Dict[str, Any]:
+    # Gemini's own counts when the response carries them, local estimates otherwise
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    completion_tokens = getattr(usage, 'candidates_token_count', None)
+    result = {
+        'operation': operation,
+        'prompt_tokens': prompt_tokens if isinstance(prompt_tokens, int) else prompt.tokens,
+        'completion_tokens': completion_tokens if isinstance(completion_tokens, int) else estimate_tokens(response_text),
+        'estimated_prompt_tokens': prompt.tokens,
+        'source': 'reported' if isinstance(prompt_tokens, int) else 'estimated',
+        'prompt_truncated': prompt.truncated
+    }
+    LLM_TOKENS.labels(operation, 'prompt').inc(result['prompt_tokens'])
+    LLM_TOKENS.labels(operation, 'completion').inc(result['completion_tokens'])
+    return result
+
+def collapsed_usage(operation: str, source: str) -> Dict[str, Any]:
+    # Calls served by an identical in-flight or cached request, or by the local matcher, spend no
+    # tokens of their own
+    return {
+        'operation': operation,
+        'prompt_tokens': 0,
+        'completion_tokens': 0,
+        'estimated_prompt_tokens': 0,
+        'source': source,
+        'prompt_truncated': False
+    }
 
 class LLMMappingBAO:
     def __init__(self):
-        genai_key = settings.GENAI_API_KEY
-        genai.configure(api_key=genai_key)
-        self.expected_schema = {
-            'invoice': {
-                'invoice_number': String,
-                'issue_date': Date,
-                'due_date': Date,
-                'total_amount': DECIMAL
-            },
-            'vendor': {
-                'vendor_name': String,
-                'email': String,
-                'phone': String,
-                'address': Text
-            },
-            'invoiceitem': {
-                'description': Text,
-                'quantity': Integer,
-                'unit_price': DECIMAL,
-                'total_price': DECIMAL
-            },
-            'customer': {
-                'customer_name': String,
-                'customer_email': String,
-                'customer_phone': String,
-                'customer_address': Text
-            },
-            'payment': {
-                'payment_date': Date,
-                'amount_paid': DECIMAL,
-                'payment_method': String
+        self.schema_registry = get_schema_registry()
+        self.prompt_builder = PromptBuilder(self.schema_registry.schema_text)
+        self.single_flight = AsyncSingleFlight()
+        self.result_cache = TTLCache(settings.LLM_RESULT_CACHE_MAX_ENTRIES, settings.LLM_RESULT_CACHE_TTL_SECONDS)
+        self.resilient = ResilientCaller('gemini')
+
+    def generate(self, operation: str, prompt: BuiltPrompt, response_schema: Optional[Dict[str, Any]] = None,
+                 **attributes: Any):
+        if prompt.truncated:
+            LLM_PROMPTS_TRUNCATED.labels(operation).inc()
+        model = get_genai_model()
+
+        with span("llm.generate_content", 'CLIENT', **{'llm.system': 'gemini', 'llm.model': GENAI_MODEL_NAME,
+                                                      'llm.operation': operation, 'llm.prompt_chars': len(prompt.text),
+                                                      'llm.prompt_tokens_estimate': prompt.tokens,
+                                                      'llm.prompt_truncated': prompt.truncated, **attributes}) as llm_span:
+            generation_config = {
+                "temperature": 0.1,
+                "max_output_tokens": settings.LLM_MAX_OUTPUT_TOKENS,
+                "response_mime_type": "application/json"
             }
-        }
-
-
-    async def map_columns_with_llm(self, extracted_columns: List[str], file_context: List[Dict]) -> Dict[str, Any]:
-        try:
-            context = f"File context: {file_context}\n"
-            
-            prompt = f"""
-            {context}
-            Map the following extracted column names to the appropriate database schema fields.
-
-            Extracted columns: {extracted_columns}
-
-            Available database schema:
-            - invoice: {self.expected_schema['invoice']}
-            - vendor: {self.expected_schema['vendor']}
-            - invoiceitem: {self.expected_schema['invoiceitem']}
-            - customer: {self.expected_schema['customer']}
-            - payment: {self.expected_schema['payment']}
-
-            Provide response ONLY in valid JSON format:
-            {{
-                "mappings": [
-                    {{
-                        "source_field": "extracted_column_name (datatype)",
-                        "target_table": "table_name",
-                        "target_column": "column_name (datatype)"
-                    }}
-                ],
-                "unmapped_fields": ["field1", "field2"]
-            }}
-
-            Guidelines:
-            - Consider common invoice terminology variations
-            - Give full datatpe names (e.g., "String", "Integer", "DECIMAL")
-            - Only return valid JSON, no additional text or explanations
-            """
-
-            model = genai.GenerativeModel(model_name="gemini-2.0-flash-exp")
-            
+            if response_schema is not None:
+                generation_config["response_schema"] = response_schema
             response = model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.1,
-                    "max_output_tokens": 2000,
-                    "response_mime_type": "application/json"
-                }
+                prompt.text,
+                generation_config=generation_config,
+                request_options={"timeout": settings.LLM_REQUEST_TIMEOUT_SECONDS}
             )
 
             response_text = response.text.strip() if response.text else ""
-            
-            # app_logger.info(f"Raw LLM response: {response_text}")
-            
-            if not response_text:
-                app_logger.warning("Empty response from LLM, using fallback mapping")
-
-            result = json.loads(response_text)
+            usage = token_usage(operation, prompt, response, response_text)
+            llm_span.set_attributes({
+                'llm.response_chars': len(response_text),
+                'llm.usage.prompt_tokens': usage['prompt_tokens'],
+                'llm.usage.completion_tokens': usage['completion_tokens'],
+                'llm.usage.source': usage['source']
+            })
+        return response_text, usage
+
+    async def generate_resilient(self, operation: str, prompt: BuiltPrompt, **attributes: Any):
+        # Retries, hedging and the circuit breaker; each attempt runs in a worker thread
+        return await self.resilient.call(operation, lambda: self.generate(operation, prompt, **attributes))
+
+    async def generate_coalesced(self, operation: str, key: str, build_prompt: Callable[[], BuiltPrompt],
+                                 **attributes: Any):
+        # Identical calls (same key) share one request while it is in flight and reuse its answer for
+        # LLM_RESULT_CACHE_TTL_SECONDS afterwards, so concurrent uploads join rather than repeat it
+        if not settings.LLM_COALESCE_ENABLED:
+            return await self.generate_resilient(operation, build_prompt(), **attributes)
+
+        cached_text = self.result_cache.get(key)
+        if cached_text is not None:
+            LLM_CALLS_COLLAPSED.labels(operation, 'cached').inc()
+            return cached_text, collapsed_usage(operation, 'cached')
+
+        async def call():
+            response_text, usage = await self.generate_resilient(operation, build_prompt(), **attributes)
+            try:
+                # Only well-formed answers outlive the call
+                json.loads(response_text)
+                self.result_cache.set(key, response_text)
+            except ValueError:
+                pass
+            return response_text, usage
+
+        (response_text, usage), shared = await self.single_flight.do(key, call)
+        if shared:
+            LLM_CALLS_COLLAPSED.labels(operation, 'coalesced').inc()
+            return response_text, collapsed_usage(operation, 'coalesced')
+        return response_text, usage
+
+    @traced()
+    async def map_columns_with_llm(self, extracted_columns: List[str], column_profiles: Dict[str, Dict[str, Any]],
+                                   document_context: Optional[str] = None) -> Dict[str, Any]:
+        # column_profiles comes from profile_columns() over the extracted rows
+        key = self.prompt_builder.mapping_fingerprint(extracted_columns, column_profiles, document_context)
+        try:
+            response_text, usage = await self.generate_coalesced(
+                'map_columns', key,
+                lambda: self.prompt_builder.mapping_prompt(extracted_columns, column_profiles, document_context),
+                response_schema=self.schema_registry.mapping_response_schema,
+                **{'llm.columns': len(extracted_columns)}
+            )
+        except LLMUnavailable as e:
+            if not settings.LLM_FALLBACK_LOCAL_MATCHER:
+                raise
+            app_logger.warning(f"LLM mapping unavailable ({e.detail}); using the local matcher")
+            LLM_LOCAL_FALLBACKS.labels('map_columns').inc()
+            result = match_columns(extracted_columns, self.schema_registry.expected_schema, column_profiles)
+            result['usage'] = collapsed_usage('map_columns', 'local')
             return result
 
-        except Exception as e:
-            app_logger.error(f"Error in LLM mapping: {str(e)}")
-            return {"message": "LLM is not working"}
+        try:
+            result = json.loads(response_text)
+        except ValueError:
+            app_logger.error(f"LLM mapping returned malformed JSON: {response_text[:200]!r}")
+            raise ValueError("LLM mapping returned a malformed response")
+        if not isinstance(result, dict) or not isinstance(result.get('mappings'), list):
+            raise ValueError("LLM mapping response has no mappings list")
+        result['mappings'] = self.schema_registry.canonical_mappings(result['mappings'], extracted_columns)
+        result.setdefault('unmapped_fields', [])
+        result['usage'] = usage
+        return result
     
     
-    async def fetch_and_map_columns_with_llm(self, file_context: List[Dict]) -> Dict[str, Any]:
+    @traced()
+    async def fetch_and_map_columns_with_llm(self, file_context: str) -> Dict[str, Any]:
         try:
-            context = f"File context: {file_context}\n"
-            
-            prompt = f"""
-            You are a smart data extraction and mapping engine.
-
-            Given the following extracted **non-tabular PDF content** (it may come from forms or documents), do the following:
-            1. Detect all potential fields (columns) and map them to appropriate database tables and columns.
-            2. Extract actual values associated with those fields.
-            3. Identify any important fields that couldn't be confidently mapped (unmapped_fields).
-
-            Context (PDF content):
-            -----------------------
-            {context}
-            -----------------------
-
-            Database Schema Reference:
-            - invoice: {self.expected_schema['invoice']}
-            - vendor: {self.expected_schema['vendor']}
-            - invoiceitem: {self.expected_schema['invoiceitem']}
-            - customer: {self.expected_schema['customer']}
-            - payment: {self.expected_schema['payment']}
-
-            Output Required:
-            Respond **only in valid JSON**. Do not include explanations.
-
-            JSON Format:
-            {{
-                "mappings": [
-                    {{
-                        "source_field": "extracted_field_name (datatype)",
-                        "target_table": "table_name",
-                        "target_column": "column_name (datatype)"
-                    }}
-                ],
-                "extracted_fields":["field1", "field2", ...],
-                "unmapped_fields": ["field1", "field2", ...],
-                "data": [
-                    {{
-                        "source_field_1": "value1",
-                        "source_field_2": "value2",
-                        ...
-                    }}
-                ]
-            }}
-
-            Guidelines:
-            - Be intelligent and flexible: the text might not be clearly tabular.
-            - Use common sense to match fields (e.g., "Inv No" → invoice_number).
-            - Extract realistic field values from the text.
-            - Give full datatype names (e.g., "String", "Integer", "DECIMAL")
-            - Ensure valid JSON format.
-            """
-
-            model = genai.GenerativeModel(model_name="gemini-2.0-flash-exp")
-            
-            response = model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.1,
-                    "max_output_tokens": 2000,
-                    "response_mime_type": "application/json"
-                }
-            )
-
-            response_text = response.text.strip() if response.text else ""
-            
-            # app_logger.info(f"Raw LLM response: {response_text}")
+            prompt = self.prompt_builder.document_prompt(str(file_context))
+            response_text, usage = await self.generate_resilient('fetch_and_map_columns', prompt)
             
             if not response_text:
                 app_logger.warning("Empty response from LLM.")
                 raise ValueError("LLM returned empty response")
 
             result = json.loads(response_text)
+            result['mappings'] = self.schema_registry.canonical_mappings(result['mappings'],
+                                                                         result.get('extracted_fields'))
+            result['usage'] = usage
             return result
 
         except Exception as e:
             app_logger.error(f"Error in LLM mapping: {str(e)}")
-            raise e
\ No newline at end of file
+            raise e
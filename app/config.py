@@ -1,3 +1,4 @@
+from typing import Dict, Literal, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -8,13 +9,143 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str
     SUPABASE_URL: str
     
+    # Applied to each engine (sync and async) separately
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 300
+    # always: ping on every checkout; idle: only connections idle longer than
+    # DB_PRE_PING_IDLE_SECONDS; never: rely on DB_POOL_RECYCLE
+    DB_PRE_PING: Literal["always", "idle", "never"] = "idle"
+    DB_PRE_PING_IDLE_SECONDS: float = 30.0
+    # PgBouncer in transaction mode: no client-side pool, no server-side prepared statement reuse
+    DB_PGBOUNCER_MODE: bool = False
+    
     UPLOAD_DIR: str = "uploads"
     CLOUD_UPLOAD_DIR: str = "cloud_uploads"
+    CLOUD_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    STORAGE_BUCKET: str = "uploaded-files"
+    LOCAL_STORAGE_EMULATOR_DIR: Optional[str] = None
+    STORAGE_CHUNK_SIZE: int = 1024 * 1024
+    STORAGE_MULTIPART_THRESHOLD: int = 6 * 1024 * 1024
+    STORAGE_MULTIPART_PART_SIZE: int = 6 * 1024 * 1024
+    STORAGE_TIMEOUT_SECONDS: float = 60.0
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  
     ALLOWED_FILE_TYPES: list = ["pdf", "docx", "csv", "tsv", "xlsx", "xls", "doc"]
+    DOCX_CONTEXT_MAX_CHARS: int = 2000
 
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "app.log"
+    LOG_FORMAT: Literal["text", "json"] = "text"
+    # Sinks write from a background thread; callers only pay for formatting and a queue put
+    LOG_ENQUEUE: bool = True
+    # Overrides LOG_LEVEL per module prefix, e.g. {"app.dao": "WARNING", "app.bao.llm_mapping_bao": "DEBUG"}
+    LOG_MODULE_LEVELS: Dict[str, str] = {}
+    # Bulk inserts log one progress line per this many rows (or LOG_PROGRESS_INTERVAL_SECONDS)
+    # instead of one per row, and only the first LOG_MAX_RECORD_ERRORS row failures in full (in the
+    # log and, with the failed record, in processinglog)
+    LOG_PROGRESS_EVERY: int = 1000
+    LOG_PROGRESS_INTERVAL_SECONDS: float = 10.0
+    LOG_MAX_RECORD_ERRORS: int = 20
+    # ProcessingLog rows are buffered per pipeline run and written with one multi-row insert at
+    # stage boundaries or once this many are pending
+    PROCESSING_LOG_BUFFER_SIZE: int = 500
+    # ERROR rows (with details) kept per upload per run; the rest are counted in one summary row. 0 = no cap
+    PROCESSING_LOG_MAX_ERRORS: int = 100
+    
+    # Admission control (per worker process). Each pipeline stage has a concurrency budget and
+    # medium/large files additionally share a budget per size class; 0 disables a budget.
+    # Requests wait at most ADMISSION_WAIT_TIMEOUT_SECONDS (503) in a queue of
+    # ADMISSION_MAX_WAITING per budget (429 beyond that), both with Retry-After
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_PROCESS_CONCURRENCY: int = 8
+    ADMISSION_CONFIRM_CONCURRENCY: int = 4
+    ADMISSION_MEDIUM_FILE_BYTES: int = 512 * 1024
+    ADMISSION_MEDIUM_CONCURRENCY: int = 4
+    ADMISSION_LARGE_FILE_BYTES: int = 5 * 1024 * 1024
+    ADMISSION_LARGE_CONCURRENCY: int = 2
+    ADMISSION_MAX_WAITING: int = 32
+    ADMISSION_WAIT_TIMEOUT_SECONDS: float = 10.0
+    ADMISSION_RETRY_AFTER_MAX_SECONDS: int = 60
+    
+    # LLM prompts (app/utils/prompt_builder.py). Budgets are in estimated prompt tokens; the mapping
+    # prompt trims document context and sample values to fit, the document prompt trims the text
+    LLM_MAPPING_PROMPT_TOKEN_BUDGET: int = 3000
+    LLM_DOCUMENT_PROMPT_TOKEN_BUDGET: int = 12000
+    LLM_SAMPLE_VALUE_MAX_CHARS: int = 80
+    LLM_MAX_OUTPUT_TOKENS: int = 2000
+    # Column profiles sent with the mapping prompt (app/utils/column_profiler.py): rows scanned,
+    # spread evenly through the file, and distinct sample values shown per column
+    PROFILE_MAX_ROWS: int = 5000
+    PROFILE_SAMPLES_PER_COLUMN: int = 3
+    # Identical concurrent mapping calls (same prompt fingerprint) share one LLM request; their result
+    # is kept for LLM_RESULT_CACHE_TTL_SECONDS in a cache of LLM_RESULT_CACHE_MAX_ENTRIES (0 disables it)
+    LLM_COALESCE_ENABLED: bool = True
+    LLM_RESULT_CACHE_TTL_SECONDS: float = 300.0
+    LLM_RESULT_CACHE_MAX_ENTRIES: int = 256
+    # Provider resilience (app/utils/llm_resilience.py): per-attempt timeout, retries with jittered
+    # exponential backoff, optional hedged requests after the LLM_HEDGE_PERCENTILE latency and a
+    # circuit breaker. While it is open, column mapping falls back to the local matcher when
+    # LLM_FALLBACK_LOCAL_MATCHER is set and fails fast with 503 otherwise
+    LLM_REQUEST_TIMEOUT_SECONDS: float = 60.0
+    LLM_MAX_ATTEMPTS: int = 3
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 8.0
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    LLM_CIRCUIT_RESET_SECONDS: float = 30.0
+    LLM_FALLBACK_LOCAL_MATCHER: bool = True
+    # Mapping memory (app/utils/mapping_memory.py): headers users confirmed before are mapped without
+    # the LLM. Confirmations lose half their weight every MAPPING_MEMORY_HALF_LIFE_DAYS; a header's
+    # best target needs MAPPING_MEMORY_MIN_SHARE of its weight
+    MAPPING_MEMORY_ENABLED: bool = True
+    MAPPING_MEMORY_REFRESH_SECONDS: float = 60.0
+    MAPPING_MEMORY_MIN_SHARE: float = 0.6
+    MAPPING_MEMORY_HALF_LIFE_DAYS: float = 30.0
+    MAPPING_MEMORY_MAX_ENTRIES: int = 50000
+    # How dates such as 03/04/2025 are read when no value in their column settles it (13/04/2025 does):
+    # DMY day-first, MDY month-first; empty fails those rows instead of guessing
+    DATE_ORDER: Literal["", "DMY", "MDY"] = ""
+    # Rows cached per upload for POST /upload/{id}/preview-mappings, and the most a preview returns
+    PREVIEW_SAMPLE_ROWS: int = 50
+    # Failed rows are kept per upload (app/utils/failed_rows.py) for POST /upload/{id}/retry-failed;
+    # longer reasons are cut to FAILED_ROW_REASON_MAX_CHARS
+    FAILED_ROW_REASON_MAX_CHARS: int = 300
+    
+    # Live progress stream (GET /upload/{id}/events)
+    PROGRESS_EVENT_EVERY: int = 100
+    SSE_HEARTBEAT_SECONDS: float = 15.0
+    SSE_SUBSCRIBER_QUEUE_SIZE: int = 100
+    
+    # On-demand request profiling (X-Profile header or POST /admin/profiling/arm); off unless enabled.
+    # Both need a matching X-Profile-Token; without PROFILING_TOKEN the X-Profile header is ignored
+    # and the admin routes answer 403
+    PROFILING_ENABLED: bool = False
+    PROFILING_TOKEN: Optional[str] = None
+    PROFILING_DIR: str = "profiles"
+    PROFILING_MAX_CONCURRENT: int = 1
+    PROFILING_SAMPLE_INTERVAL_SECONDS: float = 0.005
+    PROFILING_MAX_SECONDS: float = 300.0
+    PROFILING_MAX_PROFILES: int = 100
+    
+    # Tracing (app/utils/tracing.py): spans per request, BAO/DAO call, pipeline stage, SQL statement
+    # and LLM call, exported as OTLP/JSON to TRACING_FILE or an OTLP/HTTP collector
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: Literal["file", "otlp"] = "file"
+    TRACING_FILE: str = "traces.jsonl"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_OTLP_HEADERS: Dict[str, str] = {}
+    TRACING_OTLP_TIMEOUT_SECONDS: float = 10.0
+    TRACING_SERVICE_NAME: str = "file-parser-backend"
+    TRACING_SAMPLE_RATIO: float = 1.0
+    # Per trace and process; bulk inserts run several statements per row
+    TRACING_MAX_SPANS_PER_TRACE: int = 2000
+    TRACING_SQL_STATEMENT_MAX_CHARS: int = 1000
+    TRACING_EXPORT_BATCH_SIZE: int = 512
+    TRACING_EXPORT_INTERVAL_SECONDS: float = 2.0
+    TRACING_MAX_QUEUE_SIZE: int = 20000
     
     API_PREFIX: str = "/file-parser/api"
     DEBUG: bool = False
@@ -1,7 +1,8 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from typing import Type, TypeVar, Generic, Optional, List, Any, Dict
+from typing import Type, TypeVar, Generic, Any, Dict
 from app.utils.logger import app_logger
+from app.utils.tracing import traced
 
 T = TypeVar('T')
 
@@ -9,17 +10,18 @@ class BaseDAO(Generic[T]):
     def __init__(self, model: Type[T]):
         self.model = model
     
-    def create(self, db: Session, obj_data: Dict[str, Any]) -> T:
+    @traced()
+    async def create(self, db: AsyncSession, obj_data: Dict[str, Any]) -> T:
         try:
             db_obj = self.model(**obj_data)
             db.add(db_obj)
-            db.commit()
-            db.refresh(db_obj)
+            await db.commit()
+            await db.refresh(db_obj)
             app_logger.info("Files metadata successfully created in the database")
             return db_obj
         except SQLAlchemyError as e:
             app_logger.error(f"Error creating {self.model.__name__}: {str(e)}")
-            db.rollback()
+            await db.rollback()
             raise
     
    
\ No newline at end of file
@@ -1,111 +1,75 @@
-import logging
+from collections import Counter
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError
-from app.database.connection import Base
 from app.database.models import (
-    FileUpload, ProcessingLog, Invoice, Vendor, 
+    FileUpload, Invoice, Vendor, 
     Customer, Payment, InvoiceItem
 )
-from app.utils.logger import app_logger
+from app.dao.file_upload_dao import ProcessingLogBuffer
+from app.database.schema_registry import DATE_ORDERS, CompiledMapping, get_schema_registry
+from app.config import settings
+from app.utils.logger import app_logger, BatchProgress
+from app.utils.tracing import traced
+from app.utils.progress_events import progress_broker
+from app.utils.failed_rows import failure_reason, pack_failed_rows, unpack_failed_rows
 
 class LLMMappingProcessor:
     
     def __init__(self, db_session: Session, file_upload_id: int):
         self.db_session = db_session
         self.file_upload_id = file_upload_id
+        self.log_buffer = ProcessingLogBuffer(file_upload_id)
+        self.schema_registry = get_schema_registry()
         self.processing_stats = {
             'total_records': 0,
             'successful_records': 0,
             'failed_records': 0,
             'errors': []
         }
+        # Failed records are persisted to processinglog with their data only up to LOG_MAX_RECORD_ERRORS
+        self.logged_record_errors = 0
+        self.suppressed_record_errors = 0
     
-    def transform_data_by_mappings(self, record: Dict[str, Any], mappings: Dict) -> Dict[str, Dict[str, Any]]:
-        transformed_data = {
-            'vendor': {},
-            'customer': {},
-            'invoice': {},
-            'payment': {},
-            'invoiceitem': {}
-        }
-        
-        try:
-            for mapping in mappings['mappings']:
-                source_field = mapping['source_field']
-                target_table = mapping['target_table']
-                target_column = mapping['target_column']
-                
-                if source_field in record:
-                    value = record[source_field]
-                    transformed_data[target_table][target_column] = value
-        
-        # Nested Dictionaries
-        # transforming data 
-        # {
-        # 'vendors': {'vendor_name': 'NextGen Inc', 'email': 'orders@nextgen.com', 'phone': 9998887777, 'address': '500 Future Rd'}, 
-        # 'customers': {'customer_name': 'Alice Johnson', 'customer_email': 'alice@samplemail.com', 'customer_phone': 1231231234, 'customer_address': '789 Birch St'}, 
-        # 'invoices': {'invoice_number': 'INV101', 'issue_date': '2025-06-01', 'due_date': '2025-06-15', 'total_amount': 1800}, 
-        # 'payments': {'payment_date': '2025-06-10', 'amount_paid': 720, 'payment_method': 'PayPal'}, 'invoiceitems': {'description': 'HDMI Cable', 'quantity': 12, 'unit_price': 60, 'total_price': 720}
-        # }
-        # (record) 
-        # {'invoice_number': 'INV101', 'issue_date': '2025-06-01', 'due_date': '2025-06-15', 'total_amount': 1800, 'vendor_name': 'NextGen Inc', 'email': 'orders@nextgen.com', 'phone': 9998887777, 
-        #  'address': '500 Future Rd', 'description': 'HDMI Cable', 'quantity': 12, 'unit_price': 60, 'total_price': 720, 'customer_name': 'Alice Johnson', 'customer_email': 'alice@samplemail.com', 
-        #  'customer_phone': 1231231234, 'customer_address': '789 Birch St', 'payment_date': '2025-06-10', 'amount_paid': 720, 'payment_method': 'PayPal'}
-                    
-        except Exception as e:
-            app_logger.error(f"Error transforming record: {e}")
-            raise
-        return transformed_data
+    def transform_data_by_mappings(self, record: Dict[str, Any], mappings: List[CompiledMapping]) -> Dict[str, Dict[str, Any]]:
+        # mappings come from SchemaRegistry.compile_mappings(), once per batch
+        return self.schema_registry.transform(record, mappings)
+    
+    def insert_values(self, table: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {column: data.get(column) for column in self.schema_registry.tables[table].insert_columns}
     
     def create_vendor(self, vendor_data: Dict[str, Any]) -> int:
         try:
-            vendor = Vendor(
-                vendor_name=vendor_data.get('vendor_name'),
-                email=vendor_data.get('email'),
-                phone=vendor_data.get('phone'),
-                address=vendor_data.get('address'),
-                file_upload_id=self.file_upload_id
-            )
+            vendor = Vendor(**self.insert_values('vendor', vendor_data), file_upload_id=self.file_upload_id)
             
             self.db_session.add(vendor)
             self.db_session.flush() 
             
-            app_logger.info(f"Created vendor: {vendor.vendor_name} with ID: {vendor.vendor_id}")
+            app_logger.debug(f"Created vendor: {vendor.vendor_name} with ID: {vendor.vendor_id}")
             return vendor.vendor_id
             
         except Exception as e:
-            app_logger.error(f"Error creating vendor: {e}")
+            app_logger.debug(f"Error creating vendor: {e}")
             raise
     
     def create_customer(self, customer_data: Dict[str, Any]) -> int:
         try:
-            customer = Customer(
-                customer_name=customer_data.get('customer_name'),
-                customer_email=customer_data.get('customer_email'),
-                customer_phone=customer_data.get('customer_phone'),
-                customer_address=customer_data.get('customer_address'),
-                file_upload_id=self.file_upload_id
-            )
+            customer = Customer(**self.insert_values('customer', customer_data), file_upload_id=self.file_upload_id)
             
             self.db_session.add(customer)
             self.db_session.flush()
             
-            app_logger.info(f"Created customer: {customer.customer_name} with ID: {customer.customer_id}")
+            app_logger.debug(f"Created customer: {customer.customer_name} with ID: {customer.customer_id}")
             return customer.customer_id
             
         except Exception as e:
-            app_logger.error(f"Error creating customer: {e}")
+            app_logger.debug(f"Error creating customer: {e}")
             raise
     
     def create_invoice(self, invoice_data: Dict[str, Any], vendor_id: int, customer_id: int) -> int:
         try:
             invoice = Invoice(
-                invoice_number=invoice_data.get('invoice_number'),
-                issue_date=invoice_data.get('issue_date'),
-                due_date=invoice_data.get('due_date'),
-                total_amount=invoice_data.get('total_amount'),
+                **self.insert_values('invoice', invoice_data),
                 vendor_id=vendor_id,
                 customer_id=customer_id,
                 file_upload_id=self.file_upload_id
@@ -114,62 +78,61 @@ class LLMMappingProcessor:
             self.db_session.add(invoice)
             self.db_session.flush()
             
-            app_logger.info(f"Created invoice: {invoice.invoice_number} with ID: {invoice.invoice_id}")
+            app_logger.debug(f"Created invoice: {invoice.invoice_number} with ID: {invoice.invoice_id}")
             return invoice.invoice_id
             
         except Exception as e:
-            app_logger.error(f"Error creating invoice: {e}")
+            app_logger.debug(f"Error creating invoice: {e}")
             raise
     
     def create_invoice_item(self, item_data: Dict[str, Any], invoice_id: int) -> None:
         try:
             invoice_item = InvoiceItem(
+                **self.insert_values('invoiceitem', item_data),
                 invoice_id=invoice_id,
-                description=item_data.get('description'),
-                quantity=item_data.get('quantity'),
-                unit_price=item_data.get('unit_price'),
-                total_price=item_data.get('total_price'),
                 file_upload_id=self.file_upload_id
             )
             
             self.db_session.add(invoice_item)
-            app_logger.info(f"Created invoice item: {item_data.get('description')}")
+            app_logger.debug(f"Created invoice item: {item_data.get('description')}")
             
         except Exception as e:
-            app_logger.error(f"Error creating invoice item: {e}")
+            app_logger.debug(f"Error creating invoice item: {e}")
             raise
     
     def create_payment(self, payment_data: Dict[str, Any], invoice_id: int) -> None:
         try:
             payment = Payment(
+                **self.insert_values('payment', payment_data),
                 invoice_id=invoice_id,
-                payment_date=payment_data.get('payment_date'),
-                amount_paid=payment_data.get('amount_paid'),
-                payment_method=payment_data.get('payment_method'),
                 file_upload_id=self.file_upload_id
             )
             
             self.db_session.add(payment)
-            app_logger.info(f"Created payment: {payment_data.get('payment_method')} - {payment_data.get('amount_paid')}")
+            app_logger.debug(f"Created payment: {payment_data.get('payment_method')} - {payment_data.get('amount_paid')}")
             
         except Exception as e:
-            app_logger.error(f"Error creating payment: {e}")
+            app_logger.debug(f"Error creating payment: {e}")
             raise
     
     def log_processing_event(self, level: str, message: str, details: Dict = None):
+        # Buffered outside the session so a failed record's rollback does not discard its log row
         try:
-            log_entry = ProcessingLog(
-                file_upload_id=self.file_upload_id,
-                log_level=level,
-                message=message,
-                details=details
-            )
-            self.db_session.add(log_entry)
-            
+            self.log_buffer.add(level, message, details)
         except Exception as e:
             app_logger.error(f"Error logging to database: {e}")
     
-    def process_single_record(self, record: Dict[str, Any], mappings: Dict) -> bool:
+    def flush_logs(self, final: bool = False):
+        # Between records only the log insert is pending, so it gets its own commit
+        try:
+            if self.log_buffer.flush_sync(self.db_session, final):
+                self.db_session.commit()
+        except Exception as e:
+            app_logger.error(f"Error writing processing logs: {e}")
+            self.db_session.rollback()
+    
+    def process_single_record(self, record: Dict[str, Any], mappings: List[CompiledMapping]) -> Optional[str]:
+        # None once the record is loaded, else the reason it failed (see failure_reason)
         try:
             transformed_data = self.transform_data_by_mappings(record, mappings)
             vendor_id = self.create_vendor(transformed_data['vendor'])
@@ -180,19 +143,44 @@ class LLMMappingProcessor:
             if transformed_data['payment']:
                 self.create_payment(transformed_data['payment'], invoice_id)
             
-            return True
+            return None
             
         except Exception as e:
             error_msg = f"Failed to process record {record.get('invoice_number', 'Unknown')}: {str(e)}"
-            app_logger.error(error_msg)
             self.processing_stats['errors'].append(error_msg)
-            self.log_processing_event('ERROR', error_msg, {'record': record})
-            return False
+            if self.logged_record_errors < settings.LOG_MAX_RECORD_ERRORS:
+                self.logged_record_errors += 1
+                self.log_processing_event('ERROR', error_msg, {'record': record})
+            else:
+                self.suppressed_record_errors += 1
+            return failure_reason(e)
+    
+    def publish_progress(self, processed: int):
+        progress_broker.publish(
+            self.file_upload_id, 'progress',
+            processed=processed,
+            total=self.processing_stats['total_records'],
+            successful=self.processing_stats['successful_records'],
+            failed=self.processing_stats['failed_records']
+        )
     
-    def process_batch(self, file_content: List[Dict[str, Any]], mappings: Dict) -> Dict[str, int]:
-        app_logger.info(f"Starting batch processing of {len(file_content)} records")
+    @traced()
+    def process_batch(self, file_content: List[Dict[str, Any]], mappings: Dict,
+                      row_indices: Optional[List[int]] = None) -> Dict[str, int]:
+        # row_indices: retry of earlier failed rows, file_content[i] being extracted row row_indices[i].
+        # Their outcome is merged into the upload's counts and failed rows instead of replacing them
+        retry = row_indices is not None
+        app_logger.info(f"Starting batch processing of {len(file_content)} records" + (" (retry)" if retry else ""))
         
         self.processing_stats['total_records'] = len(file_content)
+        date_orders = self.schema_registry.date_orders(mappings['mappings'], file_content)
+        compiled_mappings, rejected = self.schema_registry.compile_mappings(mappings['mappings'], date_orders)
+        if rejected:
+            self.log_processing_event('WARNING', f"Ignoring {len(rejected)} mappings to unknown targets",
+                                      {'mappings': rejected})
+        for source_field, (order, evidence) in date_orders.items():
+            self.log_processing_event('INFO', f"Dates in {source_field} are read {DATE_ORDERS[order]}, as {evidence!r} shows",
+                                      {'source_field': source_field, 'date_order': order})
         
         file_upload = self.db_session.query(FileUpload).filter(
             FileUpload.file_upload_id == self.file_upload_id
@@ -201,34 +189,65 @@ class LLMMappingProcessor:
         if file_upload:
             file_upload.processing_status = 'Processing'
             file_upload.processing_started_at = datetime.now()
-            file_upload.total_records_found = len(file_content)
+            if not retry:
+                file_upload.total_records_found = len(file_content)
         
+        failures: Dict[int, str] = {}
+        # One aggregated progress line per LOG_PROGRESS_EVERY rows instead of several lines per row
+        progress = BatchProgress(f"Upload {self.file_upload_id}", len(file_content))
         try:
             for idx, record in enumerate(file_content, 1):
-                app_logger.info(f"Processing record {idx}/{len(file_content)}")
-                
+                row_index = row_indices[idx - 1] if retry else idx - 1
                 try:
-                    success = self.process_single_record(record, mappings)
-                    if success:
+                    reason = self.process_single_record(record, compiled_mappings)
+                    if reason is None:
                         self.processing_stats['successful_records'] += 1
                         self.db_session.commit()
-                        app_logger.info(f"Successfully processed and committed record {idx}")
+                        progress.record(True)
                     else:
                         self.processing_stats['failed_records'] += 1
                         self.db_session.rollback()
+                        failures[row_index] = reason
+                        progress.record(False, self.processing_stats['errors'][-1])
                         
                 except Exception as e:
-                    app_logger.error(f"Error processing record {idx}: {e}")
                     self.processing_stats['failed_records'] += 1
                     self.db_session.rollback()
+                    failures[row_index] = failure_reason(e)
+                    progress.record(False, f"Error processing record {idx}: {e}")
+                
+                if self.log_buffer.full:
+                    self.flush_logs()
+                if idx % settings.PROGRESS_EVENT_EVERY == 0 or idx == len(file_content):
+                    self.publish_progress(idx)
+            progress.finish()
+            if self.suppressed_record_errors:
+                self.log_processing_event(
+                    'WARNING',
+                    f"{self.suppressed_record_errors} further record failures not logged in full "
+                    f"(LOG_MAX_RECORD_ERRORS={settings.LOG_MAX_RECORD_ERRORS})",
+                    {'reasons': dict(Counter(failures.values()).most_common(settings.LOG_MAX_RECORD_ERRORS))}
+                )
+            self.flush_logs(final=True)
             
             if file_upload:
                 file_upload.processing_status = 'Completed'
                 file_upload.processing_completed_at = datetime.now()
-                file_upload.successful_records = self.processing_stats['successful_records']
-                file_upload.failed_records = self.processing_stats['failed_records']
+                if retry:
+                    remaining = unpack_failed_rows(file_upload.failed_rows)
+                    for row_index in row_indices:
+                        remaining.pop(row_index, None)
+                    remaining.update(failures)
+                    file_upload.successful_records = (file_upload.successful_records or 0) + self.processing_stats['successful_records']
+                else:
+                    remaining = failures
+                    file_upload.successful_records = self.processing_stats['successful_records']
+                file_upload.failed_records = len(remaining)
+                file_upload.failed_rows = pack_failed_rows(remaining)
                 if self.processing_stats['errors']:
                     file_upload.error_summary = '; '.join(self.processing_stats['errors'][:5])
+                elif retry and not remaining:
+                    file_upload.error_summary = None
                 
                 self.db_session.commit()
             
@@ -239,6 +258,7 @@ class LLMMappingProcessor:
             app_logger.error(f"Critical error during batch processing: {e}")
             self.db_session.rollback()
             
+            self.flush_logs(final=True)
             if file_upload:
                 file_upload.processing_status = 'Failed'
                 file_upload.error_summary = str(e)
@@ -249,12 +269,13 @@ class LLMMappingProcessor:
         return self.processing_stats
 
 
-def main(file_content: List[Dict[str, Any]], mappings: Dict, file_upload_id: int, db_session: Session):
+def main(file_content: List[Dict[str, Any]], mappings: Dict, file_upload_id: int, db_session: Session,
+         row_indices: Optional[List[int]] = None):
     try:
         app_logger.info("Starting LLM mapping database integration process")
         processor = LLMMappingProcessor(db_session, file_upload_id)
         
-        stats = processor.process_batch(file_content, mappings)
+        stats = processor.process_batch(file_content, mappings, row_indices)
         
         app_logger.info("Processing completed successfully")
         app_logger.info(f"Total records: {stats['total_records']}")
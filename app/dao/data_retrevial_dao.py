@@ -1,37 +1,41 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database.models import Invoice, InvoiceItem, Vendor, Customer, Payment
-from app.database.connection import get_db
+from app.database.connection import AsyncSessionLocal
 from app.utils.logger import app_logger
+from app.utils.tracing import traced
 class DataRetrivalDAO:
     def __init__(self):
         pass
     
-    async def get_all_data_by_file_id(self, session: Session, file_upload_id: int):
+    @traced(record_args=('file_upload_id',))
+    async def get_all_data_by_file_id(self, session: AsyncSession, file_upload_id: int):
         try:
             if session is None:
-                session = next(get_db())
+                async with AsyncSessionLocal() as session:
+                    return await self.get_all_data_by_file_id(session, file_upload_id)
 
             app_logger.info(f"Retrieving data for file_upload_id: {file_upload_id}")
             
-            vendors = session.query(Vendor).filter(
+            vendors = (await session.execute(select(Vendor).filter(
                 Vendor.file_upload_id == file_upload_id
-            ).all()
+            ).order_by(Vendor.vendor_id))).scalars().all()
             
-            customers = session.query(Customer).filter(
+            customers = (await session.execute(select(Customer).filter(
                 Customer.file_upload_id == file_upload_id
-            ).all()
+            ).order_by(Customer.customer_id))).scalars().all()
             
-            invoices = session.query(Invoice).filter(
+            invoices = (await session.execute(select(Invoice).filter(
                 Invoice.file_upload_id == file_upload_id
-            ).all()
+            ).order_by(Invoice.invoice_id))).scalars().all()
             
-            payments = session.query(Payment).filter(
+            payments = (await session.execute(select(Payment).filter(
                 Payment.file_upload_id == file_upload_id
-            ).all()
+            ).order_by(Payment.payment_id))).scalars().all()
           
-            invoice_items = session.query(InvoiceItem).filter(
+            invoice_items = (await session.execute(select(InvoiceItem).filter(
                 InvoiceItem.file_upload_id == file_upload_id
-            ).all()
+            ).order_by(InvoiceItem.item_id))).scalars().all()
             
             app_logger.info(f"Retrieved {len(invoices)} invoices, {len(vendors)} vendors, "
                            f"{len(customers)} customers, {len(payments)} payments, "
@@ -1,45 +1,79 @@
+import math
+from datetime import datetime
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from typing import Optional, List
-from app.database.models import FileUpload, ProcessingLog
+from typing import Any, Dict, Optional, List
+from app.config import settings
+from app.database.models import FileUpload, ProcessingLog, LLMDataCache
 from app.dao.base_dao import BaseDAO
+from app.utils.failed_rows import unpack_failed_rows
+from app.utils.progress_events import progress_broker
 from app.utils.logger import app_logger
+from app.utils.tracing import traced
 
 class FileUploadDAO(BaseDAO[FileUpload]):
     def __init__(self):
         super().__init__(FileUpload)
-    
-    def get_by_id(self, db: Session, file_upload_id: int) -> Optional[FileUpload]:
+
+    @traced(record_args=('file_upload_id',))
+    async def get_by_id(self, db: AsyncSession, file_upload_id: int) -> Optional[FileUpload]:
         try:
-            return db.query(FileUpload).filter(FileUpload.file_upload_id == file_upload_id).first()
+            result = await db.execute(select(FileUpload).filter(FileUpload.file_upload_id == file_upload_id))
+            return result.scalars().first()
         except SQLAlchemyError as e:
             app_logger.error(f"Error getting file upload by ID {file_upload_id}: {str(e)}")
             raise
-    
-    def update_processing_status(self, db: Session, file_upload_id: int, status: str, 
-                               error_summary: Optional[str] = None) -> Optional[FileUpload]:
+
+    @traced(record_args=('file_upload_id', 'status'))
+    async def update_processing_status(self, db: AsyncSession, file_upload_id: int, status: str,
+                                       error_summary: Optional[str] = None) -> Optional[FileUpload]:
         try:
-            file_upload = self.get_by_id(db, file_upload_id)
+            file_upload = await self.get_by_id(db, file_upload_id)
             if file_upload:
                 file_upload.processing_status = status
                 if error_summary:
                     file_upload.error_summary = error_summary
-                db.commit()
-                db.refresh(file_upload)
+                await db.commit()
+                await db.refresh(file_upload)
                 app_logger.info(f"Updated file upload {file_upload_id} status to {status}")
+                progress_broker.publish(file_upload_id, 'status', status=status, error_summary=file_upload.error_summary)
             return file_upload
         except SQLAlchemyError as e:
             app_logger.error(f"Error updating file upload status: {str(e)}")
-            db.rollback()
+            await db.rollback()
             raise
-        
-    def add_unmapped_columns(self, db: Session, file_upload_id: int, unmapped_columns: dict) -> Optional[FileUpload]:
+
+    @traced(record_args=('file_upload_id',))
+    async def claim_for_processing(self, db: AsyncSession, file_upload_id: int) -> bool:
+        # Moves the upload to Processing unless it already is, in one conditional UPDATE, so of two
+        # concurrent requests only one gets it
         try:
-            file_upload = self.get_by_id(db, file_upload_id)
+            result = await db.execute(
+                update(FileUpload)
+                .where(FileUpload.file_upload_id == file_upload_id,
+                       (FileUpload.processing_status != 'Processing') | FileUpload.processing_status.is_(None))
+                .values(processing_status='Processing')
+            )
+            await db.commit()
+        except SQLAlchemyError as e:
+            app_logger.error(f"Error claiming file upload {file_upload_id}: {str(e)}")
+            await db.rollback()
+            raise
+        if result.rowcount != 1:
+            return False
+        progress_broker.publish(file_upload_id, 'status', status='Processing', error_summary=None)
+        return True
+
+    @traced(record_args=('file_upload_id',))
+    async def add_unmapped_columns(self, db: AsyncSession, file_upload_id: int, unmapped_columns: dict) -> Optional[FileUpload]:
+        try:
+            file_upload = await self.get_by_id(db, file_upload_id)
             if file_upload:
                 file_upload.unmapped_columns = unmapped_columns
-                db.commit()
-                db.refresh(file_upload)
+                await db.commit()
+                await db.refresh(file_upload)
                 app_logger.info(f"Added unmapped columns for file_upload_id {file_upload_id}")
                 return file_upload
             else:
@@ -47,23 +81,87 @@ class FileUploadDAO(BaseDAO[FileUpload]):
                 return None
         except SQLAlchemyError as e:
             app_logger.error(f"Error adding unmapped columns for file_upload_id {file_upload_id}: {str(e)}")
-            db.rollback()
+            await db.rollback()
             raise
-    
-    def get_all_with_stats(self, db: Session, skip: int = 0, limit: int = 100) -> List[FileUpload]:
+
+    @traced()
+    async def get_reusable_by_content_hash(self, db: AsyncSession, content_hash: str, file_type: str,
+                                           exclude_id: int) -> Optional[FileUpload]:
         try:
-            return db.query(FileUpload).offset(skip).limit(limit).all()
+            result = await db.execute(select(FileUpload).join(
+                LLMDataCache, LLMDataCache.file_upload_id == FileUpload.file_upload_id
+            ).filter(
+                FileUpload.content_hash == content_hash,
+                FileUpload.file_type == file_type,
+                FileUpload.file_upload_id != exclude_id,
+                LLMDataCache.mappings.isnot(None)
+            ).order_by(FileUpload.file_upload_id.desc()).limit(1))
+            return result.scalars().first()
+        except SQLAlchemyError as e:
+            app_logger.error(f"Error looking up upload by content hash {content_hash}: {str(e)}")
+            raise
+
+    @traced(record_args=('file_upload_id',))
+    async def link_to_previous_upload(self, db: AsyncSession, file_upload_id: int, previous: FileUpload) -> Optional[FileUpload]:
+        try:
+            file_upload = await self.get_by_id(db, file_upload_id)
+            if file_upload:
+                file_upload.reused_from_upload_id = previous.file_upload_id
+                file_upload.unmapped_columns = previous.unmapped_columns
+                await db.commit()
+                await db.refresh(file_upload)
+                app_logger.info(f"Linked file upload {file_upload_id} to identical upload {previous.file_upload_id}")
+            return file_upload
+        except SQLAlchemyError as e:
+            app_logger.error(f"Error linking file upload {file_upload_id}: {str(e)}")
+            await db.rollback()
+            raise
+
+    @traced(record_args=('file_upload_id',))
+    async def add_llm_usage(self, db: AsyncSession, file_upload_id: int, prompt_tokens: int,
+                            completion_tokens: int) -> None:
+        # Accumulates, so re-running the mapping for an upload adds to its total
+        try:
+            await db.execute(update(FileUpload).where(FileUpload.file_upload_id == file_upload_id).values(
+                llm_prompt_tokens=func.coalesce(FileUpload.llm_prompt_tokens, 0) + prompt_tokens,
+                llm_completion_tokens=func.coalesce(FileUpload.llm_completion_tokens, 0) + completion_tokens
+            ))
+            await db.commit()
+        except SQLAlchemyError as e:
+            app_logger.error(f"Error recording LLM token usage for file_upload_id {file_upload_id}: {str(e)}")
+            await db.rollback()
+            raise
+
+    @traced(record_args=('file_upload_id',))
+    async def get_failed_rows(self, db: AsyncSession, file_upload_id: int) -> Dict[int, str]:
+        # Reads only the deferred failed_rows column: row index -> reason
+        try:
+            result = await db.execute(
+                select(FileUpload.failed_rows).filter(FileUpload.file_upload_id == file_upload_id)
+            )
+            return unpack_failed_rows(result.scalar())
+        except SQLAlchemyError as e:
+            app_logger.error(f"Error getting failed rows for file_upload_id {file_upload_id}: {str(e)}")
+            raise
+
+    @traced()
+    async def get_all_with_stats(self, db: AsyncSession, skip: int = 0, limit: int = 100) -> List[FileUpload]:
+        try:
+            result = await db.execute(select(FileUpload).order_by(
+                FileUpload.upload_timestamp.desc()
+            ).offset(skip).limit(limit))
+            return list(result.scalars().all())
         except SQLAlchemyError as e:
             app_logger.error(f"Error getting file uploads with stats: {str(e)}")
             raise
-    
+
 
 class ProcessingLogDAO(BaseDAO[ProcessingLog]):
     def __init__(self):
         super().__init__(ProcessingLog)
-    
-    def create_log(self, db: Session, file_upload_id: int, level: str, 
-                   message: str, details: Optional[dict] = None) -> ProcessingLog:
+
+    async def create_log(self, db: AsyncSession, file_upload_id: int, level: str,
+                         message: str, details: Optional[dict] = None) -> ProcessingLog:
         try:
             log_data = {
                 'file_upload_id': file_upload_id,
@@ -71,9 +169,91 @@ class ProcessingLogDAO(BaseDAO[ProcessingLog]):
                 'message': message,
                 'details': details
             }
-            return self.create(db, log_data)
+            return await self.create(db, log_data)
         except SQLAlchemyError as e:
             app_logger.error(f"Error creating processing log: {str(e)}")
             raise
-    
-    
+
+    @traced()
+    async def create_logs(self, db: AsyncSession, rows: List[Dict[str, Any]]) -> int:
+        # One multi-row INSERT and one commit for the whole batch
+        if not rows:
+            return 0
+        try:
+            await db.execute(insert(ProcessingLog), rows)
+            await db.commit()
+            return len(rows)
+        except SQLAlchemyError as e:
+            app_logger.error(f"Error creating {len(rows)} processing logs: {str(e)}")
+            await db.rollback()
+            raise
+
+
+def json_safe(value: Any) -> Any:
+    # Record details come straight from pandas rows: numpy scalars, NaN, Timestamps
+    if value is None or isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {str(key): json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    if hasattr(value, 'item'):
+        return json_safe(value.item())
+    return str(value)
+
+
+class ProcessingLogBuffer:
+    # Collects the ProcessingLog events of one pipeline run for one upload. Events keep the time
+    # they were added; flush() writes everything pending with a single insert
+    def __init__(self, file_upload_id: int, max_pending: Optional[int] = None, max_errors: Optional[int] = None):
+        self.file_upload_id = file_upload_id
+        self.max_pending = max_pending or settings.PROCESSING_LOG_BUFFER_SIZE
+        self.max_errors = settings.PROCESSING_LOG_MAX_ERRORS if max_errors is None else max_errors
+        self.pending: List[Dict[str, Any]] = []
+        self.errors = 0
+        self.dropped_errors = 0
+        self.dao = ProcessingLogDAO()
+
+    def add(self, level: str, message: str, details: Optional[dict] = None):
+        if level == "ERROR":
+            self.errors += 1
+            if self.max_errors and self.errors > self.max_errors:
+                self.dropped_errors += 1
+                return
+        self.pending.append({
+            'file_upload_id': self.file_upload_id,
+            'log_level': level,
+            'message': message,
+            'details': json_safe(details),
+            'timestamp': datetime.now()
+        })
+
+    @property
+    def full(self) -> bool:
+        return len(self.pending) >= self.max_pending
+
+    def drain(self, final: bool = False) -> List[Dict[str, Any]]:
+        if final and self.dropped_errors:
+            self.pending.append({
+                'file_upload_id': self.file_upload_id,
+                'log_level': "WARNING",
+                'message': f"{self.dropped_errors} further errors not recorded "
+                           f"(PROCESSING_LOG_MAX_ERRORS={self.max_errors})",
+                'details': {'dropped_errors': self.dropped_errors},
+                'timestamp': datetime.now()
+            })
+            self.dropped_errors = 0
+        rows, self.pending = self.pending, []
+        return rows
+
+    async def flush(self, db: AsyncSession, final: bool = False) -> int:
+        return await self.dao.create_logs(db, self.drain(final))
+
+    def flush_sync(self, db_session: Session, final: bool = False) -> int:
+        # For the row-by-row loader on the sync engine; the caller commits
+        rows = self.drain(final)
+        if rows:
+            db_session.execute(insert(ProcessingLog), rows)
+        return len(rows)
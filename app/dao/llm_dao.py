@@ -1,27 +1,67 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from app.database.models import LLMDataCache
 from app.utils.logger import app_logger
+from app.utils.tracing import traced
 from app.dao.base_dao import BaseDAO
+from app.dao.file_upload_dao import json_safe
 
 class LLMExtractedDataDAO(BaseDAO[LLMDataCache]):
   def __init__(self):
     super().__init__(LLMDataCache)
   
-  def insert_data(self, db: Session, file_upload_id: int, data: dict, extracted_fields: dict):
+  @traced(record_args=('file_upload_id',))
+  async def insert_data(self, db: AsyncSession, file_upload_id: int, data: dict, extracted_fields: dict, mappings: list = None,
+                        sample_rows: list = None):
+    sample_rows = json_safe(sample_rows)
     try:
+      existing = await self.get_data_by_id(db, file_upload_id)
+      if existing:
+        # One cache row per upload; reprocessing replaces it
+        existing.data = data
+        existing.extracted_fields = extracted_fields
+        existing.mappings = mappings
+        existing.sample_rows = sample_rows
+        await db.commit()
+        await db.refresh(existing)
+        return existing
+      
       extracted_data = {
         'file_upload_id': file_upload_id,
         'data':data,
-        'extracted_fields':extracted_fields
+        'extracted_fields':extracted_fields,
+        'mappings': mappings,
+        'sample_rows': sample_rows
       }
       app_logger.info(f"Successfully stored LLM extracted data for file_id: {file_upload_id}")
-      return self.create(db, extracted_data)
+      return await self.create(db, extracted_data)
     except SQLAlchemyError as e:
       app_logger.error(f"Error while storing LLM extracted data for file_id {file_upload_id}: {str(e)}")
       
-  def get_data_by_id(self, db: Session, file_upload_id: int):
+  @traced(record_args=('file_upload_id',))
+  async def copy_to_upload(self, db: AsyncSession, source: LLMDataCache, file_upload_id: int):
+    # Uploads of identical content start from the same extraction but confirm their own mappings,
+    # so each gets its own row rather than sharing the source upload's
+    return await self.insert_data(db, file_upload_id, source.data, source.extracted_fields, source.mappings,
+                                  source.sample_rows)
+      
+  @traced(record_args=('file_upload_id',))
+  async def get_data_by_id(self, db: AsyncSession, file_upload_id: int):
+    try:
+      result = await db.execute(select(LLMDataCache).filter(LLMDataCache.file_upload_id == file_upload_id))
+      return result.scalars().first()
+    except SQLAlchemyError as e:
+      app_logger.error(f"Error while retrieving LLM extracted data for file_id {file_upload_id}: {str(e)}")
+      
+  @traced(record_args=('file_upload_id',))
+  async def update_mappings(self, db: AsyncSession, file_upload_id: int, mappings: list):
     try:
-      return db.query(LLMDataCache).filter(LLMDataCache.file_upload_id == file_upload_id).first()
+      llm_cache = await self.get_data_by_id(db, file_upload_id)
+      if llm_cache:
+        llm_cache.mappings = mappings
+        await db.commit()
+      return llm_cache
     except SQLAlchemyError as e:
-      app_logger.error(f"Error while retrieving LLM extracted data for file_id {file_upload_id}: {str(e)}")
\ No newline at end of file
+      app_logger.error(f"Error while updating mappings for file_id {file_upload_id}: {str(e)}")
+      await db.rollback()
@@ -0,0 +1,68 @@
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app.config import settings
+from app.database.models import MappingMemory
+from app.dao.base_dao import BaseDAO
+from app.utils.logger import app_logger
+from app.utils.mapping_memory import source_key, strip_type
+from app.utils.tracing import traced
+
+
+class MappingMemoryDAO(BaseDAO[MappingMemory]):
+    def __init__(self):
+        super().__init__(MappingMemory)
+
+    @traced()
+    async def load_entries(self, db: AsyncSession) -> List[Tuple[str, str, str, int, datetime]]:
+        try:
+            result = await db.execute(
+                select(MappingMemory.source_key, MappingMemory.target_table, MappingMemory.target_column,
+                       MappingMemory.confirmed_count, MappingMemory.last_confirmed_at)
+                .order_by(MappingMemory.last_confirmed_at.desc())
+                .limit(settings.MAPPING_MEMORY_MAX_ENTRIES)
+            )
+            return [tuple(row) for row in result.all()]
+        except SQLAlchemyError as e:
+            app_logger.error(f"Error loading mapping memory: {str(e)}")
+            raise
+
+    @traced()
+    async def record_confirmations(self, db: AsyncSession, mappings: List[Dict[str, Any]], when: datetime) -> int:
+        # One increment per (header, target); a header and target seen for the first time is inserted.
+        # A concurrent insert of the same row loses on the unique index and becomes an increment
+        recorded = 0
+        try:
+            for mapping in mappings:
+                key = source_key(mapping['source_field'])
+                table, column = strip_type(mapping['target_table']), strip_type(mapping['target_column'])
+                if not key or not table or not column:
+                    continue
+                for attempt in range(2):
+                    result = await db.execute(
+                        update(MappingMemory)
+                        .where(MappingMemory.source_key == key, MappingMemory.target_table == table,
+                               MappingMemory.target_column == column)
+                        .values(confirmed_count=MappingMemory.confirmed_count + 1, last_confirmed_at=when)
+                    )
+                    if result.rowcount:
+                        break
+                    try:
+                        async with db.begin_nested():
+                            await db.execute(insert(MappingMemory).values(
+                                source_key=key, target_table=table, target_column=column,
+                                confirmed_count=1, last_confirmed_at=when
+                            ))
+                        break
+                    except IntegrityError:
+                        if attempt:
+                            raise
+                recorded += 1
+            await db.commit()
+            return recorded
+        except SQLAlchemyError as e:
+            app_logger.error(f"Error recording confirmed mappings: {str(e)}")
+            await db.rollback()
+            raise
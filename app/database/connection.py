@@ -1,18 +1,47 @@
+from fastapi import HTTPException
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 from app.config import settings
+from app.database.pool import engine_options, instrument_engine
 from app.utils.logger import app_logger
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    echo=settings.DEBUG
+# Sync engine: Alembic, the schema check and the bulk loaders in data_inserting_dao,
+# which run in worker threads so they never hold the event loop
+engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
+instrument_engine(engine, 'sync')
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+def to_async_url(database_url: str):
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database backend '{backend}'")
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+
+    # asyncpg takes "ssl" rather than libpq's "sslmode"
+    if backend in ('postgresql', 'postgres') and 'sslmode' in url.query:
+        sslmode = url.query['sslmode']
+        url = url.difference_update_query(['sslmode']).update_query_dict({'ssl': sslmode})
+    return url
+
+# Async engine: everything on the request path
+async_engine = create_async_engine(
+    to_async_url(settings.DATABASE_URL),
+    **engine_options(settings.DATABASE_URL, is_async=True)
 )
+instrument_engine(async_engine.sync_engine, 'async')
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 def get_db() -> Session:
@@ -38,3 +67,27 @@ def get_db_session():
         raise
     finally:
         db.close()
+
+async def get_async_db() -> AsyncSession:
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except HTTPException:
+            # Request-level refusals (404s, admission 429/503s) are not database errors
+            await db.rollback()
+            raise
+        except Exception as e:
+            app_logger.error(f"Database session error: {str(e)}")
+            await db.rollback()
+            raise
+
+@asynccontextmanager
+async def get_async_db_session():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception as e:
+            app_logger.error(f"Database transaction error: {str(e)}")
+            await db.rollback()
+            raise
@@ -1,11 +1,24 @@
-from sqlalchemy import Column, Integer, String, Text, DECIMAL, DATE, JSON, TIMESTAMP, ForeignKey, BIGINT
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DECIMAL, DATE, JSON, TIMESTAMP, ForeignKey, BIGINT, Index, text
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from app.database.connection import Base
 
+ACTIVE_STATUS_FILTER = text("processing_status IN ('Pending', 'Processing')")
+HAS_CONTENT_HASH_FILTER = text("content_hash IS NOT NULL")
+
 class FileUpload(Base):
     __tablename__ = "fileupload"
+    __table_args__ = (
+        # Dashboard lists the most recent uploads (whole rows): a backward scan stops after LIMIT rows
+        Index('ix_fileupload_recent', 'upload_timestamp'),
+        # Uploads still in flight are a small, hot subset of the table
+        Index('ix_fileupload_active_status', 'processing_status', 'processing_started_at',
+              postgresql_where=ACTIVE_STATUS_FILTER, sqlite_where=ACTIVE_STATUS_FILTER),
+        # Dedup lookup by content hash and file type
+        Index('ix_fileupload_content_hash_type', 'content_hash', 'file_type',
+              postgresql_where=HAS_CONTENT_HASH_FILTER, sqlite_where=HAS_CONTENT_HASH_FILTER),
+    )
 
     file_upload_id = Column(Integer, primary_key=True, autoincrement=True)
     original_filename = Column(String(255), nullable=False)
@@ -22,6 +35,14 @@ class FileUpload(Base):
     failed_records = Column(Integer, default=0)
     error_summary = Column(Text)
     unmapped_columns = Column(JSON, nullable=True)
+    content_hash = Column(String(64))
+    reused_from_upload_id = Column(Integer, ForeignKey('fileupload.file_upload_id'), nullable=True)
+    # Tokens spent on LLM calls for this upload (provider counts, or estimates when not reported)
+    llm_prompt_tokens = Column(Integer, nullable=True)
+    llm_completion_tokens = Column(Integer, nullable=True)
+    # Index and reason of each row the last insert could not load, packed by app/utils/failed_rows.py.
+    # Deferred: only the retry path reads it
+    failed_rows = deferred(Column(JSON, nullable=True))
 
     processing_logs = relationship("ProcessingLog", back_populates="file_upload")
     invoices = relationship("Invoice", back_populates="file_upload")
@@ -33,14 +54,23 @@ class FileUpload(Base):
 
 class LLMDataCache(Base):
     __tablename__= "llm_data_cache"
+    __table_args__ = (
+        Index('uq_llm_data_cache_file_upload_id', 'file_upload_id', unique=True),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     file_upload_id = Column(Integer, ForeignKey('fileupload.file_upload_id'), nullable=False)
     data = Column(JSON)
     extracted_fields = Column(JSON)
+    mappings = Column(JSON)
+    # First PREVIEW_SAMPLE_ROWS extracted rows of a tabular file, for mapping previews
+    sample_rows = Column(JSON)
     
     file_upload = relationship("FileUpload", back_populates="llm_data_caches")
 class ProcessingLog(Base):
     __tablename__ = "processinglog"
+    __table_args__ = (
+        Index('ix_processinglog_upload_timestamp', 'file_upload_id', 'timestamp'),
+    )
 
     log_id = Column(Integer, primary_key=True, autoincrement=True)
     file_upload_id = Column(Integer, ForeignKey('fileupload.file_upload_id'), nullable=False)
@@ -54,14 +84,17 @@ class ProcessingLog(Base):
 
 class Invoice(Base):
     __tablename__ = "invoice"
+    __table_args__ = (
+        Index('ix_invoice_upload_invoice', 'file_upload_id', 'invoice_id'),
+    )
 
     invoice_id = Column(Integer, primary_key=True, autoincrement=True)
     invoice_number = Column(String)
     issue_date = Column(DATE)
     due_date = Column(DATE)
     total_amount = Column(DECIMAL)
-    vendor_id = Column(Integer, ForeignKey('vendor.vendor_id'), nullable=False)
-    customer_id = Column(Integer, ForeignKey('customer.customer_id'), nullable=False)
+    vendor_id = Column(Integer, ForeignKey('vendor.vendor_id'), nullable=False, index=True)
+    customer_id = Column(Integer, ForeignKey('customer.customer_id'), nullable=False, index=True)
     file_upload_id = Column(Integer, ForeignKey('fileupload.file_upload_id'), nullable=False)
 
     file_upload = relationship("FileUpload", back_populates="invoices")
@@ -73,6 +106,9 @@ class Invoice(Base):
 
 class Vendor(Base):
     __tablename__ = "vendor"
+    __table_args__ = (
+        Index('ix_vendor_upload_vendor', 'file_upload_id', 'vendor_id'),
+    )
 
     vendor_id = Column(Integer, primary_key=True, autoincrement=True)
     vendor_name = Column(String)
@@ -87,6 +123,9 @@ class Vendor(Base):
 
 class Customer(Base):
     __tablename__ = "customer"
+    __table_args__ = (
+        Index('ix_customer_upload_customer', 'file_upload_id', 'customer_id'),
+    )
 
     customer_id = Column(Integer, primary_key=True, autoincrement=True)
     customer_name = Column(String)
@@ -101,9 +140,12 @@ class Customer(Base):
 
 class Payment(Base):
     __tablename__ = "payment"
+    __table_args__ = (
+        Index('ix_payment_upload_payment', 'file_upload_id', 'payment_id'),
+    )
 
     payment_id = Column(Integer, primary_key=True, autoincrement=True)
-    invoice_id = Column(Integer, ForeignKey('invoice.invoice_id'), nullable=False)
+    invoice_id = Column(Integer, ForeignKey('invoice.invoice_id'), nullable=False, index=True)
     payment_date = Column(DATE)
     amount_paid = Column(DECIMAL)
     payment_method = Column(String)
@@ -115,9 +157,12 @@ class Payment(Base):
 
 class InvoiceItem(Base):
     __tablename__ = "invoice_item"
+    __table_args__ = (
+        Index('ix_invoice_item_upload_item', 'file_upload_id', 'item_id'),
+    )
 
     item_id = Column(Integer, primary_key=True, autoincrement=True)
-    invoice_id = Column(Integer, ForeignKey('invoice.invoice_id'), nullable=False)
+    invoice_id = Column(Integer, ForeignKey('invoice.invoice_id'), nullable=False, index=True)
     description = Column(Text)
     quantity = Column(Integer)
     unit_price = Column(DECIMAL)
@@ -126,3 +171,18 @@ class InvoiceItem(Base):
 
     file_upload = relationship("FileUpload", back_populates="invoice_items")
     invoice = relationship("Invoice", back_populates="invoice_items")
+
+
+class MappingMemory(Base):
+    # Confirmed header -> (table, column) mappings, one row per normalized header and target
+    __tablename__ = "mapping_memory"
+    __table_args__ = (
+        Index('uq_mapping_memory_source_target', 'source_key', 'target_table', 'target_column', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_key = Column(String(255), nullable=False)
+    target_table = Column(String(100), nullable=False)
+    target_column = Column(String(100), nullable=False)
+    confirmed_count = Column(Integer, nullable=False, default=0)
+    last_confirmed_at = Column(TIMESTAMP, nullable=False, default=func.current_timestamp())
@@ -0,0 +1,143 @@
+import time
+from typing import Any, Dict, List
+from uuid import uuid4
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from app.config import settings
+from app.utils.logger import app_logger
+from app.utils.metrics import DB_POOL_CHECKOUT_WAIT_SECONDS, DB_POOL_CHECKOUT_TIMEOUTS, DB_POOL_PINGS
+from app.utils.tracing import instrument_sql
+
+
+class TimedPoolMixin:
+    # Label used on the pool metrics; set by instrument_engine and carried over on recreate()
+    metrics_label = 'default'
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_CHECKOUT_TIMEOUTS.labels(self.metrics_label).inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_WAIT_SECONDS.labels(self.metrics_label).observe(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics_label = self.metrics_label
+        return pool
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+class TimedNullPool(TimedPoolMixin, NullPool):
+    pass
+
+
+def is_memory_sqlite(database_url: str) -> bool:
+    url = make_url(database_url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(database_url: str, is_async: bool = False) -> Dict[str, Any]:
+    options: Dict[str, Any] = {
+        'echo': settings.DEBUG,
+        'pool_pre_ping': settings.DB_PRE_PING == 'always'
+    }
+
+    if is_memory_sqlite(database_url):
+        # In-memory SQLite needs SQLAlchemy's own single-connection pool
+        return options
+
+    if settings.DB_PGBOUNCER_MODE:
+        # PgBouncer owns pooling; each checkout opens a fresh client connection to it
+        options['poolclass'] = TimedNullPool
+        if is_async and make_url(database_url).get_backend_name() in ('postgresql', 'postgres'):
+            # Transaction pooling hands statements to arbitrary server connections, so
+            # asyncpg must not cache prepared statements or reuse their names
+            options['connect_args'] = {
+                'statement_cache_size': 0,
+                'prepared_statement_cache_size': 0,
+                'prepared_statement_name_func': lambda: f'__asyncpg_{uuid4()}__'
+            }
+        return options
+
+    options.update({
+        'poolclass': TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE
+    })
+    return options
+
+
+def install_idle_ping(engine: Engine, label: str):
+    idle_seconds = settings.DB_PRE_PING_IDLE_SECONDS
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        connection_record.info['last_checkin'] = time.monotonic()
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        connection_record.info['last_checkin'] = time.monotonic()
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        last_checkin = connection_record.info.get('last_checkin')
+        if last_checkin is None or time.monotonic() - last_checkin < idle_seconds:
+            return
+        try:
+            engine.dialect.do_ping(dbapi_connection)
+            DB_POOL_PINGS.labels(label, 'ok').inc()
+        except Exception as e:
+            DB_POOL_PINGS.labels(label, 'stale').inc()
+            app_logger.warning(f"Discarding stale pooled connection ({label}): {str(e)}")
+            # The pool invalidates this connection and retries the checkout with a new one
+            raise exc.DisconnectionError() from e
+
+
+class PoolCollector:
+    # Reads live pool state at scrape time; engine.pool is replaced on dispose(), so hold the engines
+    def __init__(self):
+        self.engines: Dict[str, Engine] = {}
+
+    def collect(self) -> List[GaugeMetricFamily]:
+        size = GaugeMetricFamily('db_pool_size', "Configured pool size", labels=['engine'])
+        in_use = GaugeMetricFamily('db_pool_checked_out', "Connections currently checked out", labels=['engine'])
+        idle = GaugeMetricFamily('db_pool_checked_in', "Idle connections held by the pool", labels=['engine'])
+        overflow = GaugeMetricFamily('db_pool_overflow', "Connections open beyond pool_size", labels=['engine'])
+
+        for label, engine in self.engines.items():
+            pool = engine.pool
+            if not isinstance(pool, QueuePool):
+                continue
+            size.add_metric([label], pool.size())
+            in_use.add_metric([label], pool.checkedout())
+            idle.add_metric([label], pool.checkedin())
+            # overflow() is negative while the pool has not filled up yet
+            overflow.add_metric([label], max(0, pool.overflow()))
+        return [size, in_use, idle, overflow]
+
+
+pool_collector = PoolCollector()
+REGISTRY.register(pool_collector)
+
+
+def instrument_engine(engine: Engine, label: str):
+    if isinstance(engine.pool, TimedPoolMixin):
+        engine.pool.metrics_label = label
+    if settings.DB_PRE_PING == 'idle':
+        install_idle_ping(engine, label)
+    pool_collector.engines[label] = engine
+    instrument_sql(engine)
@@ -0,0 +1,39 @@
+from pathlib import Path
+from typing import Optional
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.engine import Engine
+from app.utils.logger import app_logger
+
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
+
+
+class SchemaRevisionError(RuntimeError):
+    pass
+
+
+def get_alembic_config() -> Config:
+    config = Config(str(ALEMBIC_INI))
+    return config
+
+
+def get_head_revision() -> Optional[str]:
+    return ScriptDirectory.from_config(get_alembic_config()).get_current_head()
+
+
+def get_current_revision(engine: Engine) -> Optional[str]:
+    with engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def verify_schema_revision(engine: Engine) -> str:
+    # Reads alembic_version only, so the cost does not grow with the number of tables or indexes
+    head = get_head_revision()
+    current = get_current_revision(engine)
+    if current != head:
+        raise SchemaRevisionError(
+            f"Database schema is at revision {current}, expected {head}. Run 'alembic upgrade head'."
+        )
+    app_logger.info(f"Database schema is at revision {current}")
+    return current
@@ -0,0 +1,321 @@
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+from app.config import settings
+from app.database.connection import Base
+from app.database.models import Customer, Invoice, InvoiceItem, Payment, Vendor
+from app.utils.column_profiler import is_null
+from app.utils.mapping_memory import strip_type
+
+# The mapping targets, derived once from the ORM models: which tables and columns a source field can
+# map to, their type names, the prompt's schema text, the Gemini response schema for column mapping,
+# a value coercer per column and the insert column list per table. Keys, foreign keys and
+# file_upload_id are filled in by the loader and are not targets.
+
+# Target name (as the LLM, the UI and confirmed mappings spell it) -> model, in prompt order
+TARGET_MODELS: Dict[str, Type[Base]] = {
+    'invoice': Invoice,
+    'vendor': Vendor,
+    'invoiceitem': InvoiceItem,
+    'customer': Customer,
+    'payment': Payment,
+}
+
+# SQLAlchemy type class names as the prompt and API present them
+TYPE_NAMES = {'DATE': 'Date', 'TIMESTAMP': 'DateTime', 'BIGINT': 'Integer', 'VARCHAR': 'String'}
+
+# Dates that read only one way. Numeric day/month dates such as 03/04/2025 are read with
+# DAY_FIRST_FORMATS or MONTH_FIRST_FORMATS; see coerce_date
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%d %b %Y', '%d %B %Y', '%b %d, %Y', '%B %d, %Y', '%d-%b-%Y', '%d-%b-%y')
+DAY_FIRST_FORMATS = ('%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d/%m/%y')
+MONTH_FIRST_FORMATS = ('%m/%d/%Y', '%m-%d-%Y', '%m.%d.%Y', '%m/%d/%y')
+DATE_ORDERS = {'DMY': 'day-first', 'MDY': 'month-first'}
+NUMERIC_DATE = re.compile(r"^(\d{1,2})[/.-](\d{1,2})[/.-]\d{2,4}$")
+DATE_TYPES = ('Date', 'DateTime')
+# Currency symbols and codes and spaces around amounts
+AMOUNT_NOISE = re.compile(r"[\s$€£₹]|\b(USD|EUR|GBP|INR|Rs\.?)\b", re.IGNORECASE)
+# 1,234,567.89 and 12,34,567.89: commas group digits
+GROUPING_COMMAS = re.compile(r"^(\d{1,3}(,\d{3})+|\d{1,2}(,\d{2})*,\d{3})(\.\d+)?$")
+# 1.234.567,89 and 12,5: a decimal comma, dots grouping thousands
+DECIMAL_COMMA = re.compile(r"^(\d{1,3}(\.\d{3})+|\d+),\d+$")
+
+
+class InvalidValue(ValueError):
+    # Raised by the coercers; kind names the problem without the value, e.g. "not a date"
+    def __init__(self, value: Any, kind: str):
+        super().__init__(f"{value!r} is {kind}")
+        self.kind = kind
+
+
+class CoercionError(ValueError):
+    # A mapped value that its target column refused. reason leaves the value out, so every row failing
+    # the same way shares it: "invoice.issue_date: not a date"
+    def __init__(self, source_field: str, table: str, column: str, error: ValueError):
+        super().__init__(f"{source_field} -> {table}.{column}: {error}")
+        self.reason = f"{table}.{column}: {getattr(error, 'kind', 'invalid value')}"
+
+
+def coerce_string(value: Any) -> str:
+    # Spreadsheet cells hold phone numbers and codes as floats: 9998887777.0
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def coerce_decimal(value: Any) -> Decimal:
+    if isinstance(value, bool):
+        raise InvalidValue(value, "not an amount")
+    if isinstance(value, (int, float, Decimal)):
+        return Decimal(str(value))
+    text = AMOUNT_NOISE.sub("", str(value))
+    negative = text.startswith("(") and text.endswith(")")
+    text = text.strip("()")
+    if "," in text:
+        text = _without_commas(text, value)
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise InvalidValue(value, "not an amount")
+    return -amount if negative else amount
+
+
+def _without_commas(text: str, value: Any) -> str:
+    # "1,234" is read as a thousand; a comma that neither groups digits nor is a decimal comma is
+    # refused rather than guessed at
+    sign, digits = (text[0], text[1:]) if text[:1] in "+-" else ("", text)
+    if GROUPING_COMMAS.match(digits):
+        return sign + digits.replace(",", "")
+    if DECIMAL_COMMA.match(digits):
+        return sign + digits.replace(".", "").replace(",", ".")
+    raise InvalidValue(value, "not an amount: unrecognised separators")
+
+
+def coerce_integer(value: Any) -> int:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    amount = coerce_decimal(value)
+    if amount != amount.to_integral_value():
+        raise InvalidValue(value, "not a whole number")
+    return int(amount)
+
+
+def _parse_date(text: str, formats: Tuple[str, ...]) -> Optional[date]:
+    for date_format in formats:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def coerce_date(value: Any, date_order: Optional[str] = None) -> date:
+    # date_order ('DMY' or 'MDY', else settings.DATE_ORDER) settles dates that read both ways, such as
+    # 03/04/2025. Without one they are refused: guessing would store the wrong day without an error
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    try:
+        # ISO dates and datetimes, e.g. "2025-06-01" or "2025-06-01T00:00:00"
+        return datetime.fromisoformat(text).date()
+    except ValueError:
+        pass
+    parsed = _parse_date(text, DATE_FORMATS)
+    if parsed is not None:
+        return parsed
+    day_first, month_first = _parse_date(text, DAY_FIRST_FORMATS), _parse_date(text, MONTH_FIRST_FORMATS)
+    if day_first is not None and month_first is not None and day_first != month_first:
+        date_order = date_order or settings.DATE_ORDER
+        if date_order not in DATE_ORDERS:
+            raise InvalidValue(value, "an ambiguous date: day-first or month-first")
+        return day_first if date_order == 'DMY' else month_first
+    if day_first is not None or month_first is not None:
+        return day_first or month_first
+    raise InvalidValue(value, "not a date")
+
+
+def coerce_datetime(value: Any, date_order: Optional[str] = None) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.combine(coerce_date(value, date_order), datetime.min.time())
+
+
+def infer_date_order(values: Iterable[Any]) -> Optional[Tuple[str, Any]]:
+    # A column's numeric date order and the first value that shows it, such as 13/01/2025 for DMY.
+    # None when no value reads only one way, or when values disagree
+    found = None
+    for value in values:
+        if isinstance(value, date):
+            continue
+        match = NUMERIC_DATE.match(str(value).strip())
+        if not match:
+            continue
+        first, second = int(match.group(1)), int(match.group(2))
+        if first > 12 >= second:
+            order = 'DMY'
+        elif second > 12 >= first:
+            order = 'MDY'
+        else:
+            continue
+        if found is None:
+            found = (order, value)
+        elif found[0] != order:
+            return None
+    return found
+
+
+COERCERS: Dict[str, Callable[[Any], Any]] = {
+    'String': coerce_string,
+    'Text': coerce_string,
+    'Integer': coerce_integer,
+    'DECIMAL': coerce_decimal,
+    'Numeric': coerce_decimal,
+    'Float': lambda value: float(coerce_decimal(value)),
+    'Date': coerce_date,
+    'DateTime': coerce_datetime,
+}
+
+
+def nullable(coercer: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    # Empty cells, NaN and placeholders such as "N/A" are stored as NULL
+    def coerce(value: Any) -> Any:
+        return None if is_null(value) else coercer(value)
+    return coerce
+
+
+# (source_field, target_table, target_column, coercer)
+CompiledMapping = Tuple[str, str, str, Callable[[Any], Any]]
+
+
+class TargetColumn:
+    def __init__(self, name: str, type_name: str, sql_type: Any):
+        self.name = name
+        self.type_name = type_name
+        self.sql_type = sql_type
+        self.coerce = nullable(COERCERS.get(type_name, lambda value: value))
+
+
+class TargetTable:
+    def __init__(self, name: str, model: Type[Base]):
+        self.name = name
+        self.model = model
+        self.columns: Dict[str, TargetColumn] = {}
+        for column in model.__table__.columns:
+            if column.primary_key or column.foreign_keys or column.name == 'file_upload_id':
+                continue
+            class_name = type(column.type).__name__
+            self.columns[column.name] = TargetColumn(column.name, TYPE_NAMES.get(class_name, class_name), type(column.type))
+        self.insert_columns: List[str] = list(self.columns)
+
+
+class SchemaRegistry:
+    def __init__(self, target_models: Dict[str, Type[Base]]):
+        self.tables: Dict[str, TargetTable] = {name: TargetTable(name, model) for name, model in target_models.items()}
+        # {"invoice": {"invoice_number": "String", ...}}: the API's expected_schema and the local matcher's input
+        self.expected_schema: Dict[str, Dict[str, str]] = {
+            name: {column.name: column.type_name for column in table.columns.values()}
+            for name, table in self.tables.items()
+        }
+        self.schema_text = "\n".join(
+            f"- {name}: " + ", ".join(f"{column} {type_name}" for column, type_name in columns.items())
+            for name, columns in self.expected_schema.items()
+        )
+        self.mapping_response_schema = self._mapping_response_schema()
+
+    def _mapping_response_schema(self) -> Dict[str, Any]:
+        # Gemini's response_schema (OpenAPI subset): constrains target tables to the known ones
+        return {
+            'type': 'OBJECT',
+            'properties': {
+                'mappings': {
+                    'type': 'ARRAY',
+                    'items': {
+                        'type': 'OBJECT',
+                        'properties': {
+                            'source_field': {'type': 'STRING'},
+                            'target_table': {'type': 'STRING', 'enum': list(self.tables)},
+                            'target_column': {'type': 'STRING'},
+                        },
+                        'required': ['source_field', 'target_table', 'target_column'],
+                    },
+                },
+                'unmapped_fields': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+            },
+            'required': ['mappings', 'unmapped_fields'],
+        }
+
+    def column(self, table: str, column: str) -> Optional[TargetColumn]:
+        target_table = self.tables.get(table)
+        return target_table.columns.get(column) if target_table else None
+
+    def has_target(self, table: str, column: str) -> bool:
+        return self.column(table, column) is not None
+
+    def compile_mappings(self, mappings: List[Dict[str, Any]], date_orders: Optional[Dict[str, Tuple[str, Any]]] = None
+                         ) -> Tuple[List[CompiledMapping], List[Dict[str, Any]]]:
+        # Mappings with a known target, ready for the insert loop, and the rejected ones. date_orders
+        # (from date_orders()) fixes how each source field's ambiguous numeric dates are read
+        compiled, rejected = [], []
+        for mapping in mappings:
+            target = self.column(mapping['target_table'], mapping['target_column'])
+            if target is None:
+                rejected.append(mapping)
+                continue
+            coerce = target.coerce
+            if date_orders and target.type_name in DATE_TYPES and mapping['source_field'] in date_orders:
+                coerce = nullable(partial(COERCERS[target.type_name], date_order=date_orders[mapping['source_field']][0]))
+            compiled.append((mapping['source_field'], mapping['target_table'], mapping['target_column'], coerce))
+        return compiled, rejected
+
+    def date_orders(self, mappings: List[Dict[str, Any]], records: List[Dict[str, Any]]) -> Dict[str, Tuple[str, Any]]:
+        # source field -> (date order, value showing it), for fields mapped to date columns whose values settle it
+        orders = {}
+        for mapping in mappings:
+            target = self.column(mapping['target_table'], mapping['target_column'])
+            source_field = mapping['source_field']
+            if target is None or target.type_name not in DATE_TYPES or source_field in orders:
+                continue
+            order = infer_date_order(record.get(source_field) for record in records)
+            if order is not None:
+                orders[source_field] = order
+        return orders
+
+    def canonical_mappings(self, mappings: List[Dict[str, Any]],
+                           columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        # Mappings as the insert and mapping memory read them: the raw header and the bare target column.
+        # The LLM is asked for "Invoice No (String)"-style names; a datatype suffix is dropped where the
+        # remaining name is a header of the file (when columns is known) or a target column
+        canonical = []
+        for mapping in mappings:
+            source_field, target_column = mapping['source_field'], mapping['target_column']
+            if columns is not None and source_field not in columns and strip_type(source_field) in columns:
+                source_field = strip_type(source_field)
+            if not self.has_target(mapping['target_table'], target_column) and \
+                    self.has_target(mapping['target_table'], strip_type(target_column)):
+                target_column = strip_type(target_column)
+            canonical.append({**mapping, 'source_field': source_field, 'target_column': target_column})
+        return canonical
+
+    def transform(self, record: Dict[str, Any], mappings: List[CompiledMapping],
+                  errors: Optional[List[Tuple[str, str, str, str]]] = None) -> Dict[str, Dict[str, Any]]:
+        # One record's values per target table, coerced. The first bad value raises, unless errors is
+        # given: then every bad value is appended to it as (source_field, table, column, message)
+        transformed = {table: {} for table in self.tables}
+        for source_field, target_table, target_column, coerce in mappings:
+            if source_field not in record:
+                continue
+            try:
+                transformed[target_table][target_column] = coerce(record[source_field])
+            except ValueError as e:
+                if errors is None:
+                    raise CoercionError(source_field, target_table, target_column, e)
+                errors.append((source_field, target_table, target_column, str(e)))
+        return transformed
+
+
+@lru_cache(maxsize=None)
+def get_schema_registry() -> SchemaRegistry:
+    return SchemaRegistry(TARGET_MODELS)
@@ -0,0 +1,48 @@
+from functools import lru_cache
+from app.bao.file_processing_bao import FileProcessingBAO
+from app.bao.llm_mapping_bao import LLMMappingBAO
+from app.dao.data_retrevial_dao import DataRetrivalDAO
+from app.dao.file_upload_dao import FileUploadDAO
+from app.database.schema_registry import get_schema_registry
+from app.utils.file_utils import FileProcessor
+from app.utils.startup_report import startup_report
+
+# Process-wide singletons handed to routes through Depends; they hold no per-request state
+
+
+@lru_cache(maxsize=None)
+def get_file_processor() -> FileProcessor:
+    with startup_report.timed("construct:file_processor"):
+        return FileProcessor()
+
+
+@lru_cache(maxsize=None)
+def get_llm_mapping_bao() -> LLMMappingBAO:
+    with startup_report.timed("construct:llm_mapping_bao"):
+        return LLMMappingBAO()
+
+
+@lru_cache(maxsize=None)
+def get_file_processing_bao() -> FileProcessingBAO:
+    file_processor = get_file_processor()
+    llm_mapping_bao = get_llm_mapping_bao()
+    with startup_report.timed("construct:file_processing_bao"):
+        return FileProcessingBAO(file_processor=file_processor, llm_mapping_bao=llm_mapping_bao)
+
+
+@lru_cache(maxsize=None)
+def get_file_upload_dao() -> FileUploadDAO:
+    return FileUploadDAO()
+
+
+@lru_cache(maxsize=None)
+def get_data_retrieval_dao() -> DataRetrivalDAO:
+    return DataRetrivalDAO()
+
+
+def warm_up_singletons():
+    with startup_report.timed("construct:schema_registry"):
+        get_schema_registry()
+    get_file_processing_bao()
+    get_file_upload_dao()
+    get_data_retrieval_dao()
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from typing import Optional
+from app.config import settings
+from app.schemas.admin_schemas import ProfilingArmRequest
+from app.utils.profiler import request_profiler
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+def require_profiling(x_profile_token: Optional[str] = Header(None)):
+    # The profiling routes do not exist unless PROFILING_ENABLED, and always need PROFILING_TOKEN
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not settings.PROFILING_TOKEN:
+        raise HTTPException(status_code=403, detail="Profiling token not configured")
+    if not request_profiler.authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+@router.get("/profiling", dependencies=[Depends(require_profiling)])
+async def get_profiling_status():
+    return request_profiler.status()
+
+
+@router.post("/profiling/arm", dependencies=[Depends(require_profiling)])
+async def arm_profiling(arm_request: ProfilingArmRequest):
+    # Profile the next `count` upload/confirm-mappings requests; 0 disarms
+    request_profiler.arm(arm_request.count)
+    return request_profiler.status()
+
+
+@router.get("/profiles/{file_upload_id}", dependencies=[Depends(require_profiling)])
+async def list_profiles(file_upload_id: int):
+    return {
+        'file_upload_id': file_upload_id,
+        'profiles': request_profiler.list_profiles(file_upload_id)
+    }
+
+
+@router.get("/profiles/{file_upload_id}/{artifact}", dependencies=[Depends(require_profiling)])
+async def get_profile_artifact(file_upload_id: int, artifact: str):
+    path = request_profiler.artifact_path(file_upload_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile artifact {artifact} not found")
+    media_type = "application/json" if artifact.endswith('.json') else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=artifact)
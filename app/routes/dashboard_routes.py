@@ -1,19 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import Dict, Any, List
-from app.database.connection import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.connection import get_async_db
 from app.dao.file_upload_dao import FileUploadDAO
 from app.dao.data_retrevial_dao import DataRetrivalDAO
 from app.utils.logger import app_logger
+from app.dependencies import get_file_upload_dao, get_data_retrieval_dao
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
 
 @router.get("/overview")
-async def get_dashboard_overview(db: Session = Depends(get_db)):
+async def get_dashboard_overview(
+    db: AsyncSession = Depends(get_async_db),
+    file_upload_dao: FileUploadDAO = Depends(get_file_upload_dao)
+):
     try:
-        file_upload_dao = FileUploadDAO()
-        
-        recent_uploads = file_upload_dao.get_all_with_stats(db, limit=200)
+        recent_uploads = await file_upload_dao.get_all_with_stats(db, limit=200)
         
         total_files = len(recent_uploads)
         completed_files = len([f for f in recent_uploads if f.processing_status == 'Completed'])
@@ -39,6 +40,8 @@ async def get_dashboard_overview(db: Session = Depends(get_db)):
                     'failed_records': f.failed_records,
                     'error_summary': f.error_summary,
                     'unmapped_columns': f.unmapped_columns or [],
+                    'llm_prompt_tokens': f.llm_prompt_tokens,
+                    'llm_completion_tokens': f.llm_completion_tokens,
                 }
                 for f in recent_uploads
             ]
@@ -48,9 +51,12 @@ async def get_dashboard_overview(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/processing-summary/{file_upload_id}")
-async def get_processing_summary(file_upload_id: int, db: Session = Depends(get_db)):
+async def get_processing_summary(
+    file_upload_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    data_dao: DataRetrivalDAO = Depends(get_data_retrieval_dao)
+):
     try:
-        data_dao = DataRetrivalDAO()
         summary = await data_dao.get_all_data_by_file_id(db, file_upload_id)
         return summary
     except Exception as e:
@@ -1,20 +1,52 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status, Form
-from sqlalchemy.orm import Session
+import asyncio
+import hashlib
+import json
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status, Form, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any, Optional
-from app.database.connection import get_db
+from app.database.connection import get_async_db, get_async_db_session
 from app.dao.file_upload_dao import FileUploadDAO
 from app.bao.file_processing_bao import FileProcessingBAO
 from app.utils.file_utils import FileProcessor
-from app.schemas.file_schemas import FullMappingSchema, DataInsertResponse
-from app.schemas.mapping_schemas import MappingRequest
+from app.dependencies import get_file_processing_bao, get_file_processor, get_file_upload_dao
+from app.schemas.file_schemas import (
+    FullMappingSchema, DataInsertResponse, FailedRow, FailedRowsResponse, MappingPreviewResponse, RetryFailedResponse
+)
+from app.schemas.mapping_schemas import MappingPreviewRequest, MappingRequest, RetryFailedRequest
 from app.config import settings
 from app.utils.logger import app_logger
+from app.utils.stage_timer import StageTimer
+from app.utils.progress_events import progress_broker, TERMINAL_STATUSES
+from app.utils.admission import admission_controller
+from app.utils.profiler import request_profiler, ProfileSession
 
 router = APIRouter(prefix="/upload", tags=["File Upload"])
 
 
+async def _finish_profile(profile: Optional[ProfileSession], file_upload_id: Optional[int], response: Response):
+    if profile is None:
+        return
+    name = await asyncio.to_thread(request_profiler.finish, profile, file_upload_id)
+    if name is not None:
+        response.headers["X-Profile-Name"] = name
+
+
 @router.post("/", response_model=FullMappingSchema)
-async def upload_file(file: UploadFile = File(...), storageLocation: Optional[str] = Form(None),db: Session = Depends(get_db)):
+async def upload_file(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    storageLocation: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_async_db),
+    file_processor: FileProcessor = Depends(get_file_processor),
+    file_upload_dao: FileUploadDAO = Depends(get_file_upload_dao),
+    processing_bao: FileProcessingBAO = Depends(get_file_processing_bao)
+):
+    timer = StageTimer("upload_file")
+    profile = request_profiler.start("upload_file", request.headers)
+    file_upload_id = None
+    ticket = None
     try:
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file provided")
@@ -25,56 +57,286 @@ async def upload_file(file: UploadFile = File(...), storageLocation: Optional[st
                 status_code=400, 
                 detail=f"File type {file_extension} not allowed. Allowed types: {settings.ALLOWED_FILE_TYPES}"
             )
+        timer.file_type = file_extension
         
-        content = await file.read()  
+        with timer.stage("read"):
+            content = await file.read()  
             
         if len(content) > settings.MAX_FILE_SIZE:
             raise HTTPException(status_code=400, detail="File too large")
         
-        file_processor = FileProcessor()
-        if storageLocation == 'local':
-            file_path = await file_processor.save_file(content, file.filename)
-        elif storageLocation == 'cloud':
-            file_path = await file_processor.save_file_to_cloud(content, file.filename)
-        else:
+        # Admit (or turn away with 429/503) before anything is stored or recorded
+        with timer.stage("admission"):
+            ticket = await admission_controller.acquire("process", len(content))
+        
+        # Uploads are stored by content hash so identical files share one object
+        with timer.stage("hash"):
+            content_hash = hashlib.sha256(content).hexdigest()
+        object_name = f"{content_hash}.{file_extension}"
+        
+        if storageLocation not in ('local', 'cloud'):
             raise HTTPException(status_code=400, detail="Invalid storage location specified")
+        
+        with timer.stage("store"):
+            if storageLocation == 'local':
+                file_path = await file_processor.save_file(content, object_name)
+            else:
+                file_path = await file_processor.save_file_to_cloud(content, object_name)
 
-        file_upload_dao = FileUploadDAO()
         upload_data = {
             'original_filename': file.filename,
             'file_path': file_path,
             'file_size': len(content),
             'file_type': file_extension,
             'storage_location': storageLocation,
+            'content_hash': content_hash,
             'processing_status': 'Pending'
         }
         
-        file_upload = file_upload_dao.create(db, upload_data)
+        with timer.stage("record"):
+            file_upload = await file_upload_dao.create(db, upload_data)
+            file_upload_id = file_upload.file_upload_id
+        timer.file_upload_id = file_upload_id
         
-        processing_bao = FileProcessingBAO()
-        response = await processing_bao.process_uploaded_file(file_upload.file_upload_id)
+        with timer.stage("process"):
+            result = await processing_bao.process_uploaded_file(file_upload_id)
         
-        return response
+        return result
         
     except HTTPException:
         raise
     except Exception as e:
         app_logger.error(f"Error uploading file: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        if ticket is not None:
+            ticket.release()
+        if file_upload_id is not None:
+            await processing_bao.record_timings(file_upload_id, timer)
+        await _finish_profile(profile, file_upload_id, response)
 
 
 @router.post("/{file_upload_id}/confirm-mappings", response_model=DataInsertResponse)
 async def confirm_mappings(
     file_upload_id: int,
-    mapping_request: MappingRequest
+    mapping_request: MappingRequest,
+    request: Request,
+    response: Response,
+    file_upload_dao: FileUploadDAO = Depends(get_file_upload_dao),
+    processing_bao: FileProcessingBAO = Depends(get_file_processing_bao)
 ):
+    profile = None
     try:
-        processing_bao = FileProcessingBAO()  
-        result = await processing_bao.confirm_user_mappings(
-            file_upload_id=file_upload_id,
-            confirmed_mappings=mapping_request.mappings
-        )
+        async with get_async_db_session() as db:
+            file_upload = await file_upload_dao.get_by_id(db, file_upload_id)
+        if file_upload is None:
+            raise HTTPException(status_code=404, detail=f"File upload {file_upload_id} not found")
+        
+        ticket = await admission_controller.acquire("confirm", file_upload.file_size)
+        profile = request_profiler.start("confirm_mappings", request.headers)
+        try:
+            # Two confirms, or a confirm and a retry, must not load the same upload at once
+            async with get_async_db_session() as db:
+                if not await file_upload_dao.claim_for_processing(db, file_upload_id):
+                    raise HTTPException(status_code=409, detail=f"File upload {file_upload_id} is still processing")
+            result = await processing_bao.confirm_user_mappings(
+                file_upload_id=file_upload_id,
+                confirmed_mappings=mapping_request.mappings
+            )
+        finally:
+            ticket.release()
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         app_logger.error(f"Error confirming mappings: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        await _finish_profile(profile, file_upload_id, response)
+
+
+@router.post("/{file_upload_id}/preview-mappings", response_model=MappingPreviewResponse)
+async def preview_mappings(
+    file_upload_id: int,
+    preview_request: MappingPreviewRequest,
+    file_upload_dao: FileUploadDAO = Depends(get_file_upload_dao),
+    processing_bao: FileProcessingBAO = Depends(get_file_processing_bao)
+):
+    # Dry run of confirm-mappings over the cached sample rows; reads only, so no admission slot
+    try:
+        async with get_async_db_session() as db:
+            file_upload = await file_upload_dao.get_by_id(db, file_upload_id)
+        if file_upload is None:
+            raise HTTPException(status_code=404, detail=f"File upload {file_upload_id} not found")
+        
+        return await processing_bao.preview_mappings(
+            file_upload_id,
+            [mapping.model_dump() for mapping in preview_request.mappings],
+            preview_request.rows
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        app_logger.error(f"Error previewing mappings: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/{file_upload_id}/failed-rows", response_model=FailedRowsResponse)
+async def get_failed_rows(
+    file_upload_id: int,
+    file_upload_dao: FileUploadDAO = Depends(get_file_upload_dao)
+):
+    try:
+        async with get_async_db_session() as db:
+            file_upload = await file_upload_dao.get_by_id(db, file_upload_id)
+            if file_upload is None:
+                raise HTTPException(status_code=404, detail=f"File upload {file_upload_id} not found")
+            failed_rows = await file_upload_dao.get_failed_rows(db, file_upload_id)
+        return FailedRowsResponse(
+            file_upload_id=file_upload_id,
+            failed_rows=[FailedRow(row=row, reason=reason) for row, reason in sorted(failed_rows.items())]
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        app_logger.error(f"Error getting failed rows: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/{file_upload_id}/retry-failed", response_model=RetryFailedResponse)
+async def retry_failed_rows(
+    file_upload_id: int,
+    retry_request: RetryFailedRequest,
+    file_upload_dao: FileUploadDAO = Depends(get_file_upload_dao),
+    processing_bao: FileProcessingBAO = Depends(get_file_processing_bao)
+):
+    # Loads only the rows the last insert failed on, appending them to the upload
+    try:
+        async with get_async_db_session() as db:
+            file_upload = await file_upload_dao.get_by_id(db, file_upload_id)
+            if file_upload is None:
+                raise HTTPException(status_code=404, detail=f"File upload {file_upload_id} not found")
+            previous_status = file_upload.processing_status
+            if previous_status == 'Processing':
+                raise HTTPException(status_code=409, detail=f"File upload {file_upload_id} is still processing")
+            failed_rows = await file_upload_dao.get_failed_rows(db, file_upload_id)
+        if not failed_rows:
+            raise HTTPException(status_code=409, detail=f"File upload {file_upload_id} has no failed rows to retry")
+        retried_rows = failed_rows.keys() if retry_request.rows is None else failed_rows.keys() & set(retry_request.rows)
+        if not retried_rows:
+            raise HTTPException(status_code=400, detail="None of the requested rows failed")
+        unused_values = sorted(set(retry_request.values) - retried_rows)
+        if unused_values:
+            raise HTTPException(status_code=400, detail=f"Values given for rows that are not retried: {unused_values[:20]}")
+        
+        ticket = await admission_controller.acquire("confirm", file_upload.file_size)
+        try:
+            # The check above is only a fast path; two retries may both pass it, only one wins the claim
+            async with get_async_db_session() as db:
+                if not await file_upload_dao.claim_for_processing(db, file_upload_id):
+                    raise HTTPException(status_code=409, detail=f"File upload {file_upload_id} is still processing")
+            try:
+                return await processing_bao.retry_failed_records(
+                    file_upload_id,
+                    mappings=[mapping.model_dump() for mapping in retry_request.mappings] if retry_request.mappings is not None else None,
+                    values=retry_request.values,
+                    rows=retry_request.rows
+                )
+            except Exception:
+                # Rows loaded before stay loaded, so the upload goes back to its status before the claim
+                try:
+                    async with get_async_db_session() as db:
+                        await file_upload_dao.update_processing_status(db, file_upload_id, previous_status)
+                except Exception as e:
+                    app_logger.error(f"Could not restore the status of file upload {file_upload_id}: {str(e)}")
+                raise
+        finally:
+            ticket.release()
+    except HTTPException:
+        raise
+    except Exception as e:
+        app_logger.error(f"Error retrying failed rows: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+def _sse(event_type: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _status_event(file_upload) -> Dict[str, Any]:
+    return {
+        'type': 'status',
+        'file_upload_id': file_upload.file_upload_id,
+        'status': file_upload.processing_status,
+        'total_records_found': file_upload.total_records_found,
+        'successful_records': file_upload.successful_records,
+        'failed_records': file_upload.failed_records,
+        'error_summary': file_upload.error_summary,
+        'source': 'database'
+    }
+
+
+@router.get("/{file_upload_id}/events")
+async def stream_processing_events(
+    file_upload_id: int,
+    request: Request,
+    file_upload_dao: FileUploadDAO = Depends(get_file_upload_dao)
+):
+    # Server-sent events: stage transitions, record-count progress and status changes for one upload,
+    # ending once it reaches a terminal status. Sessions are opened per read, never held for the
+    # lifetime of the stream, so idle viewers do not pin pooled connections
+    async def load():
+        async with get_async_db_session() as db:
+            return await file_upload_dao.get_by_id(db, file_upload_id)
+
+    if await load() is None:
+        raise HTTPException(status_code=404, detail=f"File upload {file_upload_id} not found")
+
+    async def events():
+        # Subscribe before reading the current state so nothing published in between is missed
+        with progress_broker.subscribe(file_upload_id) as queue:
+            file_upload = await load()
+            if file_upload is None:
+                yield _sse('gone', {'type': 'gone', 'file_upload_id': file_upload_id})
+                return
+            last_status = file_upload.processing_status
+            yield _sse('status', _status_event(file_upload))
+            if last_status in TERMINAL_STATUSES:
+                return
+            for event in progress_broker.snapshot(file_upload_id):
+                if event['type'] != 'status':
+                    yield _sse(event['type'], event, event['id'])
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    # Fallback for work running in another worker process, whose events never reach this broker
+                    file_upload = await load()
+                    if file_upload is None:
+                        # Deleted while being watched; end the stream instead of idling on keepalives
+                        yield _sse('gone', {'type': 'gone', 'file_upload_id': file_upload_id})
+                        return
+                    if file_upload.processing_status != last_status:
+                        last_status = file_upload.processing_status
+                        yield _sse('status', _status_event(file_upload))
+                        if last_status in TERMINAL_STATUSES:
+                            return
+                    else:
+                        yield ": keepalive\n\n"
+                    continue
+
+                yield _sse(event['type'], event, event['id'])
+                if event['type'] == 'status':
+                    last_status = event['status']
+                    if last_status in TERMINAL_STATUSES:
+                        return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
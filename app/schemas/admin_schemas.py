@@ -0,0 +1,4 @@
+from pydantic import BaseModel, Field
+
+class ProfilingArmRequest(BaseModel):
+    count: int = Field(1, ge=0, le=100)
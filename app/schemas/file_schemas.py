@@ -42,6 +42,42 @@ class DataInsertResponse(BaseModel):
     processing_stats: ProcessingStats
     status: str
 
+class PreviewIssue(BaseModel):
+    # row is None for problems with the mapping itself rather than with a value
+    row: Optional[int] = None
+    source_field: Optional[str] = None
+    target_table: Optional[str] = None
+    target_column: Optional[str] = None
+    message: str
+
+class PreviewTableRow(BaseModel):
+    row: int
+    values: Dict[str, Any]
+
+class MappingPreviewResponse(BaseModel):
+    file_upload_id: int
+    rows_previewed: int
+    valid_rows: int
+    failed_rows: int
+    tables: Dict[str, List[PreviewTableRow]]
+    errors: List[PreviewIssue] = Field(default_factory=list)
+
+class FailedRow(BaseModel):
+    # 0-based index into the upload's extracted rows
+    row: int
+    reason: str
+
+class FailedRowsResponse(BaseModel):
+    file_upload_id: int
+    failed_rows: List[FailedRow]
+
+class RetryFailedResponse(BaseModel):
+    file_upload_id: int
+    retried_rows: List[int]
+    processing_stats: ProcessingStats
+    remaining_failed_rows: int
+    status: str
+
 class ProcessingLogResponse(BaseModel):
     log_level: str
     message: str
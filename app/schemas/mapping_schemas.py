@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 
 class Mapping(BaseModel):
     source_field: str
@@ -8,3 +8,15 @@ class Mapping(BaseModel):
 
 class MappingRequest(BaseModel):
     mappings: List[Mapping]
+
+class MappingPreviewRequest(MappingRequest):
+    # Capped at PREVIEW_SAMPLE_ROWS, the number of rows cached per upload
+    rows: int = Field(default=20, ge=1)
+
+class RetryFailedRequest(BaseModel):
+    # Mappings for the retried rows; omitted, the upload's confirmed mappings are reused
+    mappings: Optional[List[Mapping]] = None
+    # Corrected source values per failed row index, e.g. {"17": {"Amount": "120.50"}}
+    values: Dict[int, Dict[str, Any]] = Field(default_factory=dict)
+    # Failed row indices to retry; omitted, all of them
+    rows: Optional[List[int]] = None
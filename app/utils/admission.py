@@ -0,0 +1,150 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from fastapi import HTTPException
+from app.config import settings
+from app.utils.logger import app_logger
+from app.utils.metrics import ADMISSION_IN_FLIGHT, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS, ADMISSION_WAITING
+
+# Admission control for the upload pipeline. Every request takes a slot in its stage's budget and,
+# for medium/large files, in the budget of its size class, so a burst of big files cannot run
+# extraction, LLM calls and inserts all at once. Waiting is FIFO and bounded; overflow is refused
+# immediately (429) and waits that run past ADMISSION_WAIT_TIMEOUT_SECONDS give up (503). Budgets
+# are per worker process and assume a single event loop.
+
+
+class AdmissionRejected(HTTPException):
+    def __init__(self, status_code: int, budget: str, retry_after: int):
+        reason = "too many queued requests" if status_code == 429 else "timed out waiting for capacity"
+        super().__init__(
+            status_code=status_code,
+            detail=f"Server busy ({budget}: {reason}); retry after {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.budget = budget
+        self.retry_after = retry_after
+
+
+class Budget:
+    def __init__(self, name: str, limit: int, max_waiting: int):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.in_use = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long a slot is held, for Retry-After
+        self.average_hold: Optional[float] = None
+
+    def retry_after(self) -> int:
+        hold = self.average_hold if self.average_hold is not None else 1.0
+        estimate = math.ceil(hold * (len(self.waiters) + 1) / self.limit)
+        return max(1, min(settings.ADMISSION_RETRY_AFTER_MAX_SECONDS, estimate))
+
+    def reject(self, status_code: int, reason: str) -> AdmissionRejected:
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        return AdmissionRejected(status_code, self.name, self.retry_after())
+
+    async def acquire(self, timeout: float):
+        if self.in_use < self.limit and not self.waiters:
+            self.in_use += 1
+            ADMISSION_IN_FLIGHT.labels(self.name).set(self.in_use)
+            return
+        if len(self.waiters) >= self.max_waiting:
+            raise self.reject(429, 'queue_full')
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        ADMISSION_WAITING.labels(self.name).set(len(self.waiters))
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self.release(None)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self.reject(503, 'timeout')
+            raise
+        finally:
+            try:
+                self.waiters.remove(waiter)
+            except ValueError:
+                pass
+            ADMISSION_WAITING.labels(self.name).set(len(self.waiters))
+            ADMISSION_WAIT_SECONDS.labels(self.name).observe(time.perf_counter() - started)
+
+    def release(self, held_for: Optional[float]):
+        if held_for is not None:
+            self.average_hold = held_for if self.average_hold is None else 0.8 * self.average_hold + 0.2 * held_for
+        # Hand the slot straight to the oldest live waiter; in_use only drops when nobody is queued
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_use -= 1
+        ADMISSION_IN_FLIGHT.labels(self.name).set(self.in_use)
+
+
+class AdmissionTicket:
+    def __init__(self, budgets: List[Budget]):
+        self.budgets = budgets
+        self.acquired = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        held_for = time.perf_counter() - self.acquired
+        for budget in reversed(self.budgets):
+            budget.release(held_for)
+
+
+class AdmissionController:
+    def __init__(self):
+        self.stage_budgets: Dict[str, Budget] = {}
+        self.size_budgets: Dict[str, Budget] = {}
+        for stage, limit in (('process', settings.ADMISSION_PROCESS_CONCURRENCY),
+                             ('confirm', settings.ADMISSION_CONFIRM_CONCURRENCY)):
+            if limit > 0:
+                self.stage_budgets[stage] = Budget(f"stage:{stage}", limit, settings.ADMISSION_MAX_WAITING)
+        for size_class, limit in (('medium', settings.ADMISSION_MEDIUM_CONCURRENCY),
+                                  ('large', settings.ADMISSION_LARGE_CONCURRENCY)):
+            if limit > 0:
+                self.size_budgets[size_class] = Budget(f"size:{size_class}", limit, settings.ADMISSION_MAX_WAITING)
+
+    @staticmethod
+    def size_class(file_size: Optional[int]) -> str:
+        if file_size is None or file_size >= settings.ADMISSION_LARGE_FILE_BYTES:
+            return 'large'
+        if file_size >= settings.ADMISSION_MEDIUM_FILE_BYTES:
+            return 'medium'
+        return 'small'
+
+    async def acquire(self, stage: str, file_size: Optional[int]) -> AdmissionTicket:
+        if not settings.ADMISSION_ENABLED:
+            return AdmissionTicket([])
+
+        # Always stage first, then size class, so two requests never wait on each other's slots
+        candidates: List[Optional[Budget]] = [self.stage_budgets.get(stage), self.size_budgets.get(self.size_class(file_size))]
+        budgets = [budget for budget in candidates if budget is not None]
+
+        deadline = time.perf_counter() + settings.ADMISSION_WAIT_TIMEOUT_SECONDS
+        acquired: List[Budget] = []
+        try:
+            for budget in budgets:
+                await budget.acquire(max(0.0, deadline - time.perf_counter()))
+                acquired.append(budget)
+        except BaseException as e:
+            for budget in reversed(acquired):
+                budget.release(None)
+            if isinstance(e, AdmissionRejected):
+                app_logger.warning(f"Admission rejected for {stage} ({file_size} bytes): {e.detail}")
+            raise
+        return AdmissionTicket(acquired)
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,188 @@
+import math
+import re
+from collections import Counter
+from datetime import date, datetime, time, timezone
+from typing import Any, Dict, List, Optional
+from app.config import settings
+
+# One pass over the extracted rows (at most PROFILE_MAX_ROWS of them, evenly spaced through the file)
+# producing, per column: the dominant value type, null ratio, distinct count, the share of values
+# matching each VALUE_CLASSES pattern, min/max and a few diverse sample values. The mapping prompt
+# uses it instead of a single raw row, which is often blank or unrepresentative.
+
+VALUE_CLASSES = (
+    ('email', re.compile(r"^[^@\s]+@[^@\s]+\.[A-Za-z]{2,}$")),
+    # Indian GST identification number: state code, PAN, entity number, 'Z', checksum
+    ('gstin', re.compile(r"^\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z]$")),
+    ('date', re.compile(
+        r"^(\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}"
+        r"|\d{1,2}[ -][A-Za-z]{3,9}[ -,]+\d{2,4}|[A-Za-z]{3,9} \d{1,2},? \d{4})"
+        r"([ T]\d{1,2}:\d{2}(:\d{2})?)?$"
+    )),
+    ('amount', re.compile(r"^[-+]?[$€£₹]\s?[\d,]*\d(\.\d+)?$|^[-+]?[\d,]*\d(\.\d+)?\s?(USD|EUR|GBP|INR)$", re.IGNORECASE)),
+    ('number', re.compile(r"^[-+]?(\d{1,3}(,\d{3})+|\d+)(\.\d+)?$|^[-+]?\.\d+$")),
+    ('phone', re.compile(r"^\+?[\d\s\-().]{7,20}$")),
+)
+NULL_STRINGS = {'', 'nan', 'none', 'null', 'n/a', 'na', '-'}
+MAX_TRACKED_DISTINCT = 1000
+SAMPLE_CANDIDATES = 50
+
+
+def is_null(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float):
+        return math.isnan(value)
+    if isinstance(value, str):
+        return value.strip().lower() in NULL_STRINGS
+    # pandas NaT
+    return value != value
+
+
+def classify(value: Any) -> str:
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if isinstance(value, (datetime, date)):
+        return 'date'
+    text = str(value).strip()
+    for name, pattern in VALUE_CLASSES:
+        if pattern.match(text):
+            if name == 'phone' and sum(ch.isdigit() for ch in text) < 7:
+                continue
+            return name
+    return 'text'
+
+
+class ColumnStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.classes: Counter = Counter()
+        self.distinct: set = set()
+        self.distinct_capped = False
+        self.candidates: List[Any] = []
+        # Separate ranges: object-dtype columns mix numbers and dates, which do not compare
+        self.ranges: Dict[str, List[Any]] = {}
+        self.max_length = 0
+
+    def add(self, value: Any):
+        self.count += 1
+        if is_null(value):
+            self.nulls += 1
+            return
+        value_class = classify(value)
+        self.classes[value_class] += 1
+
+        key = value if isinstance(value, (int, float, str, bool)) else str(value)
+        if key not in self.distinct:
+            if len(self.distinct) < MAX_TRACKED_DISTINCT:
+                self.distinct.add(key)
+                if len(self.candidates) < SAMPLE_CANDIDATES:
+                    self.candidates.append(value)
+            else:
+                self.distinct_capped = True
+
+        if value_class == 'number' and isinstance(value, (int, float)) and not isinstance(value, bool):
+            comparable = value
+        elif value_class == 'date' and isinstance(value, (datetime, date)):
+            comparable = _as_naive_datetime(value)
+        else:
+            self.max_length = max(self.max_length, len(str(value)))
+            return
+        value_range = self.ranges.get(value_class)
+        if value_range is None:
+            self.ranges[value_class] = [comparable, comparable]
+        elif comparable < value_range[0]:
+            value_range[0] = comparable
+        elif comparable > value_range[1]:
+            value_range[1] = comparable
+
+    def samples(self, limit: int) -> List[Any]:
+        # Spread across the distinct values seen, preferring different value classes and lengths,
+        # so one odd leading row does not stand for the whole column
+        chosen: List[Any] = []
+        seen_shapes = set()
+        for value in self.candidates:
+            shape = (classify(value), min(len(str(value)) // 8, 4))
+            if shape not in seen_shapes:
+                seen_shapes.add(shape)
+                chosen.append(value)
+            if len(chosen) == limit:
+                return chosen
+        step = max(1, len(self.candidates) // max(1, limit))
+        for value in self.candidates[::step]:
+            if len(chosen) == limit:
+                break
+            if value not in chosen:
+                chosen.append(value)
+        return chosen
+
+    def as_dict(self, samples_per_column: int, max_chars: int) -> Dict[str, Any]:
+        non_null = self.count - self.nulls
+        dominant = self.classes.most_common(1)[0][0] if self.classes else 'empty'
+        profile: Dict[str, Any] = {
+            'type': dominant,
+            'null_ratio': round(self.nulls / self.count, 3) if self.count else 0.0,
+            'distinct': len(self.distinct),
+        }
+        if self.distinct_capped:
+            profile['distinct_capped'] = True
+        if non_null and len(self.classes) > 1:
+            profile['classes'] = {name: round(count / non_null, 2) for name, count in self.classes.most_common(3)}
+        # The range of the dominant class, else of whichever class has one
+        value_range = self.ranges.get(dominant) or next(iter(self.ranges.values()), None)
+        if value_range is not None:
+            profile['min'] = _jsonable(value_range[0])
+            profile['max'] = _jsonable(value_range[1])
+        elif self.max_length:
+            profile['max_length'] = self.max_length
+        profile['samples'] = [_clip(_jsonable(value), max_chars) for value in self.samples(samples_per_column)]
+        return profile
+
+
+def _as_naive_datetime(value: date) -> datetime:
+    # Dates become midnight and aware datetimes UTC, so every date in a column compares
+    if not isinstance(value, datetime):
+        return datetime.combine(value, time.min)
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value if isinstance(value, (int, float, str, bool)) else str(value)
+
+
+def _clip(value: Any, max_chars: int) -> Any:
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars - 1] + "…"
+    return value
+
+
+def profile_columns(columns: List[str], rows: List[Dict[str, Any]], max_rows: Optional[int] = None,
+                    samples_per_column: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    max_rows = max_rows or settings.PROFILE_MAX_ROWS
+    samples_per_column = samples_per_column or settings.PROFILE_SAMPLES_PER_COLUMN
+    stats = {column: ColumnStats(column) for column in columns}
+
+    # Evenly spaced rows rather than the first max_rows, so later sections of the file count too
+    step = max(1, math.ceil(len(rows) / max_rows)) if rows else 1
+    for row in rows[::step]:
+        for column, column_stats in stats.items():
+            column_stats.add(row.get(column))
+
+    profiles = {column: column_stats.as_dict(samples_per_column, settings.LLM_SAMPLE_VALUE_MAX_CHARS)
+                for column, column_stats in stats.items()}
+    return profiles
+
+
+def profile_summary(profiles: Dict[str, Dict[str, Any]]) -> str:
+    # Log-friendly one-liner: column=type(null%)
+    return ", ".join(f"{column}={profile['type']}({profile['null_ratio']:.0%} null)" for column, profile in profiles.items())
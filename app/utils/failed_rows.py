@@ -0,0 +1,37 @@
+from typing import Any, Dict, Optional
+from app.config import settings
+
+# Failed rows of an upload as stored in fileupload.failed_rows: each distinct reason once, and per row
+# its 0-based index in the extracted rows plus the position of its reason. Reasons come from
+# failure_reason() and carry no row values, so rows failing the same way share one and this stays
+# small even when most of a large file fails. Per-row details go to the processing log instead:
+# {"reasons": ["invoice.issue_date: not a date", "IntegrityError (UniqueViolation)"], "rows": [[17, 0], [42, 0], [90, 1]]}
+
+
+def failure_reason(error: BaseException) -> str:
+    # The coercion problem and its column, or the exception class (and the driver's, for database errors)
+    reason = getattr(error, 'reason', None)
+    if isinstance(reason, str):
+        return reason
+    original = getattr(error, 'orig', None)
+    if original is not None:
+        return f"{type(error).__name__} ({type(original).__name__})"
+    return type(error).__name__
+
+
+def pack_failed_rows(failures: Dict[int, str]) -> Optional[Dict[str, Any]]:
+    if not failures:
+        return None
+    reasons: Dict[str, int] = {}
+    rows = []
+    for row_index in sorted(failures):
+        reason = failures[row_index][:settings.FAILED_ROW_REASON_MAX_CHARS]
+        rows.append([row_index, reasons.setdefault(reason, len(reasons))])
+    return {'reasons': list(reasons), 'rows': rows}
+
+
+def unpack_failed_rows(packed: Optional[Dict[str, Any]]) -> Dict[int, str]:
+    if not packed:
+        return {}
+    reasons = packed['reasons']
+    return {row_index: reasons[reason] for row_index, reason in packed['rows']}
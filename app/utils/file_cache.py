@@ -0,0 +1,142 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+from app.utils.logger import app_logger
+from app.utils.singleflight import SingleFlight
+
+_ENTRY_NAME = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9]+)?$")
+# Fills lost to eviction by concurrent fills before the caller could open them
+_MAX_FILL_ATTEMPTS = 3
+
+
+class LocalFileCache:
+    # Content-addressed: an entry is named by the SHA-256 of its bytes, so it can never go stale.
+    # Entries are handed out as open files, opened under the lock, so eviction cannot unlink an
+    # entry between a lookup and its reader opening it
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._single_flight = SingleFlight()
+        self._load_existing_entries()
+
+    def _load_existing_entries(self):
+        entries = []
+        for path in self.cache_dir.iterdir():
+            if path.is_file() and _ENTRY_NAME.match(path.name):
+                stat = path.stat()
+                entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._evict()
+
+    def entry_name(self, digest: str, suffix: str = "") -> str:
+        return digest + suffix.lower()
+
+    def contains(self, digest: str, suffix: str = "") -> bool:
+        with self._lock:
+            return self.entry_name(digest, suffix) in self._entries
+
+    def open(self, digest: str, suffix: str = "") -> Optional[BinaryIO]:
+        name = self.entry_name(digest, suffix)
+        path = self.cache_dir / name
+        with self._lock:
+            if name not in self._entries:
+                return None
+            try:
+                file = open(path, 'rb')
+            except FileNotFoundError:
+                self._forget(name)
+                return None
+            self._entries.move_to_end(name)
+        try:
+            # mtime carries the LRU order across restarts
+            os.utime(path)
+        except OSError:
+            pass
+        return file
+
+    def open_or_fetch(self, digest: str, suffix: str, fetch: Callable[[], bytes]) -> BinaryIO:
+        name = self.entry_name(digest, suffix)
+
+        def fill():
+            # A previous leader may have filled the entry while this caller was queued
+            if self.contains(digest, suffix):
+                return
+            content = fetch()
+            if hashlib.sha256(content).hexdigest() != digest:
+                raise ValueError(f"Fetched content does not match its digest {digest}")
+            self.put(digest, suffix, content)
+
+        for _ in range(_MAX_FILL_ATTEMPTS):
+            file = self.open(digest, suffix)
+            if file is not None:
+                return file
+            self._single_flight.do(name, fill)
+        # The cache is too small for the files in use at once; serve this one uncached
+        app_logger.warning(f"Cached file {name} was evicted before it could be read; reading it uncached")
+        return io.BytesIO(fetch())
+
+    def put(self, digest: str, suffix: str, content: bytes) -> str:
+        name = self.entry_name(digest, suffix)
+        path = self.cache_dir / name
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self._forget(name)
+            self._entries[name] = len(content)
+            self._total_bytes += len(content)
+            self._evict()
+        return str(path)
+
+    def invalidate(self, digest: str, suffix: str = ""):
+        name = self.entry_name(digest, suffix)
+        with self._lock:
+            self._forget(name)
+            try:
+                os.unlink(self.cache_dir / name)
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, name: str):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        # Called with the lock held. The most recently used entry is always kept, even when it alone
+        # exceeds the budget. Readers hold their own open handle, which outlives the unlink
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.unlink(self.cache_dir / name)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                app_logger.warning(f"Could not remove evicted cached file {name}: {e}")
+            app_logger.debug(f"Evicted cached file {name} ({size} bytes)")
+
+
+@lru_cache(maxsize=None)
+def get_file_cache(cache_dir: str, max_bytes: int) -> LocalFileCache:
+    return LocalFileCache(cache_dir, max_bytes)
@@ -1,141 +1,185 @@
-import os
-from pathlib import Path
-import aiofiles
-from typing import  Dict, Any, List
-import PyPDF2
-import openpyxl
-import pandas as pd
-from docx import Document
-from pathlib import Path
+from typing import  Dict, Any, List, BinaryIO
 from app.config import settings
 from app.utils.logger import app_logger
-from supabase import create_client, Client
+from app.utils.tracing import traced
+from app.utils.startup_report import lazy_import
+from app.utils.storage_backends import StorageBackend, get_storage_backend
 
 class FileProcessor:
-    def __init__(self):
-        self.upload_dir = Path(settings.UPLOAD_DIR)
-        self.upload_dir.mkdir(exist_ok=True)
-        self.cloud_dir = Path(settings.CLOUD_UPLOAD_DIR)
-        self.cloud_dir.mkdir(exist_ok=True)
-        self.supabase_client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    def storage_for(self, storage_location: str) -> StorageBackend:
+        return get_storage_backend(storage_location)
 
+    @traced(record_args=('filename',))
     async def save_file(self, file_content: bytes, filename: str) -> str:
         try:
-            file_path = self.upload_dir / filename
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(file_content)
+            file_path = await self.storage_for('local').put_if_absent(filename, file_content)
             app_logger.info(f"Saved file: {filename}")
-            return str(file_path)
+            return file_path
         except Exception as e:
             app_logger.error(f"Error saving file {filename}: {str(e)}")
             raise
     
+    @traced(record_args=('filename',))
     async def save_file_to_cloud(self, file_content: bytes, filename: str) -> str:
         try:
-            self.supabase_client.storage.from_('uploaded-files').upload(filename, file_content)
+            object_key = await self.storage_for('cloud').put_if_absent(filename, file_content)
             app_logger.info(f"Saved file to cloud: {filename}")
-            return filename
+            return object_key
         except Exception as e:
             app_logger.error(f"Error saving file to cloud {filename}: {str(e)}")
             raise
 
-    def download_file_from_cloud(self, filename: str) -> str:
+    @traced(record_args=('storage_location',))
+    async def open_stored_file(self, file_path_or_name: str, storage_location: str) -> BinaryIO:
         try:
-            response = self.supabase_client.storage.from_('uploaded-files').download(filename)
-            file_content = response
-            file_path = Path(self.cloud_dir) / Path(filename).name
-            with open(file_path, 'wb') as f:
-                f.write(file_content)
-            app_logger.info(f"Downloaded file from cloud: {filename}")
-            return str(file_path)
+            return await self.storage_for(storage_location).open(file_path_or_name)
         except Exception as e:
-            app_logger.error(f"Error downloading file from cloud {filename}: {str(e)}")
+            app_logger.error(f"Error opening {storage_location} file {file_path_or_name}: {str(e)}")
             raise
 
-    def extract_text_from_pdf(self, file_path_or_name: str, storage_location: str) -> str:
+    @traced(record_args=('file_name',))
+    def extract_text_from_pdf(self, file: BinaryIO, file_name: str) -> str:
         try:
-            if storage_location == 'cloud':
-                file_path_or_name = self.download_file_from_cloud(file_path_or_name)
-                
-            text = ""
-            with open(file_path_or_name, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-            app_logger.info(f"Extracted text from PDF: {file_path_or_name}")
+            PyPDF2 = lazy_import("PyPDF2")
+            reader = PyPDF2.PdfReader(file)
+            # Form feed between pages, so running headers and footers can be recognised per page
+            text = "\f".join(page.extract_text() for page in reader.pages)
+            app_logger.info(f"Extracted text from PDF: {file_name}")
             return text
         except Exception as e:
-            app_logger.error(f"Error extracting text from PDF {file_path_or_name}: {str(e)}")
+            app_logger.error(f"Error extracting text from PDF {file_name}: {str(e)}")
             raise
 
-    def extract_text_from_docx(self, file_path_or_name: str, storage_location: str) -> str:
+    def _docx_table_rows(self, table) -> List[List[str]]:
+        # Since python-docx 1.2 Row.cells is built from the row itself (it used to rebuild the whole
+        # table's grid per row); merged cells repeat their text
+        rows = []
+        for row in table.rows:
+            cells = [cell.text.strip() for cell in row.cells]
+            if any(cells):
+                rows.append(cells)
+        return rows
+
+    def _docx_header(self, cells: List[str]) -> List[str]:
+        header = []
+        for idx, cell in enumerate(cells, 1):
+            name = cell or f"column_{idx}"
+            if name in header:
+                name = f"{name}_{idx}"
+            header.append(name)
+        return header
+
+    def iter_docx_blocks(self, doc):
+        Table = lazy_import("docx.table").Table
+        for block in doc.iter_inner_content():
+            if isinstance(block, Table):
+                yield 'table', block
+            else:
+                text = block.text.strip()
+                if text:
+                    yield 'paragraph', text
+
+    @traced(record_args=('file_name',))
+    def extract_data_from_docx(self, file: BinaryIO, file_name: str) -> Dict[str, Any]:
         try:
-            if storage_location == 'cloud':
-                file_path_or_name = self.download_file_from_cloud(file_path_or_name)
-                
-            doc = Document(file_path_or_name)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            app_logger.info(f"Extracted text from DOCX: {file_path_or_name}")
-            return text
+            doc = lazy_import("docx").Document(file)
+            tables: Dict[tuple, List[Dict[str, Any]]] = {}
+            paragraphs = []
+            for kind, block in self.iter_docx_blocks(doc):
+                if kind == 'paragraph':
+                    paragraphs.append(block)
+                    continue
+
+                cells = self._docx_table_rows(block)
+                if len(cells) < 2 or len(cells[0]) < 2:
+                    # Single-row or single-column tables are layout, not line items
+                    paragraphs.extend(" | ".join(row) for row in cells)
+                    continue
+
+                header = tuple(self._docx_header(cells[0]))
+                rows = tables.setdefault(header, [])
+                for row in cells[1:]:
+                    if row == cells[0]:
+                        # Header row repeated on a page break
+                        continue
+                    rows.append(dict(zip(header, row)))
+
+            if not tables:
+                text = "\n".join(paragraphs)
+                app_logger.info(f"Extracted text from DOCX: {file_name}")
+                return {'columns': [], 'rows': [], 'total_rows': 0, 'context': text}
+
+            # Tables sharing a header are one table split across pages; the largest is the line items
+            header, rows = max(tables.items(), key=lambda item: len(item[1]))
+            skipped_tables = [
+                {'columns': list(other_header), 'rows': len(other_rows)}
+                for other_header, other_rows in tables.items() if other_header != header
+            ]
+            if skipped_tables:
+                app_logger.warning(f"Skipped {len(skipped_tables)} other tables in DOCX {file_name}: {skipped_tables}")
+            context = ""
+            for paragraph in paragraphs:
+                if len(context) + len(paragraph) > settings.DOCX_CONTEXT_MAX_CHARS:
+                    break
+                context += paragraph + "\n"
+
+            data = {
+                'columns': list(header),
+                'rows': rows,
+                'total_rows': len(rows),
+                'context': context,
+                'skipped_tables': skipped_tables
+            }
+            app_logger.info(f"Extracted table data from DOCX: {file_name} ({len(rows)} rows)")
+            return data
         except Exception as e:
-            app_logger.error(f"Error extracting text from DOCX {file_path_or_name}: {str(e)}")
+            app_logger.error(f"Error extracting data from DOCX {file_name}: {str(e)}")
             raise
     
-    def extract_data_from_csv(self, file_path_or_name: str, storage_location: str) -> Dict[str, Any]:
+    @traced(record_args=('file_name',))
+    def extract_data_from_csv(self, file: BinaryIO, file_name: str) -> Dict[str, Any]:
         try:
-            if storage_location == 'cloud':
-                file_path_or_name = self.download_file_from_cloud(file_path_or_name)
-
-            df = pd.read_csv(file_path_or_name)
+            pd = lazy_import("pandas")
+            df = pd.read_csv(file)
             data = {
                 'columns': df.columns.tolist(),
                 'rows': df.to_dict('records'),
                 'total_rows': len(df)
             }
-            app_logger.info(f"Extracted data from CSV: {file_path_or_name} ({len(df)} rows)")
+            app_logger.info(f"Extracted data from CSV: {file_name} ({len(df)} rows)")
             return data
         except Exception as e:
-            app_logger.error(f"Error extracting data from CSV {file_path_or_name}: {str(e)}")
+            app_logger.error(f"Error extracting data from CSV {file_name}: {str(e)}")
             raise
     
-    def extract_data_from_excel(self, file_path_or_name: str, storage_location: str) -> Dict[str, Any]:
+    @traced(record_args=('file_name',))
+    def extract_data_from_excel(self, file: BinaryIO, file_name: str) -> Dict[str, Any]:
         try:
-            if storage_location == 'cloud':
-                file_path_or_name = self.download_file_from_cloud(file_path_or_name)
-
-            df = pd.read_excel(file_path_or_name)
+            pd = lazy_import("pandas")
+            df = pd.read_excel(file)
             data = {
                 'columns': df.columns.tolist(),
                 'rows': df.to_dict('records'),
                 'total_rows': len(df)
             }
-            app_logger.info(f"Extracted data from Excel: {file_path_or_name} ({len(df)} rows)")
+            app_logger.info(f"Extracted data from Excel: {file_name} ({len(df)} rows)")
             return data
         except Exception as e:
-            app_logger.error(f"Error extracting data from Excel {file_path_or_name}: {str(e)}")
+            app_logger.error(f"Error extracting data from Excel {file_name}: {str(e)}")
             raise
     
-    def extract_data_from_tsv(self, file_path_or_name: str, storage_location: str) -> Dict[str, Any]:
+    @traced(record_args=('file_name',))
+    def extract_data_from_tsv(self, file: BinaryIO, file_name: str) -> Dict[str, Any]:
         try:
-            if storage_location == 'cloud':
-                file_path_or_name = self.download_file_from_cloud(file_path_or_name)
-
-            df = pd.read_csv(file_path_or_name, sep='\t')
+            pd = lazy_import("pandas")
+            df = pd.read_csv(file, sep='\t')
             data = {
                 'columns': df.columns.tolist(),
                 'rows': df.to_dict('records'),
                 'total_rows': len(df)
             }
-            app_logger.info(f"Extracted data from TSV: {file_path_or_name} ({len(df)} rows)")
+            app_logger.info(f"Extracted data from TSV: {file_name} ({len(df)} rows)")
             return data
         except Exception as e:
-            app_logger.error(f"Error extracting data from TSV {file_path_or_name}: {str(e)}")
+            app_logger.error(f"Error extracting data from TSV {file_name}: {str(e)}")
             raise
-    
-
-    
-    
-    
-    
-    
-   
\ No newline at end of file
@@ -0,0 +1,168 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Optional, TypeVar
+from fastapi import HTTPException
+from app.config import settings
+from app.utils.logger import app_logger
+from app.utils.metrics import LLM_CALL_FAILURES, LLM_CIRCUIT_STATE, LLM_HEDGED_REQUESTS, LLM_RETRIES
+
+# Resilience for the (blocking) provider calls. Each attempt runs in a thread with a timeout of
+# LLM_REQUEST_TIMEOUT_SECONDS. Once enough latencies are known, an attempt still running after the
+# LLM_HEDGE_PERCENTILE latency gets a second, hedged request and the first success wins. Failed
+# attempts are retried up to LLM_MAX_ATTEMPTS times with full-jitter exponential backoff. After
+# LLM_CIRCUIT_FAILURE_THRESHOLD consecutive failures the circuit opens and calls fail fast for
+# LLM_CIRCUIT_RESET_SECONDS; then a single probe call decides whether it closes again.
+
+T = TypeVar('T')
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+CIRCUIT_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+# Provider answers that a retry will not change
+NON_RETRYABLE_STATUS = {400, 401, 403, 404}
+
+
+class LLMUnavailable(HTTPException):
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if isinstance(error, (ValueError, TypeError)):
+        # Malformed prompts, blocked responses, programming errors
+        return False
+    return getattr(error, 'code', None) not in NON_RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        LLM_CIRCUIT_STATE.labels(name).set(CIRCUIT_STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            app_logger.warning(f"LLM circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+            LLM_CIRCUIT_STATE.labels(self.name).set(CIRCUIT_STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # One probe at a time; everyone else keeps failing fast until it reports back
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+        return self.state == CLOSED
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def retry_after(self) -> int:
+        if self.state != OPEN:
+            return 1
+        return max(1, int(self.reset_seconds - (time.monotonic() - self.opened_at)) + 1)
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int) -> Optional[float]:
+        if len(self.samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class ResilientCaller:
+    # One per provider and worker process; assumes a single event loop like the admission budgets
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name, settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RESET_SECONDS)
+        self.latencies = LatencyWindow()
+
+    async def call(self, operation: str, fn: Callable[[], T]) -> T:
+        for attempt in range(1, settings.LLM_MAX_ATTEMPTS + 1):
+            if not self.breaker.allow():
+                LLM_CALL_FAILURES.labels(operation, 'short_circuited').inc()
+                raise LLMUnavailable(f"LLM provider unavailable (circuit {self.breaker.state})",
+                                     self.breaker.retry_after())
+            try:
+                result = await self._attempt(operation, fn)
+            except asyncio.CancelledError:
+                # Let the next caller probe instead
+                self.breaker.probing = False
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # The provider answered; it is not unhealthy
+                    self.breaker.record_success()
+                    raise
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                LLM_CALL_FAILURES.labels(operation, 'timeout' if timed_out else 'error').inc()
+                self.breaker.record_failure()
+                app_logger.warning(f"LLM {operation} attempt {attempt}/{settings.LLM_MAX_ATTEMPTS} failed: "
+                                   f"{'timed out' if timed_out else repr(e)}")
+                if attempt == settings.LLM_MAX_ATTEMPTS:
+                    raise LLMUnavailable(f"LLM provider failed after {attempt} attempts",
+                                         self.breaker.retry_after()) from e
+                LLM_RETRIES.labels(operation).inc()
+                cap = settings.LLM_RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)
+                await asyncio.sleep(random.uniform(0, min(settings.LLM_RETRY_MAX_DELAY_SECONDS, cap)))
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _start(self, fn: Callable[[], T]) -> "asyncio.Task":
+        return asyncio.ensure_future(asyncio.wait_for(asyncio.to_thread(fn), settings.LLM_REQUEST_TIMEOUT_SECONDS))
+
+    async def _attempt(self, operation: str, fn: Callable[[], T]) -> Any:
+        started = time.perf_counter()
+        pending = {self._start(fn)}
+        hedge_after = None
+        if settings.LLM_HEDGE_ENABLED:
+            hedge_after = self.latencies.percentile(settings.LLM_HEDGE_PERCENTILE, settings.LLM_HEDGE_MIN_SAMPLES)
+        if hedge_after is not None:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if not done:
+                LLM_HEDGED_REQUESTS.labels(operation).inc()
+                pending.add(self._start(fn))
+
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.latencies.add(time.perf_counter() - started)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The losing request's thread runs to completion; only its result is dropped
+            for task in pending:
+                task.cancel()
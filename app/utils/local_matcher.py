@@ -0,0 +1,83 @@
+import re
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+
+# Offline column matcher: the LLM's stand-in while the provider is unavailable. A column maps to the
+# schema column whose name or alias it matches best once both are normalized, provided the score
+# reaches MIN_SCORE and the column's profiled value class (see column_profiler) does not contradict
+# the target. Each target is used at most once. Answers in the same shape as map_columns_with_llm.
+
+MIN_SCORE = 0.8
+
+ALIASES: Dict[Tuple[str, str], List[str]] = {
+    ('invoice', 'invoice_number'): ['invoice_no', 'inv_no', 'invoice_id', 'invoice', 'bill_no', 'bill_number'],
+    ('invoice', 'issue_date'): ['invoice_date', 'date', 'inv_date', 'bill_date', 'issued_on'],
+    ('invoice', 'due_date'): ['payment_due', 'due_on', 'due'],
+    ('invoice', 'total_amount'): ['total', 'invoice_total', 'grand_total', 'amount_due', 'invoice_amount'],
+    ('vendor', 'vendor_name'): ['vendor', 'supplier', 'supplier_name', 'seller', 'seller_name'],
+    ('vendor', 'email'): ['vendor_email', 'supplier_email', 'email_address'],
+    ('vendor', 'phone'): ['vendor_phone', 'supplier_phone', 'phone_number', 'contact_number'],
+    ('vendor', 'address'): ['vendor_address', 'supplier_address'],
+    ('invoiceitem', 'description'): ['item', 'item_description', 'product', 'product_name', 'item_name'],
+    ('invoiceitem', 'quantity'): ['qty', 'units', 'item_quantity'],
+    ('invoiceitem', 'unit_price'): ['price', 'rate', 'unit_cost', 'price_per_unit'],
+    ('invoiceitem', 'total_price'): ['line_total', 'amount', 'item_total', 'line_amount'],
+    ('customer', 'customer_name'): ['customer', 'client', 'client_name', 'buyer', 'bill_to'],
+    ('customer', 'customer_email'): ['client_email', 'buyer_email'],
+    ('customer', 'customer_phone'): ['client_phone', 'buyer_phone'],
+    ('customer', 'customer_address'): ['client_address', 'billing_address', 'buyer_address'],
+    ('payment', 'payment_date'): ['paid_on', 'paid_date', 'date_paid'],
+    ('payment', 'amount_paid'): ['paid', 'paid_amount', 'payment_amount'],
+    ('payment', 'payment_method'): ['payment_mode', 'paid_via', 'method'],
+}
+
+# Profiled value class -> schema types it can fill; classes not listed fit any type
+COMPATIBLE_TYPES = {
+    'email': {'String', 'Text'},
+    'phone': {'String', 'Text'},
+    'date': {'Date', 'String'},
+    'number': {'Integer', 'DECIMAL', 'Float', 'String'},
+    'amount': {'DECIMAL', 'Float', 'String'},
+}
+NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(name: str) -> str:
+    return NON_WORD.sub("_", str(name).lower()).strip("_")
+
+
+def _score(column: str, table: str, target: str) -> float:
+    names = [target, f"{table}_{target}"] + ALIASES.get((table, target), [])
+    if column in names:
+        return 1.0
+    return max(SequenceMatcher(None, column, name).ratio() for name in names)
+
+
+def match_columns(columns: List[str], schema: Dict[str, Dict[str, str]],
+                  column_profiles: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    column_profiles = column_profiles or {}
+    candidates = []
+    for column in columns:
+        normalized = normalize(column)
+        value_class = column_profiles.get(column, {}).get('type')
+        for table, table_columns in schema.items():
+            for target, column_type in table_columns.items():
+                allowed = COMPATIBLE_TYPES.get(value_class)
+                if allowed and column_type not in allowed:
+                    continue
+                score = _score(normalized, table, target)
+                if score >= MIN_SCORE:
+                    candidates.append((score, column, table, target))
+
+    mappings, used_columns, used_targets = [], set(), set()
+    for score, column, table, target in sorted(candidates, key=lambda candidate: -candidate[0]):
+        if column in used_columns or (table, target) in used_targets:
+            continue
+        used_columns.add(column)
+        used_targets.add((table, target))
+        mappings.append({'source_field': column, 'target_table': table, 'target_column': target})
+
+    # Keep the file's column order
+    order = {column: index for index, column in enumerate(columns)}
+    mappings.sort(key=lambda mapping: order[mapping['source_field']])
+    return {'mappings': mappings, 'unmapped_fields': [column for column in columns if column not in used_columns]}
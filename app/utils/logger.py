@@ -1,26 +1,122 @@
 from loguru import logger
+import json
 import sys
+import time
+import traceback
+from typing import Optional
 from app.config import settings
 
+TEXT_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}"
+COLOR_FORMAT = "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+
+_configured = False
+
+
+def _json_format(record) -> str:
+    payload = {
+        'time': record['time'].isoformat(),
+        'level': record['level'].name,
+        'logger': record['name'],
+        'function': record['function'],
+        'line': record['line'],
+        'message': record['message']
+    }
+    extra = {key: value for key, value in record['extra'].items() if key != '_json'}
+    if extra:
+        payload['extra'] = extra
+    if record['exception'] is not None:
+        error_type, error, error_traceback = record['exception']
+        payload['exception'] = "".join(traceback.format_exception(error_type, error, error_traceback))
+    # Loguru formats the returned template again, so the JSON travels through extra unescaped
+    record['extra']['_json'] = json.dumps(payload, default=str)
+    return "{extra[_json]}\n"
+
+
+def _level_filter():
+    # Module prefixes map to their own minimum level; everything else uses LOG_LEVEL
+    levels = {"": settings.LOG_LEVEL.upper()}
+    levels.update({module: level.upper() for module, level in settings.LOG_MODULE_LEVELS.items()})
+    lowest = min(levels.values(), key=lambda name: logger.level(name).no)
+    return levels, lowest
+
+
 def setup_logger():
+    global _configured
+    if _configured:
+        return logger
+    _configured = True
+
     logger.remove()
-    
+    levels, lowest = _level_filter()
+    as_json = settings.LOG_FORMAT == "json"
+
     logger.add(
         sys.stdout,
-        level=settings.LOG_LEVEL,
-        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-        colorize=True
+        level=lowest,
+        filter=levels,
+        format=_json_format if as_json else COLOR_FORMAT,
+        colorize=not as_json,
+        enqueue=settings.LOG_ENQUEUE
     )
-    
+
     logger.add(
         settings.LOG_FILE,
-        level=settings.LOG_LEVEL,
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
+        level=lowest,
+        filter=levels,
+        format=_json_format if as_json else TEXT_FORMAT,
         rotation="10 MB",
         retention="30 days",
-        compression="zip"
+        compression="zip",
+        enqueue=settings.LOG_ENQUEUE
     )
-    
+
     return logger
 
-app_logger = setup_logger()
\ No newline at end of file
+app_logger = setup_logger()
+
+
+# Aggregated progress for row-by-row work: one line every LOG_PROGRESS_EVERY rows or
+# LOG_PROGRESS_INTERVAL_SECONDS, the first LOG_MAX_RECORD_ERRORS failures in full and a count of the rest.
+# Lines are attributed to the caller (opt(depth=...)) so per-module levels apply to them
+class BatchProgress:
+    def __init__(self, label: str, total: int, every: Optional[int] = None, interval: Optional[float] = None,
+                 max_errors: Optional[int] = None):
+        self.label = label
+        self.total = total
+        self.every = every or settings.LOG_PROGRESS_EVERY
+        self.interval = interval if interval is not None else settings.LOG_PROGRESS_INTERVAL_SECONDS
+        self.max_errors = max_errors if max_errors is not None else settings.LOG_MAX_RECORD_ERRORS
+        self.done = 0
+        self.failed = 0
+        self.suppressed_errors = 0
+        self.started = self.last_report = time.monotonic()
+
+    def record(self, success: bool, error: Optional[str] = None):
+        self.done += 1
+        if not success:
+            self.failed += 1
+            if error:
+                if self.failed <= self.max_errors:
+                    app_logger.opt(depth=1).error(error)
+                else:
+                    self.suppressed_errors += 1
+
+        if self.done % self.every == 0 or self.done == self.total:
+            self.report(depth=2)
+        elif self.interval and self.done % 64 == 0 and time.monotonic() - self.last_report >= self.interval:
+            self.report(depth=2)
+
+    def report(self, depth: int = 1):
+        now = time.monotonic()
+        self.last_report = now
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        app_logger.opt(depth=depth).info(f"{self.label}: {self.done}/{self.total} records "
+                        f"({self.done - self.failed} ok, {self.failed} failed, {rate:.0f} rows/s)")
+
+    def finish(self):
+        if self.done % self.every != 0 and self.done != self.total:
+            self.report(depth=2)
+        if self.suppressed_errors:
+            app_logger.opt(depth=1).warning(f"{self.label}: {self.suppressed_errors} further record errors not logged "
+                               f"(LOG_MAX_RECORD_ERRORS={self.max_errors})")
@@ -0,0 +1,84 @@
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.config import settings
+from app.utils.local_matcher import normalize
+
+# Process-wide index of what users confirmed in /confirm-mappings: normalized header -> target ->
+# (times confirmed, last confirmed). A header is answered from memory when its best target holds at
+# least MAPPING_MEMORY_MIN_SHARE of the header's recency-weighted confirmations; a confirmation
+# counts half as much every MAPPING_MEMORY_HALF_LIFE_DAYS, so corrections win over stale habits.
+# The index is rebuilt from mapping_memory every MAPPING_MEMORY_REFRESH_SECONDS to pick up
+# confirmations made by other workers.
+
+# "Invoice No (String)": the LLM's naming format carries the datatype; SchemaRegistry.canonical_mappings
+# drops it before mappings reach the memory
+TYPE_SUFFIX = re.compile(r"\s*\([A-Za-z ]+\)\s*$")
+
+Target = Tuple[str, str]
+
+
+def source_key(source_field: str) -> str:
+    # source_field is a raw header, so "Amount (USD)" and "Amount (EUR)" stay apart
+    return normalize(str(source_field))[:255]
+
+
+def strip_type(name: str) -> str:
+    return TYPE_SUFFIX.sub("", str(name)).strip()
+
+
+class MappingMemory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[Target, Tuple[int, datetime]]] = {}
+        self.loaded_at: Optional[float] = None
+
+    def needs_refresh(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at >= settings.MAPPING_MEMORY_REFRESH_SECONDS
+
+    def replace(self, rows: Iterable[Tuple[str, str, str, int, datetime]]):
+        entries: Dict[str, Dict[Target, Tuple[int, datetime]]] = {}
+        for key, table, column, count, last_confirmed_at in rows:
+            entries.setdefault(key, {})[(table, column)] = (count, last_confirmed_at)
+        with self._lock:
+            self._entries = entries
+            self.loaded_at = time.monotonic()
+
+    def record(self, source_field: str, table: str, column: str, when: Optional[datetime] = None):
+        key = source_key(source_field)
+        target = (strip_type(table), strip_type(column))
+        with self._lock:
+            count, _ = self._entries.setdefault(key, {}).get(target, (0, None))
+            self._entries[key][target] = (count + 1, when or datetime.now())
+
+    def lookup(self, source_field: str, now: Optional[datetime] = None) -> Optional[Target]:
+        targets = self._entries.get(source_key(source_field))
+        if not targets:
+            return None
+        now = now or datetime.now()
+        half_life = settings.MAPPING_MEMORY_HALF_LIFE_DAYS * 86400
+        scores = {
+            target: count * 0.5 ** (max(0.0, (now - last_confirmed_at).total_seconds()) / half_life)
+            for target, (count, last_confirmed_at) in list(targets.items())
+        }
+        best = max(scores, key=scores.get)
+        if scores[best] < settings.MAPPING_MEMORY_MIN_SHARE * sum(scores.values()):
+            return None
+        return best
+
+    def lookup_all(self, columns: List[str]) -> Dict[str, Target]:
+        now = datetime.now()
+        remembered = {}
+        for column in columns:
+            target = self.lookup(column, now)
+            if target is not None:
+                remembered[column] = target
+        return remembered
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+mapping_memory = MappingMemory()
@@ -0,0 +1,144 @@
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+
+# Process-wide Prometheus metrics, scraped from GET /metrics
+
+DB_POOL_CHECKOUT_WAIT_SECONDS = Histogram(
+    'db_pool_checkout_wait_seconds',
+    "Time spent waiting for a pooled database connection, including connects",
+    ['engine'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts_total',
+    "Checkouts that gave up after DB_POOL_TIMEOUT",
+    ['engine']
+)
+
+DB_POOL_PINGS = Counter(
+    'db_pool_pings_total',
+    "Liveness pings issued on checkout, by outcome",
+    ['engine', 'outcome']
+)
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+PIPELINE_STAGE_SECONDS = Histogram(
+    'pipeline_stage_seconds',
+    "Duration of one stage of an upload pipeline",
+    ['pipeline', 'stage', 'file_type'],
+    buckets=STAGE_BUCKETS
+)
+
+PIPELINE_DURATION_SECONDS = Histogram(
+    'pipeline_duration_seconds',
+    "End-to-end duration of an upload pipeline",
+    ['pipeline', 'file_type'],
+    buckets=STAGE_BUCKETS
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    'admission_in_flight',
+    "Requests holding a slot of an admission budget",
+    ['budget']
+)
+
+ADMISSION_WAITING = Gauge(
+    'admission_waiting',
+    "Requests queued for a slot of an admission budget",
+    ['budget']
+)
+
+ADMISSION_WAIT_SECONDS = Histogram(
+    'admission_wait_seconds',
+    "Time spent queued before admission",
+    ['budget'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+ADMISSION_REJECTED = Counter(
+    'admission_rejected_total',
+    "Requests turned away by admission control (queue_full: 429, timeout: 503)",
+    ['budget', 'reason']
+)
+
+PROFILES_CAPTURED = Counter(
+    'request_profiles_captured_total',
+    "Requests run under the sampling profiler",
+    ['pipeline']
+)
+
+PROFILES_SKIPPED = Counter(
+    'request_profiles_skipped_total',
+    "Profiling requests not honoured (limit: PROFILING_MAX_CONCURRENT reached, unauthorized: bad token)",
+    ['pipeline', 'reason']
+)
+
+LLM_TOKENS = Counter(
+    'llm_tokens_total',
+    "LLM tokens by operation and kind (prompt, completion); provider counts when reported, else estimated",
+    ['operation', 'kind']
+)
+
+LLM_PROMPTS_TRUNCATED = Counter(
+    'llm_prompts_truncated_total',
+    "Prompts trimmed to fit their token budget",
+    ['operation']
+)
+
+LLM_CALLS_COLLAPSED = Counter(
+    'llm_calls_collapsed_total',
+    "LLM calls answered without reaching the provider (coalesced: joined an identical call in flight, cached: recent identical result)",
+    ['operation', 'reason']
+)
+
+LLM_RETRIES = Counter(
+    'llm_retries_total',
+    "LLM attempts retried after a timeout or provider error",
+    ['operation']
+)
+
+LLM_HEDGED_REQUESTS = Counter(
+    'llm_hedged_requests_total',
+    "Second requests sent because an attempt outlived LLM_HEDGE_PERCENTILE",
+    ['operation']
+)
+
+LLM_CALL_FAILURES = Counter(
+    'llm_call_failures_total',
+    "Failed LLM attempts (timeout, error) and calls refused by the open circuit (short_circuited)",
+    ['operation', 'reason']
+)
+
+LLM_CIRCUIT_STATE = Gauge(
+    'llm_circuit_state',
+    "LLM circuit breaker state: 0 closed, 1 half-open, 2 open",
+    ['provider']
+)
+
+LLM_LOCAL_FALLBACKS = Counter(
+    'llm_local_fallbacks_total',
+    "Mapping calls answered by the local matcher because the LLM was unavailable",
+    ['operation']
+)
+
+MAPPING_MEMORY_LOOKUPS = Counter(
+    'mapping_memory_lookups_total',
+    "Extracted columns looked up in the mapping memory, by outcome (hit, miss)",
+    ['outcome']
+)
+
+TRACE_SPANS_EXPORTED = Counter(
+    'trace_spans_exported_total',
+    "Spans handed to the trace exporter"
+)
+
+TRACE_SPANS_DROPPED = Counter(
+    'trace_spans_dropped_total',
+    "Spans lost (queue_full: export queue at TRACING_MAX_QUEUE_SIZE, export_failed: exporter error)",
+    ['reason']
+)
+
+
+def render_latest():
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
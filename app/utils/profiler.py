@@ -0,0 +1,256 @@
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional
+from app.config import settings
+from app.utils.logger import app_logger
+from app.utils.metrics import PROFILES_CAPTURED, PROFILES_SKIPPED
+
+# On-demand sampling profiler for single requests. A background thread snapshots every thread's
+# stack (sys._current_frames) each PROFILING_SAMPLE_INTERVAL_SECONDS and counts identical stacks.
+# The result is written as folded stacks (flamegraph.pl, speedscope, inferno) plus a JSON summary
+# of the hottest functions, under PROFILING_DIR/<file_upload_id>/. Sampling sees the whole worker
+# process, so other requests running at the same time show up too; PROFILING_MAX_CONCURRENT
+# keeps that to a minimum.
+
+# Leaf frames of threads parked waiting for work; they say nothing about where time went
+IDLE_FRAMES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+    ('connection.py', '_recv'),
+}
+
+ARTIFACT_NAME = re.compile(r'^[\w.-]+\.(folded|json)$')
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    for prefix in (os.getcwd() + os.sep, sys.prefix + os.sep):
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    # ';' separates frames in folded output (the count follows the last space)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+
+
+class SamplingProfiler(threading.Thread):
+    def __init__(self, interval: float, max_seconds: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.truncated = False
+        self.stopped = threading.Event()
+        self.thread_names: Dict[int, str] = {}
+
+    def thread_name(self, ident: int) -> str:
+        if ident not in self.thread_names:
+            self.thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        return self.thread_names.get(ident, f"thread-{ident}").replace(';', ':')
+
+    def sample(self, own_ident: int):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            labels = []
+            while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            labels.append(self.thread_name(ident))
+            self.stacks[';'.join(reversed(labels))] += 1
+        self.samples += 1
+
+    def run(self):
+        own_ident = threading.get_ident()
+        deadline = time.perf_counter() + self.max_seconds
+        while not self.stopped.wait(self.interval):
+            if time.perf_counter() > deadline:
+                self.truncated = True
+                return
+            self.sample(own_ident)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class ProfileSession:
+    def __init__(self, pipeline: str, trigger: str):
+        self.pipeline = pipeline
+        self.trigger = trigger
+        self.file_upload_id: Optional[int] = None
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.profiler = SamplingProfiler(settings.PROFILING_SAMPLE_INTERVAL_SECONDS, settings.PROFILING_MAX_SECONDS)
+        self.profiler.start()
+
+    def summary(self, duration: float) -> Dict[str, Any]:
+        # Self samples count the leaf frame; total samples count every frame on the stack once
+        self_samples: Counter = Counter()
+        total_samples: Counter = Counter()
+        for stack, count in self.profiler.stacks.items():
+            frames = stack.split(';')[1:]
+            if frames:
+                self_samples[frames[-1]] += count
+            for frame in set(frames):
+                total_samples[frame] += count
+
+        return {
+            'pipeline': self.pipeline,
+            'file_upload_id': self.file_upload_id,
+            'trigger': self.trigger,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(duration * 1000, 2),
+            'interval_ms': round(self.profiler.interval * 1000, 2),
+            'samples': self.profiler.samples,
+            'truncated': self.profiler.truncated,
+            'top_self': [{'frame': frame, 'samples': count} for frame, count in self_samples.most_common(30)],
+            'top_total': [{'frame': frame, 'samples': count} for frame, count in total_samples.most_common(30)]
+        }
+
+
+class RequestProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        # Requests still to be profiled without the header, set through the admin toggle
+        self.armed = 0
+
+    def authorized(self, token: Optional[str]) -> bool:
+        # Without a configured token nobody is authorized
+        if not settings.PROFILING_TOKEN or token is None:
+            return False
+        return hmac.compare_digest(token.encode(), settings.PROFILING_TOKEN.encode())
+
+    def arm(self, count: int) -> int:
+        with self.lock:
+            self.armed = max(0, count)
+            return self.armed
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'enabled': settings.PROFILING_ENABLED,
+                'active': self.active,
+                'armed': self.armed,
+                'max_concurrent': settings.PROFILING_MAX_CONCURRENT,
+                'sample_interval_seconds': settings.PROFILING_SAMPLE_INTERVAL_SECONDS
+            }
+
+    def start(self, pipeline: str, headers: Mapping[str, str]) -> Optional[ProfileSession]:
+        # Opt in per request with "X-Profile: 1" plus a matching X-Profile-Token,
+        # or for the next N requests through POST /admin/profiling/arm
+        if not settings.PROFILING_ENABLED:
+            return None
+        requested = headers.get('x-profile', '').lower() in ('1', 'true', 'yes')
+        if requested and not self.authorized(headers.get('x-profile-token')):
+            PROFILES_SKIPPED.labels(pipeline, 'unauthorized').inc()
+            requested = False
+
+        with self.lock:
+            if not requested and self.armed <= 0:
+                return None
+            if self.active >= settings.PROFILING_MAX_CONCURRENT:
+                PROFILES_SKIPPED.labels(pipeline, 'limit').inc()
+                app_logger.warning(f"Not profiling {pipeline}: {self.active} profiles already running")
+                return None
+            if not requested:
+                self.armed -= 1
+            self.active += 1
+
+        return ProfileSession(pipeline, 'header' if requested else 'armed')
+
+    def finish(self, session: ProfileSession, file_upload_id: Optional[int]) -> Optional[str]:
+        session.profiler.stop()
+        session.file_upload_id = file_upload_id
+        duration = time.perf_counter() - session.started
+        with self.lock:
+            self.active -= 1
+
+        try:
+            name = f"{session.pipeline}-{session.started_at.strftime('%Y%m%dT%H%M%S%f')}"
+            directory = self.profile_dir(file_upload_id)
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f"{name}.folded"), 'w') as handle:
+                for stack, count in session.profiler.stacks.most_common():
+                    handle.write(f"{stack} {count}\n")
+            with open(os.path.join(directory, f"{name}.json"), 'w') as handle:
+                json.dump(session.summary(duration), handle, indent=2)
+            self.prune()
+        except OSError as e:
+            app_logger.error(f"Could not write profile for {session.pipeline}: {str(e)}")
+            return None
+
+        PROFILES_CAPTURED.labels(session.pipeline).inc()
+        app_logger.info(f"Profiled {session.pipeline} for upload {file_upload_id}: "
+                        f"{session.profiler.samples} samples over {duration:.2f}s -> {name}")
+        return name
+
+    @staticmethod
+    def profile_dir(file_upload_id: Optional[int]) -> str:
+        return os.path.join(settings.PROFILING_DIR, str(file_upload_id) if file_upload_id is not None else 'unassigned')
+
+    def list_profiles(self, file_upload_id: int) -> List[Dict[str, Any]]:
+        directory = self.profile_dir(file_upload_id)
+        if not os.path.isdir(directory):
+            return []
+        profiles = []
+        for entry in sorted(os.listdir(directory)):
+            if not entry.endswith('.json'):
+                continue
+            name = entry[:-len('.json')]
+            try:
+                with open(os.path.join(directory, entry)) as handle:
+                    summary = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            profiles.append({
+                'name': name,
+                'pipeline': summary.get('pipeline'),
+                'started_at': summary.get('started_at'),
+                'duration_ms': summary.get('duration_ms'),
+                'samples': summary.get('samples'),
+                'artifacts': [f"{name}.folded", entry]
+            })
+        return profiles
+
+    def artifact_path(self, file_upload_id: int, artifact: str) -> Optional[str]:
+        if not ARTIFACT_NAME.match(artifact):
+            return None
+        path = os.path.join(self.profile_dir(file_upload_id), artifact)
+        return path if os.path.isfile(path) else None
+
+    def prune(self):
+        # Keep the newest PROFILING_MAX_PROFILES profiles across all uploads
+        if settings.PROFILING_MAX_PROFILES <= 0 or not os.path.isdir(settings.PROFILING_DIR):
+            return
+        summaries = []
+        for directory, _, files in os.walk(settings.PROFILING_DIR):
+            for entry in files:
+                if entry.endswith('.json'):
+                    path = os.path.join(directory, entry)
+                    summaries.append((os.path.getmtime(path), path))
+        summaries.sort()
+        for _, path in summaries[:max(0, len(summaries) - settings.PROFILING_MAX_PROFILES)]:
+            for stale in (path, path[:-len('.json')] + '.folded'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+
+request_profiler = RequestProfiler()
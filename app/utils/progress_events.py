@@ -0,0 +1,90 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.config import settings
+
+# In-process pub/sub for per-upload progress (stage transitions, record counts, status changes),
+# streamed to viewers by GET /upload/{file_upload_id}/events. Publishers may run on the event loop
+# or in worker threads (the row-by-row loader); delivery always happens on the subscriber's loop.
+# Events only reach viewers connected to the same worker process; the stream falls back to polling
+# FileUpload status for everything else.
+
+# Processing stopped because the LLM provider was unavailable; the file has to be uploaded again
+RETRY_LATER_STATUS = "Retry later"
+# Mappings are proposed and the upload waits for confirm-mappings; not terminal, loading is still to come
+AWAITING_CONFIRMATION_STATUS = "Awaiting confirmation"
+TERMINAL_STATUSES = ("Completed", "Partial success", "Failed", RETRY_LATER_STATUS)
+
+Subscriber = Tuple[asyncio.AbstractEventLoop, asyncio.Queue]
+
+
+class ProgressBroker:
+    def __init__(self, queue_size: Optional[int] = None, max_tracked_uploads: int = 1000):
+        self.queue_size = queue_size or settings.SSE_SUBSCRIBER_QUEUE_SIZE
+        self.max_tracked_uploads = max_tracked_uploads
+        self.subscribers: Dict[int, List[Subscriber]] = {}
+        # Last event of each kind per upload, replayed to viewers that connect mid-run
+        self.latest: "OrderedDict[int, Dict[str, Dict[str, Any]]]" = OrderedDict()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def publish(self, file_upload_id: int, event_type: str, **data: Any):
+        event = {'id': next(self.ids), 'type': event_type, 'file_upload_id': file_upload_id, 'time': time.time(), **data}
+        with self.lock:
+            self.latest.setdefault(file_upload_id, {})[event_type] = event
+            self.latest.move_to_end(file_upload_id)
+            while len(self.latest) > self.max_tracked_uploads:
+                self.latest.popitem(last=False)
+            subscribers = list(self.subscribers.get(file_upload_id, ()))
+
+        for loop, queue in subscribers:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                self._deliver(queue, event)
+            else:
+                try:
+                    loop.call_soon_threadsafe(self._deliver, queue, event)
+                except RuntimeError:
+                    # The subscriber's loop has closed; it is removed when its stream unwinds
+                    pass
+
+    @staticmethod
+    def _deliver(queue: asyncio.Queue, event: Dict[str, Any]):
+        # Slow viewers lose the oldest events rather than holding memory; progress is cumulative
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def snapshot(self, file_upload_id: int) -> List[Dict[str, Any]]:
+        with self.lock:
+            events = list(self.latest.get(file_upload_id, {}).values())
+        return sorted(events, key=lambda event: event['id'])
+
+    @contextmanager
+    def subscribe(self, file_upload_id: int) -> Iterator[asyncio.Queue]:
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self.lock:
+            self.subscribers.setdefault(file_upload_id, []).append(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self.lock:
+                remaining = [item for item in self.subscribers.get(file_upload_id, []) if item is not subscriber]
+                if remaining:
+                    self.subscribers[file_upload_id] = remaining
+                else:
+                    self.subscribers.pop(file_upload_id, None)
+
+    def subscriber_count(self) -> int:
+        with self.lock:
+            return sum(len(items) for items in self.subscribers.values())
+
+
+progress_broker = ProgressBroker()
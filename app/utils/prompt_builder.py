@@ -0,0 +1,255 @@
+import hashlib
+import json
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from app.config import settings
+
+# Builds the column-mapping and document-extraction prompts. The schema comes prerendered by the
+# schema registry as one compact line per table, columns are described by their profiles (see
+# app/utils/column_profiler.py) with clipped sample values, document text is cleaned
+# (whitespace collapsed, page headers/footers repeated on most pages kept only once) and every
+# prompt is fitted to a token budget measured with estimate_tokens(). The estimate is a local
+# approximation of a BPE tokenizer (about 4 letters or 3 digits per token, one per symbol),
+# good enough for budgeting; the provider's own counts are recorded when it reports them.
+
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|_")
+WHITESPACE = re.compile(r"[ \t\r\v]+")
+PAGE_NUMBER = re.compile(r"^(page\s*)?\d+(\s*(of|/)\s*\d+)?$", re.IGNORECASE)
+PAGE_EDGE_LINES = 3
+PAGE_BREAK = "\f"
+OMITTED_MARKER = "[... {count} lines omitted ...]"
+
+
+class PromptBudgetExceeded(ValueError):
+    pass
+
+
+def estimate_tokens(text: str) -> int:
+    tokens = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        piece = match.group()
+        if piece.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif piece.isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        else:
+            tokens += 1
+    return tokens
+
+
+def clip_value(value: Any, max_chars: int) -> Any:
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        # pandas hands empty cells over as NaN
+        return None if math.isnan(value) else value
+    if isinstance(value, int):
+        return value
+    text = WHITESPACE.sub(" ", str(value)).strip()
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+def render_profile_line(column: str, profile: Dict[str, Any], samples: int, max_chars: int) -> str:
+    # One line per column, e.g. - "Inv Date": date, 4% null, 120 distinct, 2024-01-02..2024-03-30, e.g. ["02/01/2024"]
+    parts = [profile['type']]
+    if profile.get('null_ratio'):
+        parts.append(f"{profile['null_ratio']:.0%} null")
+    parts.append(f"{profile['distinct']}{'+' if profile.get('distinct_capped') else ''} distinct")
+    if profile.get('classes'):
+        parts.append("/".join(f"{name} {share:.0%}" for name, share in profile['classes'].items()))
+    if 'min' in profile:
+        parts.append(f"{profile['min']}..{profile['max']}")
+    if samples and profile.get('samples'):
+        values = [clip_value(value, max_chars) for value in profile['samples'][:samples]]
+        parts.append("e.g. " + json.dumps(values, ensure_ascii=False, default=str))
+    return f"- {json.dumps(str(column), ensure_ascii=False)}: " + ", ".join(parts)
+
+
+def render_profiles(profiles: Optional[Dict[str, Dict[str, Any]]], samples: int, max_chars: int) -> str:
+    if not profiles:
+        return ""
+    return "\n".join(render_profile_line(column, profile, samples, max_chars) for column, profile in profiles.items())
+
+
+def clean_document_text(text: str) -> str:
+    # Pages are separated by form feeds (see FileProcessor.extract_text_from_pdf). A line among the
+    # first or last PAGE_EDGE_LINES of at least half the pages is a running header/footer (or a table
+    # header repeated per page) and is kept only where it first appears. Bare page numbers go entirely
+    pages = []
+    for page in str(text).split(PAGE_BREAK):
+        lines = [WHITESPACE.sub(" ", line).strip() for line in page.splitlines()]
+        pages.append([line for line in lines if line and not PAGE_NUMBER.match(line)])
+
+    repeated = set()
+    if len(pages) >= 2:
+        seen_on = Counter()
+        for lines in pages:
+            seen_on.update(set(lines[:PAGE_EDGE_LINES] + lines[-PAGE_EDGE_LINES:]))
+        threshold = max(2, math.ceil(len(pages) / 2))
+        repeated = {line for line, count in seen_on.items() if count >= threshold}
+
+    cleaned: List[str] = []
+    kept = set()
+    for lines in pages:
+        for line in lines:
+            if line in repeated:
+                if line in kept:
+                    continue
+                kept.add(line)
+            if cleaned and cleaned[-1] == line:
+                continue
+            cleaned.append(line)
+    return "\n".join(cleaned)
+
+
+def fit_lines(text: str, max_tokens: int) -> str:
+    # Keeps whole lines from the start and the end (totals and payment terms sit at the bottom of
+    # invoices) and marks what was dropped in between
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.split("\n")
+    costs = [estimate_tokens(line) + 1 for line in lines]
+    budget = max_tokens - estimate_tokens(OMITTED_MARKER.format(count=len(lines)))
+    head_budget = budget * 2 // 3
+
+    head: List[str] = []
+    spent = 0
+    for line, cost in zip(lines, costs):
+        if spent + cost > head_budget:
+            break
+        head.append(line)
+        spent += cost
+    tail: List[str] = []
+    for line, cost in zip(reversed(lines[len(head):]), reversed(costs[len(head):])):
+        if spent + cost > budget:
+            break
+        tail.append(line)
+        spent += cost
+    tail.reverse()
+
+    omitted = len(lines) - len(head) - len(tail)
+    if not head and not tail:
+        # A single enormous line: cut it by characters
+        ratio = len(text) / max(1, estimate_tokens(text))
+        return text[:int(max(0, budget) * ratio)]
+    return "\n".join(head + [OMITTED_MARKER.format(count=omitted)] + tail)
+
+
+class BuiltPrompt:
+    def __init__(self, text: str, truncated: bool):
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.truncated = truncated
+
+
+class PromptBuilder:
+    def __init__(self, schema_text: str):
+        # Precomputed by the schema registry (app/database/schema_registry.py)
+        self.schema_text = schema_text
+
+    def mapping_prompt(self, columns: List[str], column_profiles: Optional[Dict[str, Dict[str, Any]]],
+                       document_context: Optional[str] = None, budget: Optional[int] = None) -> BuiltPrompt:
+        budget = budget or settings.LLM_MAPPING_PROMPT_TOKEN_BUDGET
+        max_chars = settings.LLM_SAMPLE_VALUE_MAX_CHARS
+        samples = settings.PROFILE_SAMPLES_PER_COLUMN
+        columns_text = json.dumps([str(column) for column in columns], ensure_ascii=False)
+        profile_text = render_profiles(column_profiles, samples, max_chars)
+        context_text = clean_document_text(document_context) if document_context else ""
+        truncated = False
+
+        def render(profile: str, context: str) -> str:
+            parts = []
+            if profile:
+                parts.append(f"Column profiles (type, null share, distinct values, value classes, range, samples):\n{profile}")
+            if context:
+                parts.append(f"Surrounding document text:\n{context}")
+            parts.append(MAPPING_INSTRUCTIONS.format(columns=columns_text, schema=self.schema_text))
+            return "\n".join(parts)
+
+        # Shrink the optional parts until the prompt fits: trim the document text, then keep one
+        # harder-clipped sample per column, then profiles without samples, then drop both. Columns
+        # and schema are never cut
+        fixed = estimate_tokens(render(profile_text, ""))
+        if context_text and fixed + estimate_tokens(context_text) + 8 > budget:
+            context_text = fit_lines(context_text, budget - fixed - 8)
+            truncated = True
+        text = render(profile_text, context_text)
+        for fewer_samples, clip in ((1, max(8, max_chars // 4)), (0, max_chars)):
+            if estimate_tokens(text) <= budget or not profile_text:
+                break
+            profile_text = render_profiles(column_profiles, fewer_samples, clip)
+            text = render(profile_text, context_text)
+            truncated = True
+        if estimate_tokens(text) > budget:
+            text = render("", "")
+            truncated = True
+        prompt = BuiltPrompt(text, truncated)
+        if prompt.tokens > budget:
+            raise PromptBudgetExceeded(
+                f"Mapping prompt for {len(columns)} columns needs about {prompt.tokens} tokens; budget is {budget}"
+            )
+        return prompt
+
+    def mapping_fingerprint(self, columns: List[str], column_profiles: Optional[Dict[str, Dict[str, Any]]],
+                            document_context: Optional[str] = None) -> str:
+        # Files with the same layout get the same mapping: the key covers the exact column names,
+        # each column's value type and the cleaned document text, but not the per-file statistics
+        # and samples that only steer the LLM
+        layout = {
+            'columns': [str(column) for column in columns],
+            'types': {str(column): profile.get('type') for column, profile in (column_profiles or {}).items()},
+            'context': clean_document_text(document_context) if document_context else "",
+            'schema': self.schema_text
+        }
+        return hashlib.sha256(json.dumps(layout, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def document_prompt(self, document_text: str, budget: Optional[int] = None) -> BuiltPrompt:
+        budget = budget or settings.LLM_DOCUMENT_PROMPT_TOKEN_BUDGET
+        instructions = DOCUMENT_INSTRUCTIONS.format(schema=self.schema_text, document="")
+        room = budget - estimate_tokens(instructions)
+        if room <= 0:
+            raise PromptBudgetExceeded(f"Document instructions alone exceed the {budget} token budget")
+        text = clean_document_text(document_text)
+        fitted = fit_lines(text, room)
+        return BuiltPrompt(DOCUMENT_INSTRUCTIONS.format(schema=self.schema_text, document=fitted), fitted != text)
+
+
+MAPPING_INSTRUCTIONS = """Map the extracted column names to the database schema.
+
+Extracted columns: {columns}
+
+Database schema (table: column type, ...):
+{schema}
+
+Respond ONLY with JSON:
+{{"mappings": [{{"source_field": "extracted_column_name (datatype)", "target_table": "table_name", "target_column": "column_name (datatype)"}}], "unmapped_fields": ["field1"]}}
+
+Guidelines:
+- Consider common invoice terminology variations
+- Use the column profiles: a column's value class and samples say more than its name
+- Give full datatype names (e.g., "String", "Integer", "DECIMAL")
+- Only return valid JSON, no additional text or explanations"""
+
+DOCUMENT_INSTRUCTIONS = """You are a data extraction and mapping engine. The text below was extracted from a non-tabular
+document (forms or free text). Detect the fields it contains, map them to the database schema,
+extract their values, and list important fields you could not map confidently.
+
+Database schema (table: column type, ...):
+{schema}
+
+Respond ONLY with JSON:
+{{"mappings": [{{"source_field": "extracted_field_name (datatype)", "target_table": "table_name", "target_column": "column_name (datatype)"}}], "extracted_fields": ["field1"], "unmapped_fields": ["field1"], "data": [{{"source_field_1": "value1"}}]}}
+
+Guidelines:
+- The text may not be clearly tabular; match fields by meaning (e.g. "Inv No" -> invoice_number)
+- Extract realistic field values from the text
+- Give full datatype names (e.g., "String", "Integer", "DECIMAL")
+
+Document text:
+-----------------------
+{document}
+-----------------------"""
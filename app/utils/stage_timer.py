@@ -0,0 +1,76 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+from app.utils.metrics import PIPELINE_DURATION_SECONDS, PIPELINE_STAGE_SECONDS
+from app.utils.progress_events import progress_broker
+from app.utils.tracing import span
+
+# Called as listener(pipeline, stage, started, ended) with perf_counter() timestamps after every
+# stage; used by the benchmarks to attribute memory samples to stages
+_stage_listeners: List[Callable[[str, str, float, float], None]] = []
+
+
+def add_stage_listener(listener: Callable[[str, str, float, float], None]):
+    _stage_listeners.append(listener)
+
+
+def remove_stage_listener(listener: Callable[[str, str, float, float], None]):
+    _stage_listeners.remove(listener)
+
+
+# Times the stages of one pipeline run. Spans go to ProcessingLog.details; they are observed
+# into the histograms in finish(), once the file type is known. Once file_upload_id is known,
+# stage transitions are also published to the upload's progress stream. Each stage is also a
+# tracing span, parent of the DAO, SQL and LLM spans it encloses
+class StageTimer:
+    def __init__(self, pipeline: str, file_type: Optional[str] = None, file_upload_id: Optional[int] = None):
+        self.pipeline = pipeline
+        self.file_type = file_type
+        self.file_upload_id = file_upload_id
+        self.spans: List[Dict[str, Any]] = []
+        self.started = time.perf_counter()
+        self.finished = False
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        outcome = 'ok'
+        if self.file_upload_id is not None:
+            progress_broker.publish(self.file_upload_id, 'stage', pipeline=self.pipeline, stage=name, state='started')
+        try:
+            with span(f"{self.pipeline}.{name}", **{'app.file_upload_id': self.file_upload_id,
+                                                      'app.file_type': self.file_type}):
+                yield
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            ended = time.perf_counter()
+            self.spans.append({
+                'stage': name,
+                'start_ms': round((started - self.started) * 1000, 2),
+                'duration_ms': round((ended - started) * 1000, 2),
+                'outcome': outcome
+            })
+            for listener in _stage_listeners:
+                listener(self.pipeline, name, started, ended)
+            if self.file_upload_id is not None:
+                progress_broker.publish(self.file_upload_id, 'stage', pipeline=self.pipeline, stage=name,
+                                        state=outcome, duration_ms=self.spans[-1]['duration_ms'])
+
+    def finish(self) -> Dict[str, Any]:
+        total_seconds = time.perf_counter() - self.started
+        file_type = (self.file_type or 'unknown').lower()
+
+        if not self.finished:
+            self.finished = True
+            for stage in self.spans:
+                PIPELINE_STAGE_SECONDS.labels(self.pipeline, stage['stage'], file_type).observe(stage['duration_ms'] / 1000)
+            PIPELINE_DURATION_SECONDS.labels(self.pipeline, file_type).observe(total_seconds)
+
+        return {
+            'pipeline': self.pipeline,
+            'file_type': file_type,
+            'total_ms': round(total_seconds * 1000, 2),
+            'spans': self.spans
+        }
@@ -0,0 +1,50 @@
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+PROCESS_START = time.perf_counter()
+
+
+class StartupReport:
+    def __init__(self):
+        self.marks: Dict[str, float] = {}
+        self.durations: Dict[str, float] = {}
+
+    def mark(self, name: str):
+        self.marks[name] = round((time.perf_counter() - PROCESS_START) * 1000, 2)
+
+    @contextmanager
+    def timed(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'since_process_start_ms': dict(self.marks),
+            'durations_ms': dict(self.durations)
+        }
+
+
+startup_report = StartupReport()
+_import_lock = threading.Lock()
+
+
+def lazy_import(module_name: str):
+    # Heavy parsers are imported on first use; the first import cost is recorded in the startup report
+    module = sys.modules.get(module_name)
+    # A module another worker thread is still importing is already in sys.modules, half initialised
+    if module is None or getattr(getattr(module, '__spec__', None), '_initializing', False):
+        with _import_lock:
+            module = sys.modules.get(module_name)
+            if module is None:
+                with startup_report.timed(f"import:{module_name}"):
+                    module = importlib.import_module(module_name)
+            else:
+                module = importlib.import_module(module_name)
+    return module
@@ -0,0 +1,408 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Optional, Tuple, Union
+import aiofiles
+import httpx
+from app.config import settings
+from app.utils.file_cache import LocalFileCache, get_file_cache
+from app.utils.logger import app_logger
+
+StorageData = Union[bytes, AsyncIterator[bytes]]
+# Object names uploads are stored under: the SHA-256 of the content plus the file extension
+CONTENT_ADDRESSED_KEY = re.compile(r"^([0-9a-f]{64})(\.[A-Za-z0-9]+)?$")
+
+
+class ObjectAlreadyExists(Exception):
+    # Raised by put() when the store refuses to overwrite an existing object
+    pass
+
+
+async def _iter_data(data: StorageData, chunk_size: int) -> AsyncIterator[bytes]:
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = memoryview(data)
+        for offset in range(0, len(view), chunk_size):
+            yield bytes(view[offset:offset + chunk_size])
+    else:
+        async for chunk in data:
+            yield chunk
+
+
+async def _iter_parts(data: StorageData, part_size: int) -> AsyncIterator[bytes]:
+    # Re-chunks arbitrary input into fixed-size parts; only the last part may be shorter
+    buffer = bytearray()
+    async for chunk in _iter_data(data, part_size):
+        buffer.extend(chunk)
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+class StorageBackend(ABC):
+    name = "base"
+
+    def __init__(self, chunk_size: int = None, multipart_threshold: int = None, part_size: int = None):
+        self.chunk_size = chunk_size or settings.STORAGE_CHUNK_SIZE
+        self.multipart_threshold = multipart_threshold or settings.STORAGE_MULTIPART_THRESHOLD
+        self.part_size = part_size or settings.STORAGE_MULTIPART_PART_SIZE
+
+    @abstractmethod
+    async def put(self, key: str, data: StorageData, size: Optional[int] = None) -> str:
+        ...
+
+    @abstractmethod
+    def iter_chunks(self, key: str) -> AsyncIterator[bytes]:
+        ...
+
+    @abstractmethod
+    async def read_range(self, key: str, start: int, end: Optional[int] = None) -> bytes:
+        ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    def stored_key(self, key: str) -> str:
+        return key
+
+    async def close(self):
+        pass
+
+    async def put_if_absent(self, key: str, data: StorageData, size: Optional[int] = None) -> str:
+        # Content-addressed keys make an existing object identical to the new one. The exists()
+        # check only saves the transfer; a concurrent upload of the same content can still win the
+        # race, and the store's refusal to overwrite it counts as success
+        if await self.exists(key):
+            return self.stored_key(key)
+        try:
+            return await self.put(key, data, size)
+        except ObjectAlreadyExists:
+            return self.stored_key(key)
+
+    async def read_bytes(self, key: str) -> bytes:
+        buffer = bytearray()
+        async for chunk in self.iter_chunks(key):
+            buffer.extend(chunk)
+        return bytes(buffer)
+
+    async def open(self, key: str) -> BinaryIO:
+        # Parsers need a seekable file object; remote objects are held in memory rather than re-written to disk
+        return io.BytesIO(await self.read_bytes(key))
+
+    def uses_multipart(self, data: StorageData, size: Optional[int]) -> bool:
+        if size is None and isinstance(data, (bytes, bytearray, memoryview)):
+            size = len(data)
+        return size is not None and size >= self.multipart_threshold
+
+
+class LocalStorageBackend(StorageBackend):
+    name = "local"
+
+    def __init__(self, root_dir: str, **kwargs):
+        super().__init__(**kwargs)
+        self.root = Path(root_dir)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def resolve(self, key: str) -> Path:
+        # Keys may be bare object names or the file_path stored on FileUpload ("uploads/<name>"),
+        # but never anything outside the root
+        path = Path(key)
+        if not (path.is_absolute() or path.parts[:len(self.root.parts)] == self.root.parts):
+            path = self.root / path
+        if self.root.resolve() not in path.resolve().parents:
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    def stored_key(self, key: str) -> str:
+        return str(self.resolve(key))
+
+    async def put(self, key: str, data: StorageData, size: Optional[int] = None) -> str:
+        path = self.resolve(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                async for chunk in _iter_data(data, self.chunk_size):
+                    await f.write(chunk)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return str(path)
+
+    async def iter_chunks(self, key: str) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.resolve(key), 'rb') as f:
+            while True:
+                chunk = await f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    async def read_range(self, key: str, start: int, end: Optional[int] = None) -> bytes:
+        async with aiofiles.open(self.resolve(key), 'rb') as f:
+            await f.seek(start)
+            if end is None:
+                return await f.read()
+            return await f.read(end - start + 1)
+
+    async def exists(self, key: str) -> bool:
+        return self.resolve(key).exists()
+
+    async def open(self, key: str) -> BinaryIO:
+        return open(self.resolve(key), 'rb')
+
+
+class LocalObjectStoreBackend(LocalStorageBackend):
+    # Object-store stand-in over a local directory, including the multipart upload protocol
+    name = "local-object-store"
+
+    def __init__(self, root_dir: str, bucket: str, **kwargs):
+        super().__init__(str(Path(root_dir) / bucket), **kwargs)
+        self.multipart_dir = Path(root_dir) / ".multipart"
+
+    def resolve(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    def stored_key(self, key: str) -> str:
+        return key
+
+    async def put(self, key: str, data: StorageData, size: Optional[int] = None) -> str:
+        if not self.uses_multipart(data, size):
+            await super().put(key, data, size)
+            return key
+
+        upload_id = self.create_multipart_upload(key)
+        try:
+            part_number = 0
+            async for part in _iter_parts(data, self.part_size):
+                part_number += 1
+                await self.upload_part(upload_id, part_number, part)
+            await asyncio.to_thread(self.complete_multipart_upload, upload_id, key)
+        except Exception:
+            shutil.rmtree(self.multipart_dir / upload_id, ignore_errors=True)
+            raise
+        return key
+
+    def create_multipart_upload(self, key: str) -> str:
+        upload_id = uuid.uuid4().hex
+        (self.multipart_dir / upload_id).mkdir(parents=True)
+        return upload_id
+
+    async def upload_part(self, upload_id: str, part_number: int, content: bytes):
+        async with aiofiles.open(self.multipart_dir / upload_id / f"{part_number:05d}", 'wb') as f:
+            await f.write(content)
+
+    def complete_multipart_upload(self, upload_id: str, key: str):
+        upload_dir = self.multipart_dir / upload_id
+        path = self.resolve(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as out:
+            for part in sorted(upload_dir.iterdir()):
+                with open(part, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+        os.replace(tmp_path, path)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+class SupabaseStorageBackend(StorageBackend):
+    name = "supabase"
+
+    def __init__(self, url: str, key: str, bucket: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = f"{url.rstrip('/')}/storage/v1"
+        self.bucket = bucket
+        self.headers = {"Authorization": f"Bearer {key}", "apikey": key}
+        self.client = httpx.AsyncClient(headers=self.headers, timeout=settings.STORAGE_TIMEOUT_SECONDS)
+
+    async def close(self):
+        await self.client.aclose()
+
+    def object_url(self, key: str) -> str:
+        return f"{self.base_url}/object/authenticated/{self.bucket}/{key}"
+
+    async def put(self, key: str, data: StorageData, size: Optional[int] = None) -> str:
+        if self.uses_multipart(data, size):
+            if size is None:
+                size = len(data)
+            await self.put_resumable(key, data, size)
+            return key
+
+        response = await self.client.post(
+            f"{self.base_url}/object/{self.bucket}/{key}",
+            content=bytes(data) if isinstance(data, (bytes, bytearray, memoryview)) else _iter_data(data, self.chunk_size),
+            headers={"Content-Type": "application/octet-stream", "x-upsert": "false"}
+        )
+        self.raise_for_status(response, key)
+        return key
+
+    @staticmethod
+    def raise_for_status(response: httpx.Response, key: str):
+        # Without upsert an existing object is refused with 409, or with 400 and a "Duplicate" error
+        # body on the storage API versions that wrap the status code
+        if response.status_code == 409 or (response.status_code == 400 and "Duplicate" in response.text):
+            raise ObjectAlreadyExists(key)
+        response.raise_for_status()
+
+    async def put_resumable(self, key: str, data: StorageData, size: int):
+        # Supabase exposes multipart uploads through the TUS protocol
+        def b64(value: str) -> str:
+            return base64.b64encode(value.encode()).decode()
+
+        tus_headers = {"Tus-Resumable": "1.0.0"}
+        response = await self.client.post(
+            f"{self.base_url}/upload/resumable",
+            headers={
+                **tus_headers,
+                "Upload-Length": str(size),
+                "Upload-Metadata": f"bucketName {b64(self.bucket)},objectName {b64(key)},"
+                                   f"contentType {b64('application/octet-stream')}",
+                "x-upsert": "false"
+            }
+        )
+        self.raise_for_status(response, key)
+        upload_url = response.headers["Location"]
+
+        offset = 0
+        async for part in _iter_parts(data, self.part_size):
+            response = await self.client.patch(
+                upload_url,
+                content=part,
+                headers={
+                    **tus_headers,
+                    "Upload-Offset": str(offset),
+                    "Content-Type": "application/offset+octet-stream"
+                }
+            )
+            response.raise_for_status()
+            offset = int(response.headers.get("Upload-Offset", offset + len(part)))
+
+    async def iter_chunks(self, key: str) -> AsyncIterator[bytes]:
+        async with self.client.stream("GET", self.object_url(key)) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(self.chunk_size):
+                yield chunk
+
+    async def read_range(self, key: str, start: int, end: Optional[int] = None) -> bytes:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        response = await self.client.get(self.object_url(key), headers={"Range": byte_range})
+        response.raise_for_status()
+        return response.content
+
+    async def exists(self, key: str) -> bool:
+        response = await self.client.head(self.object_url(key))
+        return response.status_code == 200
+
+
+class CachedStorageBackend(StorageBackend):
+    # Read-through LocalFileCache in front of a remote backend; writes go through to both. Only
+    # content-addressed keys ("<sha256>.<ext>", as uploads are stored) are cached: their name
+    # identifies their bytes. Other keys are read from the remote every time
+    def __init__(self, inner: StorageBackend, cache: LocalFileCache):
+        super().__init__(inner.chunk_size, inner.multipart_threshold, inner.part_size)
+        self.inner = inner
+        self.cache = cache
+        self.name = f"cached-{inner.name}"
+
+    async def close(self):
+        await self.inner.close()
+
+    def content_address(self, key: str) -> Optional[Tuple[str, str]]:
+        match = CONTENT_ADDRESSED_KEY.match(Path(key).name)
+        return (match.group(1), Path(key).suffix.lower()) if match else None
+
+    async def put(self, key: str, data: StorageData, size: Optional[int] = None) -> str:
+        stored_key = await self.inner.put(key, data, size)
+        address = self.content_address(stored_key)
+        if address and isinstance(data, (bytes, bytearray, memoryview)):
+            content = bytes(data)
+            if hashlib.sha256(content).hexdigest() == address[0]:
+                await asyncio.to_thread(self.cache.put, *address, content)
+        return stored_key
+
+    async def iter_chunks(self, key: str) -> AsyncIterator[bytes]:
+        if self.content_address(key) is None:
+            async for chunk in self.inner.iter_chunks(key):
+                yield chunk
+            return
+        with await self.open(key) as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    async def read_range(self, key: str, start: int, end: Optional[int] = None) -> bytes:
+        address = self.content_address(key)
+        cached = self.cache.open(*address) if address else None
+        if cached is None:
+            return await self.inner.read_range(key, start, end)
+        with cached as f:
+            f.seek(start)
+            return await asyncio.to_thread(f.read, -1 if end is None else end - start + 1)
+
+    async def exists(self, key: str) -> bool:
+        address = self.content_address(key)
+        return (address is not None and self.cache.contains(*address)) or await self.inner.exists(key)
+
+    async def open(self, key: str) -> BinaryIO:
+        address = self.content_address(key)
+        if address is None:
+            return await self.inner.open(key)
+        loop = asyncio.get_running_loop()
+
+        def fetch() -> bytes:
+            return asyncio.run_coroutine_threadsafe(self.inner.read_bytes(key), loop).result()
+
+        return await asyncio.to_thread(self.cache.open_or_fetch, *address, fetch)
+
+
+# Backends created by get_storage_backend, closed at shutdown
+_created_backends = []
+
+
+@lru_cache(maxsize=None)
+def get_storage_backend(storage_location: str) -> StorageBackend:
+    backend = _create_storage_backend(storage_location)
+    _created_backends.append(backend)
+    return backend
+
+
+async def close_storage_backends():
+    get_storage_backend.cache_clear()
+    while _created_backends:
+        backend = _created_backends.pop()
+        try:
+            await backend.close()
+        except Exception as e:
+            app_logger.error(f"Error closing {backend.name} storage backend: {str(e)}")
+
+
+def _create_storage_backend(storage_location: str) -> StorageBackend:
+    if storage_location == 'local':
+        return LocalStorageBackend(settings.UPLOAD_DIR)
+    if storage_location == 'cloud':
+        if settings.LOCAL_STORAGE_EMULATOR_DIR:
+            inner = LocalObjectStoreBackend(settings.LOCAL_STORAGE_EMULATOR_DIR, settings.STORAGE_BUCKET)
+        else:
+            inner = SupabaseStorageBackend(settings.SUPABASE_URL, settings.SUPABASE_KEY, settings.STORAGE_BUCKET)
+        cache = get_file_cache(settings.CLOUD_UPLOAD_DIR, settings.CLOUD_CACHE_MAX_BYTES)
+        app_logger.info(f"Using {inner.name} storage backend for cloud files")
+        return CachedStorageBackend(inner, cache)
+    raise ValueError(f"Unsupported storage location: {storage_location}")
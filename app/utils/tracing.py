@@ -0,0 +1,411 @@
+import contextvars
+import functools
+import inspect
+import json
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config import settings
+from app.utils.logger import app_logger
+from app.utils.metrics import TRACE_SPANS_DROPPED, TRACE_SPANS_EXPORTED
+
+# OpenTelemetry-style tracing without the SDK: spans carry W3C trace/span ids, a parent, attributes,
+# a status and exception events, and are exported in OTLP/JSON, either appended to TRACING_FILE
+# (one ExportTraceServiceRequest per line) or POSTed to an OTLP/HTTP collector. The current span
+# lives in a contextvar, so it follows awaits and asyncio.to_thread into worker threads.
+# Off unless TRACING_ENABLED; disabled spans cost one settings lookup.
+
+SPAN_KINDS = {'INTERNAL': 1, 'SERVER': 2, 'CLIENT': 3}
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+
+class TraceState:
+    # Shared by the spans of one trace in this process, to cap how many get recorded
+    __slots__ = ('span_count', 'dropped')
+
+    def __init__(self):
+        self.span_count = 0
+        self.dropped = 0
+
+
+class Span:
+    __slots__ = ('name', 'kind', 'trace_id', 'span_id', 'parent_id', 'state', 'recording', 'local_root', 'remote',
+                 'attributes', 'events', 'status', 'status_message', 'start_ns', 'end_ns')
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], state: TraceState,
+                 recording: bool, local_root: bool = False, span_id: Optional[str] = None, remote: bool = False):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = span_id or f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.state = state
+        self.recording = recording
+        self.local_root = local_root
+        # Stands in for the caller's span from an incoming traceparent; never ended or exported
+        self.remote = remote
+        self.attributes: Dict[str, Any] = {}
+        self.events: List[Dict[str, Any]] = []
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set_attribute(self, key: str, value: Any):
+        if self.recording and value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def set_status(self, status: int, message: str = ""):
+        self.status = status
+        self.status_message = message
+
+    def record_exception(self, error: BaseException):
+        if not self.recording:
+            return
+        self.events.append({
+            'name': 'exception',
+            'time_ns': time.time_ns(),
+            'attributes': {'exception.type': type(error).__name__, 'exception.message': str(error)[:1000]}
+        })
+        self.set_status(STATUS_ERROR, str(error)[:200])
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if not self.recording:
+            return
+        if self.local_root and self.state.dropped:
+            self.attributes['tracing.dropped_spans'] = self.state.dropped
+        span_processor.enqueue(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': SPAN_KINDS.get(self.kind, 1),
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': _otlp_attributes(self.attributes),
+            'status': {'code': self.status, 'message': self.status_message} if self.status else {}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        if self.events:
+            span['events'] = [
+                {'name': item['name'], 'timeUnixNano': str(item['time_ns']), 'attributes': _otlp_attributes(item['attributes'])}
+                for item in self.events
+            ]
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, (list, tuple)):
+        return {'arrayValue': {'values': [_otlp_value(item) for item in value]}}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items()]
+
+
+def otlp_payload(spans: Sequence[Span]) -> Dict[str, Any]:
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': settings.TRACING_SERVICE_NAME})},
+            'scopeSpans': [{'scope': {'name': 'app.utils.tracing'}, 'spans': [span.to_otlp() for span in spans]}]
+        }]
+    }
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Span]:
+    # W3C trace context: "00-<32 hex trace id>-<16 hex parent id>-<flags>"
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return Span('remote', 'SERVER', parts[1], None, TraceState(), sampled, span_id=parts[2], remote=True)
+
+
+class FileSpanExporter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        with open(self.path, 'a') as handle:
+            handle.write(json.dumps(otlp_payload(spans)) + "\n")
+
+
+class OtlpHttpSpanExporter:
+    def __init__(self, endpoint: str, headers: Dict[str, str]):
+        import httpx
+
+        self.endpoint = endpoint
+        self.client = httpx.Client(timeout=settings.TRACING_OTLP_TIMEOUT_SECONDS,
+                                   headers={'Content-Type': 'application/json', **headers})
+
+    def export(self, spans: List[Span]):
+        response = self.client.post(self.endpoint, content=json.dumps(otlp_payload(spans)))
+        response.raise_for_status()
+
+
+def build_exporter():
+    if settings.TRACING_EXPORTER == 'otlp':
+        return OtlpHttpSpanExporter(settings.TRACING_OTLP_ENDPOINT, settings.TRACING_OTLP_HEADERS)
+    return FileSpanExporter(settings.TRACING_FILE)
+
+
+class BatchSpanProcessor:
+    # Finished spans are queued and exported in batches from a background thread, so request
+    # paths never wait on disk or the collector. A full queue drops spans rather than blocking
+    def __init__(self):
+        self.queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=settings.TRACING_MAX_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.exporter = None
+
+    def enqueue(self, span: Span):
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            TRACE_SPANS_DROPPED.labels('queue_full').inc()
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.exporter = build_exporter()
+            self.thread = threading.Thread(target=self.run, name="span-exporter", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch: List[Span] = []
+            deadline = time.monotonic() + settings.TRACING_EXPORT_INTERVAL_SECONDS
+            while len(batch) < settings.TRACING_EXPORT_BATCH_SIZE:
+                try:
+                    span = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stopping = True
+                    break
+                batch.append(span)
+            if batch:
+                self.export(batch)
+        # Whatever was queued behind the shutdown marker
+        remaining = []
+        while not self.queue.empty():
+            span = self.queue.get_nowait()
+            if span is not None:
+                remaining.append(span)
+        if remaining:
+            self.export(remaining)
+
+    def export(self, batch: List[Span]):
+        try:
+            self.exporter.export(batch)
+            TRACE_SPANS_EXPORTED.inc(len(batch))
+        except Exception as e:
+            TRACE_SPANS_DROPPED.labels('export_failed').inc(len(batch))
+            app_logger.warning(f"Dropped {len(batch)} spans: export failed: {str(e)}")
+
+    def shutdown(self, timeout: float = 5.0):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+
+
+span_processor = BatchSpanProcessor()
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+_UNSET = object()
+NON_RECORDING_SPAN = Span('disabled', 'INTERNAL', '0' * 32, None, TraceState(), False, span_id='0' * 16)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, kind: str = 'INTERNAL', parent: Any = _UNSET,
+               attributes: Optional[Dict[str, Any]] = None) -> Span:
+    # Not made current; use span() for that. The sampling decision is taken once, at the root
+    if parent is _UNSET:
+        parent = _current_span.get()
+    if parent is None:
+        recording = random.random() < settings.TRACING_SAMPLE_RATIO
+        span = Span(name, kind, f"{random.getrandbits(128):032x}", None, TraceState(), recording, local_root=True)
+    elif parent.remote:
+        span = Span(name, kind, parent.trace_id, parent.span_id, parent.state, parent.recording, local_root=True)
+    else:
+        state = parent.state
+        recording = parent.recording and state.span_count < settings.TRACING_MAX_SPANS_PER_TRACE
+        if parent.recording and not recording:
+            state.dropped += 1
+        span = Span(name, kind, parent.trace_id, parent.span_id, state, recording)
+    if span.recording:
+        span.state.span_count += 1
+        if attributes:
+            span.set_attributes(attributes)
+    return span
+
+
+@contextmanager
+def span(name: str, kind: str = 'INTERNAL', parent: Any = _UNSET, **attributes: Any) -> Iterator[Span]:
+    if not settings.TRACING_ENABLED:
+        yield NON_RECORDING_SPAN
+        return
+    current = start_span(name, kind, parent, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def traced(name: Optional[str] = None, kind: str = 'INTERNAL', record_args: Sequence[str] = ()):
+    # Wraps a function (sync or async) in a span named after it; record_args copies the named
+    # arguments onto the span as app.<name> attributes
+    def decorate(fn: Callable):
+        span_name = name or fn.__qualname__
+        signature = inspect.signature(fn) if record_args else None
+
+        def attributes(args, kwargs) -> Dict[str, Any]:
+            if signature is None:
+                return {}
+            bound = signature.bind_partial(*args, **kwargs).arguments
+            return {f"app.{arg}": bound[arg] for arg in record_args if arg in bound}
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not settings.TRACING_ENABLED:
+                    return await fn(*args, **kwargs)
+                with span(span_name, kind, **attributes(args, kwargs)):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not settings.TRACING_ENABLED:
+                return fn(*args, **kwargs)
+            with span(span_name, kind, **attributes(args, kwargs)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def instrument_sql(engine: Engine):
+    # One CLIENT span per statement, only inside a recorded trace, annotated with the statement
+    # (truncated), its parameter-set count for executemany and the driver's row count
+    system = engine.dialect.name
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not settings.TRACING_ENABLED:
+            return
+        parent = _current_span.get()
+        if parent is None or not parent.recording or context is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'SQL'
+        query_span = start_span(f"SQL {operation}", 'CLIENT', parent, {
+            'db.system': system,
+            'db.operation': operation,
+            'db.statement': statement[:settings.TRACING_SQL_STATEMENT_MAX_CHARS]
+        })
+        if executemany and isinstance(parameters, (list, tuple)):
+            query_span.set_attribute('db.executemany.parameter_sets', len(parameters))
+        context._trace_span = query_span
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        query_span = getattr(context, '_trace_span', None)
+        if query_span is None:
+            return
+        context._trace_span = None
+        rowcount = getattr(cursor, 'rowcount', -1)
+        if isinstance(rowcount, int) and rowcount >= 0:
+            query_span.set_attribute('db.rows', rowcount)
+        query_span.end()
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(exception_context):
+        context = exception_context.execution_context
+        query_span = getattr(context, '_trace_span', None) if context is not None else None
+        if query_span is None:
+            return
+        context._trace_span = None
+        query_span.record_exception(exception_context.original_exception)
+        query_span.end()
+
+
+class TracingMiddleware:
+    # Pure ASGI, so streaming responses are not buffered: one SERVER span per HTTP request,
+    # continuing the caller's traceparent, and the trace id returned as X-Trace-Id
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not settings.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers') or [])
+        parent = parse_traceparent(headers.get(b'traceparent', b'').decode('latin-1'))
+        method = scope['method']
+        with span(f"{method} {scope['path']}", 'SERVER', parent, **{'http.method': method, 'http.target': scope['path']}) as request_span:
+            async def send_with_trace(message):
+                if message['type'] == 'http.response.start':
+                    request_span.set_attribute('http.status_code', message['status'])
+                    if message['status'] >= 500:
+                        request_span.set_status(STATUS_ERROR, f"HTTP {message['status']}")
+                    if request_span.recording:
+                        message = {**message, 'headers': [*message.get('headers', []),
+                                                          (b'x-trace-id', request_span.trace_id.encode())]}
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
+            route = scope.get('route')
+            if route is not None and getattr(route, 'path', None):
+                request_span.name = f"{method} {route.path}"
+                request_span.set_attribute('http.route', route.path)
+            elif scope.get('endpoint') is not None:
+                request_span.set_attribute('code.function', getattr(scope['endpoint'], '__name__', None))
+
+
+def shutdown_tracing():
+    span_processor.shutdown()
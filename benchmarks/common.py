@@ -0,0 +1,17 @@
+import os
+from typing import List
+
+
+def configure_environment(database_url: str, **overrides: str):
+    # app.config.Settings requires these; the benchmarks never talk to the providers.
+    # Must run before anything under app/ is imported.
+    os.environ['DATABASE_URL'] = database_url
+    for name in ['OPENAI_API_KEY', 'GENAI_API_KEY', 'SUPABASE_KEY', 'SUPABASE_URL']:
+        os.environ.setdefault(name, 'unused')
+    os.environ.update(overrides)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any, Dict, List
+from benchmarks.common import configure_environment, percentile
+
+# Drives LLMMappingBAO.map_columns_with_llm against FaultInjectingModel under a few provider
+# scenarios and reports, per scenario: how calls ended (llm, local fallback, error), provider calls
+# made and p50/p99 latency. Coalescing is off so every call reaches the resilience layer.
+#
+#   python -m benchmarks.llm_fault_benchmark --calls 200 --concurrency 16
+#   python -m benchmarks.llm_fault_benchmark --scenarios outage --set LLM_FALLBACK_LOCAL_MATCHER=false
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    'healthy': {},
+    'flaky': {'error_rate': 0.3},
+    'slow_tail': {'slow_rate': 0.05, 'slow_latency': 1.0},
+    'outage': {'outage': True},
+}
+
+COLUMNS = ['Invoice Number', 'Issue Date', 'Total Amount', 'Vendor Name', 'Vendor Email', 'Qty', 'Notes']
+
+
+async def run_scenario(name: str, calls: int, concurrency: int, latency: float, seed: int) -> Dict[str, Any]:
+    from app.bao import llm_mapping_bao
+    from benchmarks.stub_llm import FaultInjectingModel
+
+    model = FaultInjectingModel(latency=latency, seed=seed, **SCENARIOS[name])
+    llm_mapping_bao.get_genai_model = lambda: model
+    bao = llm_mapping_bao.LLMMappingBAO()
+    outcomes: Counter = Counter()
+    durations: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_call():
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await bao.map_columns_with_llm(COLUMNS, {})
+                outcomes['local' if result['usage']['source'] == 'local' else 'llm'] += 1
+            except Exception as e:
+                outcomes[f"error:{type(e).__name__}"] += 1
+            durations.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_call() for _ in range(calls)))
+    return {
+        'scenario': name,
+        'calls': calls,
+        'outcomes': dict(outcomes),
+        'provider_calls': model.calls,
+        'provider_failures': model.failures,
+        'circuit_state': bao.resilient.breaker.state,
+        'p50_ms': round(percentile(durations, 50) * 1000, 2),
+        'p99_ms': round(percentile(durations, 99) * 1000, 2),
+        'wall_seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise LLM retries, hedging and the circuit breaker against injected faults")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per healthy provider call")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--set', nargs='*', default=[], metavar='NAME=VALUE', help="Settings overrides")
+    parser.add_argument('--output', help="Also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    overrides = dict(item.split('=', 1) for item in args.set)
+    overrides.setdefault('LLM_COALESCE_ENABLED', 'false')
+    overrides.setdefault('LLM_HEDGE_ENABLED', 'true')
+    overrides.setdefault('LLM_RETRY_BASE_DELAY_SECONDS', '0.05')
+    overrides.setdefault('LLM_REQUEST_TIMEOUT_SECONDS', '0.5')
+    overrides.setdefault('LLM_CIRCUIT_RESET_SECONDS', '1')
+    overrides.setdefault('LOG_LEVEL', 'ERROR')
+    configure_environment('sqlite://', **overrides)
+
+    results = []
+    for name in args.scenarios:
+        result = asyncio.run(run_scenario(name, args.calls, args.concurrency, args.latency, args.seed))
+        print(f"{name:<10} outcomes={result['outcomes']} provider_calls={result['provider_calls']} "
+              f"failures={result['provider_failures']} circuit={result['circuit_state']} "
+              f"p50={result['p50_ms']}ms p99={result['p99_ms']}ms")
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'settings': overrides, 'results': results}, handle, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
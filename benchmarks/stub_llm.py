@@ -0,0 +1,128 @@
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from app.bao.llm_mapping_bao import LLMMappingBAO
+from benchmarks.synthetic_invoices import PDF_SEPARATOR
+
+# Deterministic stand-in for the Gemini calls so the benchmark measures the pipeline, not the
+# provider. Answers in the same JSON shape as LLMMappingBAO. FaultInjectingModel replaces the
+# Gemini model itself, so the real BAO (retries, hedging, circuit breaker) runs against it.
+
+HEADER_MAPPINGS: Dict[str, Tuple[str, str]] = {
+    'invoice_number': ('invoice', 'invoice_number'),
+    'issue_date': ('invoice', 'issue_date'),
+    'due_date': ('invoice', 'due_date'),
+    'total_amount': ('invoice', 'total_amount'),
+    'vendor_name': ('vendor', 'vendor_name'),
+    'vendor_email': ('vendor', 'email'),
+    'email': ('vendor', 'email'),
+    'vendor_phone': ('vendor', 'phone'),
+    'phone': ('vendor', 'phone'),
+    'vendor_address': ('vendor', 'address'),
+    'address': ('vendor', 'address'),
+    'description': ('invoiceitem', 'description'),
+    'quantity': ('invoiceitem', 'quantity'),
+    'unit_price': ('invoiceitem', 'unit_price'),
+    'total_price': ('invoiceitem', 'total_price'),
+    'customer_name': ('customer', 'customer_name'),
+    'customer_email': ('customer', 'customer_email'),
+    'customer_phone': ('customer', 'customer_phone'),
+    'customer_address': ('customer', 'customer_address'),
+    'payment_date': ('payment', 'payment_date'),
+    'amount_paid': ('payment', 'amount_paid'),
+    'payment_method': ('payment', 'payment_method'),
+}
+
+
+class StubLLMMappingBAO(LLMMappingBAO):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    @staticmethod
+    def map_headers(columns: List[str]) -> Dict[str, Any]:
+        mappings, unmapped = [], []
+        for column in columns:
+            target = HEADER_MAPPINGS.get(column.strip().lower())
+            if target:
+                mappings.append({'source_field': column, 'target_table': target[0], 'target_column': target[1]})
+            else:
+                unmapped.append(column)
+        return {'mappings': mappings, 'unmapped_fields': unmapped}
+
+    async def map_columns_with_llm(self, extracted_columns: List[str], column_profiles: Dict[str, Dict[str, Any]],
+                                   document_context: Optional[str] = None) -> Dict[str, Any]:
+        self.calls += 1
+        return self.map_headers(extracted_columns)
+
+    async def fetch_and_map_columns_with_llm(self, file_context: str) -> Dict[str, Any]:
+        # The synthetic PDFs are pipe-separated reports: first such line is the header,
+        # repeated on every page
+        self.calls += 1
+        header: List[str] = []
+        data = []
+        for line in str(file_context).splitlines():
+            if PDF_SEPARATOR.strip() not in line:
+                continue
+            cells = [cell.strip() for cell in line.split(PDF_SEPARATOR.strip())]
+            if not header:
+                header = cells
+            elif cells != header:
+                data.append(dict(zip(header, cells)))
+
+        result = self.map_headers(header)
+        result['extracted_fields'] = header
+        result['data'] = data
+        return result
+
+
+class ProviderError(Exception):
+    # Looks like a google.api_core error to the retry logic
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+EXTRACTED_COLUMNS = re.compile(r"^Extracted columns: (\[.*\])$", re.MULTILINE)
+
+
+class FaultInjectingModel:
+    # Drop-in for genai.GenerativeModel. Every call sleeps `latency` seconds (`slow_latency` for a
+    # `slow_rate` share of calls), then fails with a 503 for an `error_rate` share, or always while
+    # `outage` is set. Mapping prompts are answered from HEADER_MAPPINGS
+    def __init__(self, latency: float = 0.05, slow_rate: float = 0.0, slow_latency: float = 2.0,
+                 error_rate: float = 0.0, outage: bool = False, seed: int = 0):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.outage = outage
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def generate_content(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                         request_options: Optional[Dict[str, Any]] = None) -> StubResponse:
+        with self.lock:
+            self.calls += 1
+            slow = self.random.random() < self.slow_rate
+            fail = self.outage or self.random.random() < self.error_rate
+        time.sleep(self.slow_latency if slow else self.latency)
+        if fail:
+            with self.lock:
+                self.failures += 1
+            raise ProviderError(503, "injected fault: service unavailable")
+
+        match = EXTRACTED_COLUMNS.search(prompt)
+        columns = json.loads(match.group(1)) if match else []
+        return StubResponse(json.dumps(StubLLMMappingBAO.map_headers(columns)))
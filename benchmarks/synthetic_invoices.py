@@ -0,0 +1,286 @@
+import argparse
+import csv
+import random
+import uuid
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List
+
+# Deterministic synthetic invoice files for the pipeline benchmark. Two row shapes mirror the
+# sample uploads: "extended" (uploads/extended_invoices_data.csv: ISO dates, UUID ids, 29 columns)
+# and "data2" (uploads/data2.csv: dd-mm-yyyy dates, GSTINs, 24 columns). Either shape can be
+# written as CSV, TSV, XLSX, DOCX (one table) or PDF (a text report, like the sample PDFs).
+#
+#   python -m benchmarks.synthetic_invoices --shape extended --format pdf --rows 1000 --out invoices.pdf
+
+SHAPES = {
+    'extended': [
+        'invoice_number', 'issue_date', 'due_date', 'total_amount', 'vendor_name', 'vendor_id',
+        'vendor_email', 'vendor_phone', 'vendor_address', 'product_id', 'description', 'quantity',
+        'unit_price', 'total_price', 'discount', 'tax_amount', 'shipping_cost', 'customer_id',
+        'customer_name', 'customer_email', 'customer_phone', 'customer_address', 'payment_date',
+        'amount_paid', 'payment_method', 'invoice_status', 'payment_reference', 'currency', 'notes'
+    ],
+    'data2': [
+        'invoice_number', 'issue_date', 'due_date', 'total_amount', 'vendor_name', 'email', 'phone',
+        'address', 'description', 'quantity', 'unit_price', 'total_price', 'customer_name',
+        'customer_email', 'customer_phone', 'customer_address', 'payment_date', 'amount_paid',
+        'payment_method', 'invoice_status', 'vendor_gstin', 'customer_gstin', 'remarks', 'discount'
+    ]
+}
+
+FORMATS = ('csv', 'tsv', 'xlsx', 'pdf', 'docx')
+
+# Column separator used in the PDF report so the stub LLM can recover the records
+PDF_SEPARATOR = ' | '
+
+PRODUCTS = [
+    ('USB Cable', 50), ('Laptop', 1000), ('Keyboard', 50), ('Mouse', 40), ('Tablet', 700),
+    ('Monitor', 300), ('Smartphone', 500), ('Printer', 250), ('HDMI Cable', 60), ('Headphones', 120)
+]
+COMPANY_WORDS = ['Acme', 'Doyle', 'Gardner', 'Tech', 'Gadget', 'Summit', 'Harbor', 'Nimbus', 'Vertex', 'Orchid']
+COMPANY_SUFFIXES = ['Ltd', 'Corp', 'Inc', 'Supplies', 'and Sons', 'World', 'Group']
+FIRST_NAMES = ['Lisa', 'Brooke', 'John', 'Jane', 'Bob', 'Daniel', 'Troy', 'Heather', 'Laura', 'Alice']
+LAST_NAMES = ['Kelly', 'Garcia', 'Doe', 'Smith', 'Lee', 'Hahn', 'Nielsen', 'Jenkins', 'Riley', 'Johnson']
+STREETS = ['Market St', 'Elm St', 'Tech Park', 'Pine Ave', 'Oak Lane', 'Taylor Estate', 'Smith Fords']
+PAYMENT_METHODS = ['Cash', 'PayPal', 'Credit Card', 'Debit Card', 'Bank Transfer']
+STATUSES = ['Paid', 'Pending', 'Partial', 'Overdue']
+CURRENCIES = ['USD', 'EUR', 'AUD', 'INR', 'GBP']
+REMARKS = ['On-time', 'Delayed payment', 'Completed', 'Awaiting approval', '']
+STATE_CODES = ['27', '29', '07', '33', '24']
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+class InvoiceRowGenerator:
+    def __init__(self, shape: str, seed: int = 7, parties: int = 1000):
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown shape '{shape}'. Available: {list(SHAPES)}")
+        self.shape = shape
+        self.columns = SHAPES[shape]
+        self.rng = random.Random(seed)
+        # Invoices reuse a bounded set of vendors and customers, as real ledgers do
+        self.vendors = [self.party('vendor') for _ in range(parties)]
+        self.customers = [self.party('customer') for _ in range(parties)]
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def gstin(self) -> str:
+        rng = self.rng
+        pan = ''.join(rng.choice(LETTERS) for _ in range(5)) + f"{rng.randint(0, 9999):04d}" + rng.choice(LETTERS)
+        return f"{rng.choice(STATE_CODES)}{pan}{rng.randint(1, 9)}Z{rng.choice(LETTERS)}"
+
+    def party(self, kind: str) -> Dict[str, str]:
+        rng = self.rng
+        if kind == 'vendor':
+            name = f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_SUFFIXES)}"
+            handle = name.split()[0].lower()
+            email = f"sales@{handle}{rng.randint(1, 999)}.com"
+        else:
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            name = f"{first} {last}"
+            email = f"{first.lower()}.{last.lower()}{rng.randint(1, 999)}@example.com"
+        return {
+            'id': self.uuid(),
+            'name': name,
+            'email': email,
+            'phone': str(rng.randint(1000000000, 9999999999)),
+            'address': f"{rng.randint(1, 9999)} {rng.choice(STREETS)}",
+            'gstin': self.gstin()
+        }
+
+    def format_date(self, value: date) -> str:
+        return value.strftime('%d-%m-%Y') if self.shape == 'data2' else value.isoformat()
+
+    def row(self, index: int) -> Dict[str, Any]:
+        rng = self.rng
+        vendor = rng.choice(self.vendors)
+        customer = rng.choice(self.customers)
+        description, unit_price = rng.choice(PRODUCTS)
+        quantity = rng.randint(1, 12)
+        total_price = quantity * unit_price
+        discount = rng.choice([0, 0, 0, 50, 100, 200])
+        tax_amount = round(total_price * 0.18)
+        shipping_cost = rng.choice([0, 25, 50, 100])
+        total_amount = total_price + tax_amount + shipping_cost - discount
+        issue_date = date(2025, 1, 1) + timedelta(days=index % 365)
+        due_date = issue_date + timedelta(days=14)
+        payment_date = issue_date + timedelta(days=rng.randint(1, 20))
+        status = rng.choice(STATUSES)
+        amount_paid = total_amount if status == 'Paid' else total_amount // 2
+
+        values = {
+            'invoice_number': f"INV{index + 1:07d}",
+            'issue_date': self.format_date(issue_date),
+            'due_date': self.format_date(due_date),
+            'total_amount': total_amount,
+            'vendor_name': vendor['name'],
+            'vendor_id': vendor['id'],
+            'vendor_email': vendor['email'],
+            'vendor_phone': vendor['phone'],
+            'vendor_address': vendor['address'],
+            'email': vendor['email'],
+            'phone': vendor['phone'],
+            'address': vendor['address'],
+            'product_id': self.uuid(),
+            'description': description,
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'total_price': total_price,
+            'discount': discount,
+            'tax_amount': tax_amount,
+            'shipping_cost': shipping_cost,
+            'customer_id': customer['id'],
+            'customer_name': customer['name'],
+            'customer_email': customer['email'],
+            'customer_phone': customer['phone'],
+            'customer_address': customer['address'],
+            'payment_date': self.format_date(payment_date),
+            'amount_paid': amount_paid,
+            'payment_method': rng.choice(PAYMENT_METHODS),
+            'invoice_status': status,
+            'payment_reference': self.uuid(),
+            'currency': rng.choice(CURRENCIES),
+            'notes': rng.choice(REMARKS),
+            'vendor_gstin': vendor['gstin'],
+            'customer_gstin': customer['gstin'],
+            'remarks': rng.choice(REMARKS)
+        }
+        return {column: values[column] for column in self.columns}
+
+    def rows(self, count: int) -> Iterator[List[Any]]:
+        for index in range(count):
+            row = self.row(index)
+            yield [row[column] for column in self.columns]
+
+
+def write_delimited(path: str, columns: List[str], rows: Iterator[List[Any]], delimiter: str):
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle, delimiter=delimiter)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def write_xlsx(path: str, columns: List[str], rows: Iterator[List[Any]]):
+    from openpyxl import Workbook
+
+    # write_only streams rows to disk instead of building the whole sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Invoices')
+    sheet.append(columns)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def write_docx(path: str, columns: List[str], rows: Iterator[List[Any]]):
+    from docx import Document
+    from docx.oxml.ns import qn
+    from lxml import etree
+
+    document = Document()
+    document.add_paragraph("Invoice register")
+    table = document.add_table(rows=1, cols=len(columns))
+    for cell, column in zip(table.rows[0].cells, columns):
+        cell.text = column
+
+    # Table.add_row() re-reads the whole table per call; append the <w:tr> elements directly
+    tbl = table._tbl
+    for row in rows:
+        tr = etree.SubElement(tbl, qn('w:tr'))
+        for value in row:
+            run = etree.SubElement(etree.SubElement(etree.SubElement(tr, qn('w:tc')), qn('w:p')), qn('w:r'))
+            etree.SubElement(run, qn('w:t')).text = str(value)
+    document.save(path)
+
+
+def pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(path: str, columns: List[str], rows: Iterator[List[Any]], lines_per_page: int = 60):
+    # Minimal hand-written PDF (Helvetica text, one content stream per page); PyPDF2 reads it
+    # back as one line per record. Pages are streamed to disk, so 1M rows stay cheap in memory.
+    header = PDF_SEPARATOR.join(columns)
+    offsets: List[int] = []
+    page_ids: List[int] = []
+
+    with open(path, 'wb') as handle:
+        def write_object(object_id: int, body: bytes):
+            while len(offsets) < object_id:
+                offsets.append(0)
+            offsets[object_id - 1] = handle.tell()
+            handle.write(f"{object_id} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        def write_page(lines: List[str]):
+            content_id = len(offsets) + 1
+            page_id = content_id + 1
+            commands = ["BT", "/F1 6 Tf", "8 TL", "20 580 Td"]
+            commands += [f"({pdf_escape(line)}) Tj T*" for line in lines]
+            commands.append("ET")
+            stream = "\n".join(commands).encode('latin-1', 'replace')
+            write_object(content_id, b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+            write_object(page_id, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 842 595] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+            ).encode())
+            page_ids.append(page_id)
+
+        handle.write(b"%PDF-1.4\n")
+        # 1: catalog, 2: page tree (written last, once the page ids are known), 3: font
+        offsets.extend([0, 0])
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+        lines = ["Invoice register", header]
+        for row in rows:
+            lines.append(PDF_SEPARATOR.join(str(value) for value in row))
+            if len(lines) == lines_per_page:
+                write_page(lines)
+                lines = [header]
+        if len(lines) > 1 or not page_ids:
+            write_page(lines)
+
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode())
+
+        xref_offset = handle.tell()
+        handle.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            handle.write(f"{offset:010d} 00000 n \n".encode())
+        handle.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+
+def generate_file(path: str, shape: str, file_format: str, rows: int, seed: int = 7) -> str:
+    generator = InvoiceRowGenerator(shape, seed=seed)
+    records = generator.rows(rows)
+
+    if file_format == 'csv':
+        write_delimited(path, generator.columns, records, ',')
+    elif file_format == 'tsv':
+        write_delimited(path, generator.columns, records, '\t')
+    elif file_format == 'xlsx':
+        write_xlsx(path, generator.columns, records)
+    elif file_format == 'docx':
+        write_docx(path, generator.columns, records)
+    elif file_format == 'pdf':
+        write_pdf(path, generator.columns, records)
+    else:
+        raise ValueError(f"Unknown format '{file_format}'. Available: {list(FORMATS)}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic invoice file")
+    parser.add_argument('--shape', choices=list(SHAPES), default='extended')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    generate_file(args.out, args.shape, args.format, args.rows, seed=args.seed)
+    print(f"Wrote {args.rows:,} {args.shape} rows to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,43 @@
-from fastapi import FastAPI, HTTPException
+from app.utils.startup_report import startup_report
+import asyncio
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.config import settings
 from app.utils.logger import setup_logger
-from app.database.connection import engine, Base
-from app.routes import upload_routes, dashboard_routes
+from app.database.connection import engine, async_engine
+from app.database.schema_check import verify_schema_revision
+from app.routes import upload_routes, dashboard_routes, admin_routes
+from app.dependencies import warm_up_singletons
+from app.utils.metrics import render_latest
+from app.utils.storage_backends import close_storage_backends
+from app.utils.tracing import TracingMiddleware, shutdown_tracing
 
 logger = setup_logger()
+startup_report.mark("imports_done")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting Invoice Processor API")
     
     try:
-        Base.metadata.create_all(bind=engine)
-        logger.info("Database tables created successfully")
+        verify_schema_revision(engine)
     except Exception as e:
-        logger.error(f"Error creating database tables: {str(e)}")
+        logger.error(f"Database schema check failed: {str(e)}")
         raise
     
+    warm_up_singletons()
+    startup_report.mark("ready")
+    logger.info(f"Startup report: {startup_report.as_dict()}")
+    
     yield
     
     logger.info("Shutting down Invoice Processor API")
+    await async_engine.dispose()
+    await close_storage_backends()
+    await asyncio.to_thread(shutdown_tracing)
+    # Drain enqueued log records before the process exits
+    await logger.complete()
 
 
 app = FastAPI(
@@ -40,8 +56,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so the request span covers CORS handling and every route
+app.add_middleware(TracingMiddleware)
+
 app.include_router(upload_routes.router, prefix=settings.API_PREFIX)
 app.include_router(dashboard_routes.router, prefix=settings.API_PREFIX)
+app.include_router(admin_routes.router, prefix=settings.API_PREFIX)
 
 @app.get("/")
 async def root():
@@ -51,6 +71,15 @@ async def root():
         "status": "running"
     }
 
+@app.get("/startup-report")
+async def get_startup_report():
+    return startup_report.as_dict()
+
+@app.get("/metrics")
+async def get_metrics():
+    body, content_type = render_latest()
+    return Response(content=body, headers={"Content-Type": content_type})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,138 @@
+"""initial schema
+
+Matches the tables previously created by Base.metadata.create_all. Databases that
+were bootstrapped that way should be stamped with this revision before upgrading:
+``alembic stamp 0001 && alembic upgrade head``.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'fileupload',
+        sa.Column('file_upload_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('original_filename', sa.String(length=255), nullable=False),
+        sa.Column('file_path', sa.String(length=500), nullable=True),
+        sa.Column('file_size', sa.BIGINT(), nullable=True),
+        sa.Column('file_type', sa.String(length=10), nullable=False),
+        sa.Column('storage_location', sa.String(length=50), nullable=False),
+        sa.Column('upload_timestamp', sa.TIMESTAMP(), nullable=True),
+        sa.Column('processing_status', sa.String(length=200), nullable=True),
+        sa.Column('processing_started_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('processing_completed_at', sa.TIMESTAMP(), nullable=True),
+        sa.Column('total_records_found', sa.Integer(), nullable=True),
+        sa.Column('successful_records', sa.Integer(), nullable=True),
+        sa.Column('failed_records', sa.Integer(), nullable=True),
+        sa.Column('error_summary', sa.Text(), nullable=True),
+        sa.Column('unmapped_columns', sa.JSON(), nullable=True),
+        sa.PrimaryKeyConstraint('file_upload_id')
+    )
+    op.create_table(
+        'vendor',
+        sa.Column('vendor_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('vendor_name', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=True),
+        sa.Column('phone', sa.String(), nullable=True),
+        sa.Column('address', sa.Text(), nullable=True),
+        sa.Column('file_upload_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['file_upload_id'], ['fileupload.file_upload_id']),
+        sa.PrimaryKeyConstraint('vendor_id')
+    )
+    op.create_table(
+        'customer',
+        sa.Column('customer_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('customer_name', sa.String(), nullable=True),
+        sa.Column('customer_email', sa.String(), nullable=True),
+        sa.Column('customer_phone', sa.String(), nullable=True),
+        sa.Column('customer_address', sa.Text(), nullable=True),
+        sa.Column('file_upload_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['file_upload_id'], ['fileupload.file_upload_id']),
+        sa.PrimaryKeyConstraint('customer_id')
+    )
+    op.create_table(
+        'llm_data_cache',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('file_upload_id', sa.Integer(), nullable=False),
+        sa.Column('data', sa.JSON(), nullable=True),
+        sa.Column('extracted_fields', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['file_upload_id'], ['fileupload.file_upload_id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'processinglog',
+        sa.Column('log_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('file_upload_id', sa.Integer(), nullable=False),
+        sa.Column('log_level', sa.String(length=10), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('details', sa.JSON().with_variant(postgresql.JSONB(), 'postgresql'), nullable=True),
+        sa.Column('timestamp', sa.TIMESTAMP(), nullable=True),
+        sa.ForeignKeyConstraint(['file_upload_id'], ['fileupload.file_upload_id']),
+        sa.PrimaryKeyConstraint('log_id')
+    )
+    op.create_table(
+        'invoice',
+        sa.Column('invoice_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('invoice_number', sa.String(), nullable=True),
+        sa.Column('issue_date', sa.DATE(), nullable=True),
+        sa.Column('due_date', sa.DATE(), nullable=True),
+        sa.Column('total_amount', sa.DECIMAL(), nullable=True),
+        sa.Column('vendor_id', sa.Integer(), nullable=False),
+        sa.Column('customer_id', sa.Integer(), nullable=False),
+        sa.Column('file_upload_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['customer_id'], ['customer.customer_id']),
+        sa.ForeignKeyConstraint(['file_upload_id'], ['fileupload.file_upload_id']),
+        sa.ForeignKeyConstraint(['vendor_id'], ['vendor.vendor_id']),
+        sa.PrimaryKeyConstraint('invoice_id')
+    )
+    op.create_table(
+        'payment',
+        sa.Column('payment_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('invoice_id', sa.Integer(), nullable=False),
+        sa.Column('payment_date', sa.DATE(), nullable=True),
+        sa.Column('amount_paid', sa.DECIMAL(), nullable=True),
+        sa.Column('payment_method', sa.String(), nullable=True),
+        sa.Column('file_upload_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['file_upload_id'], ['fileupload.file_upload_id']),
+        sa.ForeignKeyConstraint(['invoice_id'], ['invoice.invoice_id']),
+        sa.PrimaryKeyConstraint('payment_id')
+    )
+    op.create_table(
+        'invoice_item',
+        sa.Column('item_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('invoice_id', sa.Integer(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('quantity', sa.Integer(), nullable=True),
+        sa.Column('unit_price', sa.DECIMAL(), nullable=True),
+        sa.Column('total_price', sa.DECIMAL(), nullable=True),
+        sa.Column('file_upload_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['file_upload_id'], ['fileupload.file_upload_id']),
+        sa.ForeignKeyConstraint(['invoice_id'], ['invoice.invoice_id']),
+        sa.PrimaryKeyConstraint('item_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('invoice_item')
+    op.drop_table('payment')
+    op.drop_table('invoice')
+    op.drop_table('processinglog')
+    op.drop_table('llm_data_cache')
+    op.drop_table('customer')
+    op.drop_table('vendor')
+    op.drop_table('fileupload')
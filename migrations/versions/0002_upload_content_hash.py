@@ -0,0 +1,61 @@
+"""upload content hash and reusable mappings
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases created by create_all while uploads were already deduplicated by content hash, but
+    # before Alembic, have some or all of this revision's columns; add only what is missing
+    inspector = sa.inspect(op.get_bind())
+    fileupload_columns = {column['name'] for column in inspector.get_columns('fileupload')}
+    fileupload_indexes = {index['name'] for index in inspector.get_indexes('fileupload')}
+    cache_columns = {column['name'] for column in inspector.get_columns('llm_data_cache')}
+
+    with op.batch_alter_table('fileupload') as batch_op:
+        if 'content_hash' not in fileupload_columns:
+            batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        if 'reused_from_upload_id' not in fileupload_columns:
+            batch_op.add_column(sa.Column('reused_from_upload_id', sa.Integer(), nullable=True))
+            batch_op.create_foreign_key(
+                'fk_fileupload_reused_from_upload_id', 'fileupload',
+                ['reused_from_upload_id'], ['file_upload_id']
+            )
+        if 'ix_fileupload_content_hash' not in fileupload_indexes:
+            batch_op.create_index('ix_fileupload_content_hash', ['content_hash'])
+
+    if 'mappings' not in cache_columns:
+        with op.batch_alter_table('llm_data_cache') as batch_op:
+            batch_op.add_column(sa.Column('mappings', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    # Named by this revision, or by the database when create_all added the column
+    reused_from_fk = next((
+        foreign_key['name'] for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys('fileupload')
+        if foreign_key['constrained_columns'] == ['reused_from_upload_id']
+    ), None)
+
+    with op.batch_alter_table('llm_data_cache') as batch_op:
+        batch_op.drop_column('mappings')
+
+    with op.batch_alter_table('fileupload') as batch_op:
+        batch_op.drop_index('ix_fileupload_content_hash')
+        if reused_from_fk:
+            batch_op.drop_constraint(reused_from_fk, type_='foreignkey')
+        batch_op.drop_column('reused_from_upload_id')
+        batch_op.drop_column('content_hash')
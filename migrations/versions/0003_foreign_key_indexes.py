@@ -0,0 +1,38 @@
+"""foreign key indexes
+
+Child tables are joined on their parent keys, but Postgres does not index
+foreign keys on its own. The file_upload_id columns are covered by the
+(file_upload_id, primary key) indexes of revision 0004.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FOREIGN_KEY_COLUMNS = [
+    ('invoice', 'vendor_id'),
+    ('invoice', 'customer_id'),
+    ('payment', 'invoice_id'),
+    ('invoice_item', 'invoice_id'),
+]
+
+
+def upgrade() -> None:
+    for table, column in FOREIGN_KEY_COLUMNS:
+        op.create_index(f'ix_{table}_{column}', table, [column])
+
+
+def downgrade() -> None:
+    for table, column in reversed(FOREIGN_KEY_COLUMNS):
+        op.drop_index(f'ix_{table}_{column}', table_name=table)
@@ -0,0 +1,79 @@
+"""indexes for file_upload_id access paths
+
+Indexes child tables on (file_upload_id, primary key) so per-upload reads come
+back in insertion order without a sort, adds the dashboard and dedup indexes on
+fileupload, a partial index over in-flight uploads, and makes llm_data_cache
+one row per upload.
+Indexes are built CONCURRENTLY on Postgres so the upgrade does not block writes.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE_STATUS_FILTER = sa.text("processing_status IN ('Pending', 'Processing')")
+HAS_CONTENT_HASH_FILTER = sa.text("content_hash IS NOT NULL")
+
+CHILD_INDEXES = [
+    ('vendor', 'ix_vendor_upload_vendor', ['file_upload_id', 'vendor_id']),
+    ('customer', 'ix_customer_upload_customer', ['file_upload_id', 'customer_id']),
+    ('invoice', 'ix_invoice_upload_invoice', ['file_upload_id', 'invoice_id']),
+    ('payment', 'ix_payment_upload_payment', ['file_upload_id', 'payment_id']),
+    ('invoice_item', 'ix_invoice_item_upload_item', ['file_upload_id', 'item_id']),
+    ('processinglog', 'ix_processinglog_upload_timestamp', ['file_upload_id', 'timestamp']),
+]
+
+
+def upgrade() -> None:
+    # Keep the newest cache row per upload before enforcing uniqueness
+    op.execute(
+        "DELETE FROM llm_data_cache WHERE id NOT IN "
+        "(SELECT MAX(id) FROM llm_data_cache GROUP BY file_upload_id)"
+    )
+
+    with op.get_context().autocommit_block():
+        for table, name, columns in CHILD_INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+        op.create_index(
+            'uq_llm_data_cache_file_upload_id', 'llm_data_cache', ['file_upload_id'],
+            unique=True, postgresql_concurrently=True
+        )
+
+        op.create_index('ix_fileupload_recent', 'fileupload', ['upload_timestamp'], postgresql_concurrently=True)
+        op.create_index(
+            'ix_fileupload_active_status', 'fileupload', ['processing_status', 'processing_started_at'],
+            postgresql_where=ACTIVE_STATUS_FILTER, sqlite_where=ACTIVE_STATUS_FILTER,
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_fileupload_content_hash_type', 'fileupload', ['content_hash', 'file_type'],
+            postgresql_where=HAS_CONTENT_HASH_FILTER, sqlite_where=HAS_CONTENT_HASH_FILTER,
+            postgresql_concurrently=True
+        )
+        op.drop_index('ix_fileupload_content_hash', table_name='fileupload', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_fileupload_content_hash', 'fileupload', ['content_hash'], postgresql_concurrently=True)
+        op.drop_index('ix_fileupload_content_hash_type', table_name='fileupload', postgresql_concurrently=True)
+        op.drop_index('ix_fileupload_active_status', table_name='fileupload', postgresql_concurrently=True)
+        op.drop_index('ix_fileupload_recent', table_name='fileupload', postgresql_concurrently=True)
+
+        op.drop_index('uq_llm_data_cache_file_upload_id', table_name='llm_data_cache', postgresql_concurrently=True)
+
+        for table, name, columns in reversed(CHILD_INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,30 @@
+"""llm token usage per upload
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('fileupload') as batch_op:
+        batch_op.add_column(sa.Column('llm_prompt_tokens', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('llm_completion_tokens', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('fileupload') as batch_op:
+        batch_op.drop_column('llm_completion_tokens')
+        batch_op.drop_column('llm_prompt_tokens')
@@ -0,0 +1,38 @@
+"""mapping memory learned from confirmed mappings
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'mapping_memory',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('source_key', sa.String(length=255), nullable=False),
+        sa.Column('target_table', sa.String(length=100), nullable=False),
+        sa.Column('target_column', sa.String(length=100), nullable=False),
+        sa.Column('confirmed_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_confirmed_at', sa.TIMESTAMP(), nullable=False, server_default=sa.func.current_timestamp()),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('uq_mapping_memory_source_target', 'mapping_memory',
+                    ['source_key', 'target_table', 'target_column'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_mapping_memory_source_target', table_name='mapping_memory')
+    op.drop_table('mapping_memory')
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import tempfile
+import pytest
+
+# app.config requires these; tests that need a database use the database fixture below, none reach a provider
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test.db")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GENAI_API_KEY", "test")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+# Keep test runs from appending to the working tree's app.log
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "invoice-tests.log"))
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # A throwaway SQLite database behind the app's session factories, for DAO and BAO tests.
+    # Yields a sessionmaker for setting up rows and checking what was written
+    from sqlalchemy import create_engine
+    from sqlalchemy.dialects.postgresql import JSONB
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.ext.compiler import compiles
+    from sqlalchemy.orm import sessionmaker
+    from app.database import connection, models
+
+    @compiles(JSONB, "sqlite")
+    def jsonb_on_sqlite(element, compiler, **kw):
+        # processinglog.details is JSONB on PostgreSQL
+        return "JSON"
+
+    path = tmp_path / "app.db"
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    sessions = sessionmaker(bind=engine, autoflush=False)
+    monkeypatch.setattr(connection, "SessionLocal", sessions)
+    monkeypatch.setattr(connection, "AsyncSessionLocal",
+                        async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False))
+    yield sessions
+    asyncio.run(async_engine.dispose())
+    engine.dispose()
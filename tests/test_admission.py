@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+from app.config import settings
+from app.utils.admission import AdmissionController, AdmissionRejected, Budget
+
+
+def test_slots_are_handed_to_waiters_in_order():
+    async def run():
+        budget = Budget("stage:test", limit=1, max_waiting=5)
+        await budget.acquire(1.0)
+        order = []
+
+        async def waiter(name):
+            await budget.acquire(1.0)
+            order.append(name)
+            budget.release(0.1)
+
+        waiters = [asyncio.create_task(waiter(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        budget.release(0.1)
+        await asyncio.gather(*waiters)
+        return order, budget.in_use
+
+    assert asyncio.run(run()) == (list("abc"), 0)
+
+
+def test_full_queue_is_refused_with_429():
+    async def run():
+        budget = Budget("stage:test", limit=1, max_waiting=1)
+        await budget.acquire(1.0)
+        queued = asyncio.create_task(budget.acquire(1.0))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(AdmissionRejected) as rejected:
+                await budget.acquire(1.0)
+        finally:
+            budget.release(None)
+            await queued
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+
+
+def test_wait_past_timeout_is_refused_with_503_and_frees_its_place():
+    async def run():
+        budget = Budget("stage:test", limit=1, max_waiting=5)
+        await budget.acquire(1.0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await budget.acquire(0.01)
+        return rejected.value, len(budget.waiters), budget.in_use
+
+    rejected, waiting, in_use = asyncio.run(run())
+    assert rejected.status_code == 503
+    assert (waiting, in_use) == (0, 1)
+
+
+def test_cancelled_waiter_does_not_keep_a_slot():
+    async def run():
+        budget = Budget("stage:test", limit=1, max_waiting=5)
+        await budget.acquire(1.0)
+        queued = asyncio.create_task(budget.acquire(1.0))
+        await asyncio.sleep(0)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        budget.release(None)
+        return len(budget.waiters), budget.in_use
+
+    assert asyncio.run(run()) == (0, 0)
+
+
+def test_size_classes(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_MEDIUM_FILE_BYTES", 100)
+    monkeypatch.setattr(settings, "ADMISSION_LARGE_FILE_BYTES", 1000)
+
+    assert AdmissionController.size_class(99) == 'small'
+    assert AdmissionController.size_class(100) == 'medium'
+    assert AdmissionController.size_class(1000) == 'large'
+    # Unknown sizes are treated as the worst case
+    assert AdmissionController.size_class(None) == 'large'
+
+
+def test_ticket_takes_stage_and_size_slots_and_releases_them_once(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMISSION_LARGE_FILE_BYTES", 1000)
+    controller = AdmissionController()
+
+    async def run():
+        ticket = await controller.acquire("confirm", 5000)
+        held = (controller.stage_budgets['confirm'].in_use, controller.size_budgets['large'].in_use)
+        ticket.release()
+        ticket.release()
+        return held, (controller.stage_budgets['confirm'].in_use, controller.size_budgets['large'].in_use)
+
+    assert asyncio.run(run()) == ((1, 1), (0, 0))
@@ -0,0 +1,66 @@
+from datetime import date, datetime, timezone
+from app.utils.column_profiler import classify, is_null, profile_columns
+
+
+def test_nulls_and_placeholders():
+    assert all(is_null(value) for value in (None, float('nan'), '', ' N/A ', 'null', '-'))
+    assert not any(is_null(value) for value in (0, 'NA Corp', 'x'))
+
+
+def test_value_classes():
+    assert classify('billing@acme.com') == 'email'
+    assert classify('2024-01-31') == 'date'
+    assert classify('31 Jan 2024') == 'date'
+    assert classify('$1,200.50') == 'amount'
+    assert classify('1,200') == 'number'
+    assert classify('+91 98765 43210') == 'phone'
+    assert classify('27AAPFU0939F1ZV') == 'gstin'
+    assert classify(12.5) == 'number'
+    assert classify('Widget') == 'text'
+
+
+def test_profile_of_a_typed_column():
+    rows = [{'amount': value} for value in (10, 2.5, None, 40)]
+
+    profile = profile_columns(['amount'], rows)['amount']
+
+    assert profile['type'] == 'number'
+    assert profile['null_ratio'] == 0.25
+    assert (profile['min'], profile['max']) == (2.5, 40)
+
+
+def test_mixed_numbers_and_dates_keep_separate_ranges():
+    rows = [{'d': datetime(2024, 1, 2)}, {'d': 5}, {'d': date(2023, 12, 31)}, {'d': datetime(2024, 3, 1)}, {'d': 1}]
+
+    profile = profile_columns(['d'], rows)['d']
+
+    assert profile['type'] == 'date'
+    assert (profile['min'], profile['max']) == ('2023-12-31T00:00:00', '2024-03-01T00:00:00')
+    assert profile['classes'] == {'date': 0.6, 'number': 0.4}
+
+
+def test_aware_and_naive_datetimes_compare():
+    rows = [{'d': datetime(2024, 1, 2, tzinfo=timezone.utc)}, {'d': datetime(2024, 1, 1)}, {'d': date(2024, 1, 3)}]
+
+    profile = profile_columns(['d'], rows)['d']
+
+    assert (profile['min'], profile['max']) == ('2024-01-01T00:00:00', '2024-01-03T00:00:00')
+
+
+def test_text_column_reports_length_and_diverse_samples():
+    rows = [{'name': name} for name in ['Acme'] * 5 + ['Globex Corporation International', 'Initech']]
+
+    profile = profile_columns(['name'], rows, samples_per_column=2)['name']
+
+    assert profile['distinct'] == 3
+    assert profile['max_length'] == len('Globex Corporation International')
+    assert profile['samples'] == ['Acme', 'Globex Corporation International']
+
+
+def test_rows_are_sampled_evenly():
+    rows = [{'n': index} for index in range(1000)]
+
+    profile = profile_columns(['n'], rows, max_rows=10)['n']
+
+    assert profile['distinct'] == 10
+    assert profile['max'] == 900
@@ -0,0 +1,37 @@
+from app.config import settings
+from app.dao.data_inserting_dao import LLMMappingProcessor
+from app.database.models import FileUpload, Invoice, ProcessingLog
+from app.utils.failed_rows import unpack_failed_rows
+
+MAPPINGS = {'mappings': [
+    {'source_field': 'Invoice', 'target_table': 'invoice', 'target_column': 'invoice_number'},
+    {'source_field': 'Amount', 'target_table': 'invoice', 'target_column': 'total_amount'},
+]}
+
+
+def add_upload(sessions, file_upload_id=1):
+    with sessions() as db:
+        db.add(FileUpload(file_upload_id=file_upload_id, original_filename="a.csv", file_type="csv",
+                          storage_location="local"))
+        db.commit()
+
+
+def test_failed_records_are_logged_in_full_only_up_to_the_cap(database, monkeypatch):
+    monkeypatch.setattr(settings, "LOG_MAX_RECORD_ERRORS", 2)
+    add_upload(database)
+    rows = [{'Invoice': 'INV-0', 'Amount': '10.00'}] + [{'Invoice': f'INV-{i}', 'Amount': 'lots'} for i in range(1, 6)]
+
+    with database() as db:
+        stats = LLMMappingProcessor(db, 1).process_batch(rows, MAPPINGS)
+
+    assert (stats['successful_records'], stats['failed_records']) == (1, 5)
+    with database() as db:
+        assert db.query(Invoice).count() == 1
+        logs = db.query(ProcessingLog).order_by(ProcessingLog.log_id).all()
+        upload = db.query(FileUpload).one()
+        failed_rows = unpack_failed_rows(upload.failed_rows)
+    errors = [log for log in logs if log.log_level == 'ERROR']
+    assert [log.details['record']['Invoice'] for log in errors] == ['INV-1', 'INV-2']
+    summary = [log for log in logs if 'further record failures' in log.message]
+    assert summary[0].details == {'reasons': {'invoice.total_amount: not an amount': 5}}
+    assert failed_rows == {i: 'invoice.total_amount: not an amount' for i in range(1, 6)}
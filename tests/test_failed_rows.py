@@ -0,0 +1,73 @@
+import asyncio
+from decimal import InvalidOperation
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.config import settings
+from app.dao.file_upload_dao import FileUploadDAO
+from app.database.models import FileUpload
+from app.database.schema_registry import get_schema_registry
+from app.utils.failed_rows import failure_reason, pack_failed_rows, unpack_failed_rows
+
+
+def test_each_reason_is_stored_once():
+    failures = {90: "IntegrityError (UniqueViolation)", 17: "invoice.issue_date: not a date",
+                42: "invoice.issue_date: not a date"}
+    packed = pack_failed_rows(failures)
+    assert packed == {'reasons': ["invoice.issue_date: not a date", "IntegrityError (UniqueViolation)"],
+                      'rows': [[17, 0], [42, 0], [90, 1]]}
+    assert unpack_failed_rows(packed) == failures
+
+
+def test_no_failures_pack_to_nothing():
+    assert pack_failed_rows({}) is None
+    assert unpack_failed_rows(None) == {}
+
+
+def test_long_reasons_are_cut(monkeypatch):
+    monkeypatch.setattr(settings, "FAILED_ROW_REASON_MAX_CHARS", 10)
+    assert unpack_failed_rows(pack_failed_rows({3: "x" * 50})) == {3: "x" * 10}
+
+
+def test_coercion_reasons_leave_the_value_out():
+    registry = get_schema_registry()
+    compiled, _ = registry.compile_mappings(
+        [{'source_field': 'Amount', 'target_table': 'invoice', 'target_column': 'total_amount'}]
+    )
+    reasons = set()
+    for value in ("12 apples", "n/a-ish", "1,23,4"):
+        with pytest.raises(ValueError) as raised:
+            registry.transform({'Amount': value}, compiled)
+        assert value in str(raised.value)
+        reasons.add(failure_reason(raised.value))
+    assert reasons == {"invoice.total_amount: not an amount", "invoice.total_amount: not an amount: unrecognised separators"}
+
+
+def test_other_errors_are_reduced_to_their_class():
+    assert failure_reason(KeyError("vendor 'ACME' missing")) == "KeyError"
+    error = IntegrityError("INSERT INTO invoice ... ('INV-1')", {}, InvalidOperation())
+    assert failure_reason(error) == "IntegrityError (InvalidOperation)"
+
+
+def test_only_one_claim_succeeds():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as connection:
+            await connection.run_sync(FileUpload.__table__.create)
+            await connection.execute(insert(FileUpload).values(
+                file_upload_id=1, original_filename="a.csv", file_type="csv", storage_location="local",
+                processing_status="Partial success"
+            ))
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        dao = FileUploadDAO()
+        claims = []
+        for _ in range(2):
+            async with sessions() as db:
+                claims.append(await dao.claim_for_processing(db, 1))
+        async with sessions() as db:
+            status = (await db.execute(select(FileUpload.processing_status))).scalar()
+        await engine.dispose()
+        return claims, status
+
+    assert asyncio.run(run()) == ([True, False], "Processing")
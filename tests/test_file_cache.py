@@ -0,0 +1,71 @@
+import hashlib
+import pytest
+from app.utils.file_cache import LocalFileCache
+
+
+def digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def test_entries_are_addressed_by_content(tmp_path):
+    cache = LocalFileCache(str(tmp_path), max_bytes=1024)
+    old, new = b"old invoice", b"new invoice"
+    cache.put(digest(old), ".csv", old)
+
+    with cache.open_or_fetch(digest(new), ".csv", lambda: new) as f:
+        assert f.read() == new
+    with cache.open(digest(old), ".csv") as f:
+        assert f.read() == old
+
+
+def test_fetch_runs_once_and_is_verified(tmp_path):
+    cache = LocalFileCache(str(tmp_path), max_bytes=1024)
+    content = b"a,b\n1,2\n"
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return content
+
+    for _ in range(2):
+        with cache.open_or_fetch(digest(content), ".csv", fetch) as f:
+            assert f.read() == content
+    assert len(fetches) == 1
+
+    with pytest.raises(ValueError):
+        cache.open_or_fetch(digest(b"something else"), ".csv", lambda: content)
+    assert not cache.contains(digest(b"something else"), ".csv")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LocalFileCache(str(tmp_path), max_bytes=20)
+    first, second, third = b"a" * 8, b"b" * 8, b"c" * 8
+    cache.put(digest(first), "", first)
+    cache.put(digest(second), "", second)
+    cache.open(digest(first)).close()
+    cache.put(digest(third), "", third)
+
+    assert cache.contains(digest(first))
+    assert not cache.contains(digest(second))
+    assert cache.contains(digest(third))
+
+
+def test_open_entry_survives_eviction(tmp_path):
+    cache = LocalFileCache(str(tmp_path), max_bytes=10)
+    first, second = b"a" * 8, b"b" * 8
+    cache.put(digest(first), "", first)
+
+    with cache.open(digest(first)) as f:
+        cache.put(digest(second), "", second)
+        assert not cache.contains(digest(first))
+        assert f.read() == first
+
+
+def test_existing_entries_are_loaded(tmp_path):
+    content = b"cached"
+    LocalFileCache(str(tmp_path), max_bytes=1024).put(digest(content), ".pdf", content)
+
+    cache = LocalFileCache(str(tmp_path), max_bytes=1024)
+
+    with cache.open(digest(content), ".pdf") as f:
+        assert f.read() == content
@@ -0,0 +1,136 @@
+import asyncio
+from decimal import Decimal
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import func, select
+from app.bao.file_processing_bao import FileProcessingBAO
+from app.dao.file_upload_dao import FileUploadDAO
+from app.database.models import FileUpload, Invoice, LLMDataCache, ProcessingLog, Vendor
+from app.routes.upload_routes import confirm_mappings
+from app.schemas.mapping_schemas import MappingRequest
+from app.utils.failed_rows import pack_failed_rows
+from app.utils.llm_resilience import LLMUnavailable
+from app.utils.progress_events import AWAITING_CONFIRMATION_STATUS, RETRY_LATER_STATUS
+
+
+class UnavailableLLM:
+    async def fetch_and_map_columns_with_llm(self, document_text):
+        raise LLMUnavailable("LLM provider unavailable (circuit open)", retry_after=30)
+
+
+def add_upload(sessions, file_upload_id, file_type="csv", **columns):
+    with sessions() as db:
+        db.add(FileUpload(file_upload_id=file_upload_id, original_filename=f"upload.{file_type}", file_type=file_type,
+                          storage_location="local", **columns))
+        db.commit()
+
+
+def test_document_upload_waits_for_the_llm_instead_of_failing(database):
+    add_upload(database, 1, file_type="pdf")
+    bao = FileProcessingBAO(llm_mapping_bao=UnavailableLLM())
+
+    async def extract_data(file_upload):
+        return {"context": "Invoice INV-1 from ACME, total 10.00"}
+    bao.extract_data = extract_data
+
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(bao.process_uploaded_file(1))
+    with database() as db:
+        upload = db.get(FileUpload, 1)
+        assert upload.processing_status == RETRY_LATER_STATUS
+        assert "30s" in upload.error_summary
+
+
+def test_preview_reports_coercion_failures_and_writes_nothing(database):
+    add_upload(database, 1)
+    sample_rows = [
+        {'Invoice No': 'INV-1', 'Vendor': 'ACME', 'Amount': '1,200.50'},
+        {'Invoice No': 'INV-2', 'Vendor': 'ACME', 'Amount': '12 apples'},
+        {'Invoice No': 'INV-3', 'Vendor': 'Globex', 'Amount': '30'},
+    ]
+    with database() as db:
+        db.add(LLMDataCache(file_upload_id=1, extracted_fields=list(sample_rows[0]), sample_rows=sample_rows))
+        db.commit()
+    mappings = [
+        {'source_field': 'Invoice No', 'target_table': 'invoice', 'target_column': 'invoice_number'},
+        {'source_field': 'Vendor', 'target_table': 'vendor', 'target_column': 'vendor_name'},
+        {'source_field': 'Amount', 'target_table': 'invoice', 'target_column': 'total_amount'},
+    ]
+
+    preview = asyncio.run(FileProcessingBAO(llm_mapping_bao=UnavailableLLM()).preview_mappings(1, mappings, 10))
+    assert (preview.rows_previewed, preview.valid_rows, preview.failed_rows) == (3, 2, 1)
+    assert [(error.row, error.source_field, error.target_column) for error in preview.errors] == [(1, 'Amount', 'total_amount')]
+    assert "not an amount" in preview.errors[0].message
+    assert [row.row for row in preview.tables['invoice']] == [0, 2]
+    assert preview.tables['invoice'][0].values['total_amount'] == Decimal("1200.50")
+    with database() as db:
+        for model in (Invoice, Vendor, ProcessingLog):
+            assert db.scalar(select(func.count()).select_from(model)) == 0
+
+
+def test_uploads_of_identical_content_keep_their_own_mappings(database):
+    rows = [{'Invoice No': 'INV-1', 'Vendor': 'ACME', 'Ref': 'R-1'}]
+    add_upload(database, 1, content_hash="a" * 64, unmapped_columns={'unmapped_fields': []})
+    add_upload(database, 2, content_hash="a" * 64)
+    suggested = [{'source_field': 'Invoice No', 'target_table': 'invoice', 'target_column': 'invoice_number'}]
+    with database() as db:
+        db.add(LLMDataCache(file_upload_id=1, extracted_fields=list(rows[0]), mappings=suggested, sample_rows=rows))
+        db.commit()
+    bao = FileProcessingBAO(llm_mapping_bao=UnavailableLLM())
+
+    async def extract_data(file_upload):
+        return {"columns": list(rows[0]), "rows": rows}
+    bao.extract_data = extract_data
+
+    reused = asyncio.run(bao.process_uploaded_file(2))
+    assert reused["mappings"] == suggested
+    with database() as db:
+        assert db.get(FileUpload, 2).processing_status == AWAITING_CONFIRMATION_STATUS
+
+    first = suggested + [{'source_field': 'Ref', 'target_table': 'invoice', 'target_column': 'notes'}]
+    second = suggested + [{'source_field': 'Vendor', 'target_table': 'vendor', 'target_column': 'vendor_name'}]
+    asyncio.run(bao.confirm_user_mappings(1, first))
+    asyncio.run(bao.confirm_user_mappings(2, second))
+    with database() as db:
+        owned = {cache.file_upload_id: cache.mappings for cache in db.scalars(select(LLMDataCache))}
+    assert owned == {1: first, 2: second}
+
+
+def test_retry_defaults_to_the_uploads_own_mappings(database):
+    rows = [{'Invoice No': 'INV-1', 'Vendor': 'ACME'}]
+    source = [{'source_field': 'Invoice No', 'target_table': 'invoice', 'target_column': 'invoice_number'}]
+    own = source + [{'source_field': 'Vendor', 'target_table': 'vendor', 'target_column': 'vendor_name'}]
+    add_upload(database, 1)
+    add_upload(database, 2, reused_from_upload_id=1, failed_rows=pack_failed_rows({0: "IntegrityError"}))
+    with database() as db:
+        db.add_all([LLMDataCache(file_upload_id=1, extracted_fields=list(rows[0]), mappings=source),
+                    LLMDataCache(file_upload_id=2, extracted_fields=list(rows[0]), mappings=own)])
+        db.commit()
+    bao = FileProcessingBAO(llm_mapping_bao=UnavailableLLM())
+    used = []
+
+    async def extract_data(file_upload):
+        return {"columns": list(rows[0]), "rows": rows}
+
+    async def insert_mapped_records(file_content, mappings, file_upload_id, row_indices=None):
+        used.append(mappings['mappings'])
+        return {'total_records': 1, 'successful_records': 1, 'failed_records': 0, 'errors': []}
+    bao.extract_data = extract_data
+    bao.insert_mapped_records = insert_mapped_records
+
+    assert asyncio.run(bao.retry_failed_records(2)).status == "Completed"
+    assert used == [own]
+
+
+class NoHeaders:
+    headers = {}
+
+
+def test_confirm_is_refused_while_the_upload_is_processing(database):
+    add_upload(database, 1, processing_status="Processing")
+    bao = FileProcessingBAO(llm_mapping_bao=UnavailableLLM())
+    request = MappingRequest(mappings=[])
+
+    with pytest.raises(HTTPException) as refused:
+        asyncio.run(confirm_mappings(1, request, NoHeaders(), Response(), FileUploadDAO(), bao))
+    assert refused.value.status_code == 409
@@ -0,0 +1,59 @@
+import io
+import docx
+from app.utils.file_utils import FileProcessor
+
+
+def docx_file(*tables, paragraphs=()):
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    for rows in tables:
+        table = document.add_table(rows=len(rows), cols=len(rows[0]))
+        for row, values in zip(table.rows, rows):
+            for cell, value in zip(row.cells, values):
+                cell.text = value
+    buffer = io.BytesIO()
+    document.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def test_docx_tables_with_one_header_are_joined():
+    header = ["Invoice No", "Amount"]
+    file = docx_file([header, ["INV-1", "10"]], [header, ["INV-2", "20"]], paragraphs=["Acme Ltd"])
+
+    data = FileProcessor().extract_data_from_docx(file, "invoices.docx")
+
+    assert data['columns'] == header
+    assert data['rows'] == [{"Invoice No": "INV-1", "Amount": "10"}, {"Invoice No": "INV-2", "Amount": "20"}]
+    assert data['context'] == "Acme Ltd\n"
+    assert data['skipped_tables'] == []
+
+
+def test_docx_repeated_header_row_is_dropped():
+    header = ["Invoice No", "Amount"]
+    file = docx_file([header, ["INV-1", "10"], header, ["INV-2", "20"]])
+
+    data = FileProcessor().extract_data_from_docx(file, "invoices.docx")
+
+    assert data['total_rows'] == 2
+
+
+def test_docx_smaller_tables_are_reported_as_skipped():
+    items = [["Item", "Qty"], ["Bolt", "4"], ["Nut", "8"]]
+    totals = [["Tax", "Total"], ["1", "11"]]
+    file = docx_file(items, totals)
+
+    data = FileProcessor().extract_data_from_docx(file, "invoice.docx")
+
+    assert data['columns'] == ["Item", "Qty"]
+    assert data['skipped_tables'] == [{'columns': ["Tax", "Total"], 'rows': 1}]
+
+
+def test_docx_without_tables_returns_text():
+    file = docx_file(paragraphs=["Invoice INV-1", "Total 10"])
+
+    data = FileProcessor().extract_data_from_docx(file, "letter.docx")
+
+    assert data['rows'] == []
+    assert data['context'] == "Invoice INV-1\nTotal 10"
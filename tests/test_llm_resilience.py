@@ -0,0 +1,173 @@
+import asyncio
+import time
+import pytest
+from app.config import settings
+from app.utils import llm_resilience
+from app.utils.llm_resilience import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, LatencyWindow, LLMUnavailable,
+                                      ResilientCaller, is_retryable)
+
+
+class ProviderError(Exception):
+    def __init__(self, code):
+        super().__init__(f"provider answered {code}")
+        self.code = code
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_DELAY_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "LLM_REQUEST_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", False)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 5)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_RESET_SECONDS", 30.0)
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    clock[0] += 10
+    assert breaker.retry_after() == 21
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_retryable_errors():
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(ProviderError(503))
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(ProviderError(400))
+    assert not is_retryable(ValueError("blocked"))
+
+
+def test_latency_percentile_needs_enough_samples():
+    window = LatencyWindow()
+    for seconds in range(1, 11):
+        window.add(float(seconds))
+    assert window.percentile(90, min_samples=20) is None
+    assert window.percentile(90, min_samples=10) == 10.0
+    assert window.percentile(50, min_samples=10) == 6.0
+
+
+def test_transient_failures_are_retried(fast_retries):
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ProviderError(503)
+        return "ok"
+
+    caller = ResilientCaller("test")
+    assert asyncio.run(caller.call("mapping", fn)) == "ok"
+    assert len(attempts) == 3
+    assert caller.breaker.state == CLOSED
+
+
+def test_non_retryable_errors_are_raised_at_once(fast_retries):
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise ProviderError(400)
+
+    caller = ResilientCaller("test")
+    with pytest.raises(ProviderError):
+        asyncio.run(caller.call("mapping", fn))
+    assert len(attempts) == 1
+    assert caller.breaker.failures == 0
+
+
+def test_exhausted_attempts_raise_503(fast_retries):
+    def fn():
+        raise ProviderError(503)
+
+    caller = ResilientCaller("test")
+    with pytest.raises(LLMUnavailable) as raised:
+        asyncio.run(caller.call("mapping", fn))
+    assert raised.value.status_code == 503
+    assert "Retry-After" in raised.value.headers
+
+
+def test_open_circuit_fails_fast(fast_retries, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 2)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        raise ProviderError(503)
+
+    caller = ResilientCaller("test")
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(caller.call("mapping", fn))
+    assert len(attempts) == 2
+    assert caller.breaker.state == OPEN
+
+    with pytest.raises(LLMUnavailable) as raised:
+        asyncio.run(caller.call("mapping", fn))
+    assert len(attempts) == 2
+    assert int(raised.value.headers["Retry-After"]) >= 1
+
+
+def test_slow_attempt_times_out(fast_retries, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_REQUEST_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "LLM_MAX_ATTEMPTS", 1)
+
+    caller = ResilientCaller("test")
+    with pytest.raises(LLMUnavailable) as raised:
+        asyncio.run(caller.call("mapping", lambda: time.sleep(0.3)))
+    assert isinstance(raised.value.__cause__, asyncio.TimeoutError)
+
+
+def test_hedged_request_wins_over_a_slow_first_attempt(fast_retries, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_PERCENTILE", 50.0)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_SAMPLES", 1)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    caller = ResilientCaller("test")
+    caller.latencies.add(0.01)
+    assert asyncio.run(caller.call("mapping", fn)) == "fast"
+    assert len(calls) == 2
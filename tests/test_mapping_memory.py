@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from app.config import settings
+from app.database.schema_registry import get_schema_registry
+from app.utils.mapping_memory import MappingMemory, source_key
+
+
+def test_llm_names_are_reduced_to_raw_headers_and_bare_columns():
+    mappings = [
+        {'source_field': 'Invoice No (String)', 'target_table': 'invoice', 'target_column': 'invoice_number (String)'},
+        {'source_field': 'Amount (USD)', 'target_table': 'invoice', 'target_column': 'total_amount'},
+    ]
+    columns = ['Invoice No', 'Amount (USD)']
+    assert get_schema_registry().canonical_mappings(mappings, columns) == [
+        {'source_field': 'Invoice No', 'target_table': 'invoice', 'target_column': 'invoice_number'},
+        {'source_field': 'Amount (USD)', 'target_table': 'invoice', 'target_column': 'total_amount'},
+    ]
+
+
+def test_canonical_mappings_are_unchanged_by_a_second_pass():
+    registry = get_schema_registry()
+    mappings = [{'source_field': 'Invoice No (String)', 'target_table': 'invoice', 'target_column': 'invoice_number'}]
+    once = registry.canonical_mappings(mappings, ['Invoice No'])
+    assert registry.canonical_mappings(once, ['Invoice No']) == once
+    # Without the file's headers the source field is left as given
+    assert registry.canonical_mappings(mappings)[0]['source_field'] == 'Invoice No (String)'
+
+
+def test_headers_that_differ_only_in_parentheses_stay_apart():
+    assert source_key('Amount (USD)') != source_key('Amount (EUR)')
+    assert source_key('Invoice No') == source_key('invoice-no')
+
+
+def test_remembered_target_needs_its_share_of_recent_confirmations(monkeypatch):
+    monkeypatch.setattr(settings, 'MAPPING_MEMORY_MIN_SHARE', 0.6)
+    monkeypatch.setattr(settings, 'MAPPING_MEMORY_HALF_LIFE_DAYS', 30)
+    now = datetime(2026, 1, 31)
+    memory = MappingMemory()
+    memory.record('Method', 'customer', 'customer_name', now - timedelta(days=90))
+    memory.record('Method', 'customer', 'customer_name', now - timedelta(days=90))
+    assert memory.lookup('Method', now) == ('customer', 'customer_name')
+
+    # One recent correction outweighs two confirmations three half-lives old
+    memory.record('Method', 'payment', 'payment_method', now)
+    assert memory.lookup('Method', now) == ('payment', 'payment_method')
+    assert memory.lookup_all(['Method', 'Unknown']) == {'Method': ('payment', 'payment_method')}
@@ -0,0 +1,43 @@
+import pytest
+from fastapi import HTTPException
+from app.config import settings
+from app.routes.admin_routes import require_profiling
+from app.utils.profiler import RequestProfiler
+
+
+@pytest.fixture
+def profiling(monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    return monkeypatch
+
+
+def test_admin_routes_are_closed_without_a_configured_token(profiling):
+    profiling.setattr(settings, "PROFILING_TOKEN", None)
+
+    for token in (None, "", "anything"):
+        with pytest.raises(HTTPException) as refused:
+            require_profiling(token)
+        assert refused.value.status_code == 403
+
+
+def test_admin_routes_need_the_matching_token(profiling):
+    profiling.setattr(settings, "PROFILING_TOKEN", "secret")
+
+    with pytest.raises(HTTPException) as refused:
+        require_profiling("wrong")
+    assert refused.value.status_code == 403
+    require_profiling("secret")
+
+
+def test_admin_routes_are_hidden_when_profiling_is_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", False)
+
+    with pytest.raises(HTTPException) as hidden:
+        require_profiling("secret")
+    assert hidden.value.status_code == 404
+
+
+def test_profile_header_is_ignored_without_a_token(profiling):
+    profiling.setattr(settings, "PROFILING_TOKEN", None)
+
+    assert RequestProfiler().start("confirm_mappings", {'x-profile': '1'}) is None
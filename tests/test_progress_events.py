@@ -0,0 +1,88 @@
+import asyncio
+import json
+import threading
+from sqlalchemy import delete
+from app.config import settings
+from app.dao.file_upload_dao import FileUploadDAO
+from app.database.models import FileUpload
+from app.routes.upload_routes import stream_processing_events
+from app.utils.progress_events import ProgressBroker
+
+
+def test_subscribers_receive_their_uploads_events_until_they_leave():
+    async def run():
+        broker = ProgressBroker(queue_size=10)
+        with broker.subscribe(1) as queue, broker.subscribe(2) as other:
+            assert broker.subscriber_count() == 2
+            broker.publish(1, 'stage', stage='extract')
+            event = queue.get_nowait()
+            assert (event['type'], event['file_upload_id'], event['stage']) == ('stage', 1, 'extract')
+            assert other.empty()
+        assert broker.subscriber_count() == 0
+        assert broker.subscribers == {}
+        # Publishing with nobody listening only updates the snapshot
+        broker.publish(1, 'stage', stage='insert')
+
+    asyncio.run(run())
+
+
+def test_events_from_worker_threads_reach_the_subscribers_loop():
+    async def run():
+        broker = ProgressBroker(queue_size=10)
+        with broker.subscribe(1) as queue:
+            thread = threading.Thread(target=broker.publish, args=(1, 'progress'), kwargs={'successful_records': 5})
+            thread.start()
+            thread.join()
+            return await asyncio.wait_for(queue.get(), timeout=1)
+
+    assert asyncio.run(run())['successful_records'] == 5
+
+
+def test_slow_subscribers_lose_the_oldest_events():
+    async def run():
+        broker = ProgressBroker(queue_size=2)
+        with broker.subscribe(1) as queue:
+            for count in range(4):
+                broker.publish(1, 'progress', successful_records=count)
+            return [queue.get_nowait()['successful_records'] for _ in range(queue.qsize())]
+
+    assert asyncio.run(run()) == [2, 3]
+
+
+def test_snapshot_keeps_the_latest_event_of_each_kind():
+    broker = ProgressBroker(queue_size=10, max_tracked_uploads=2)
+    broker.publish(1, 'stage', stage='extract')
+    broker.publish(1, 'progress', successful_records=1)
+    broker.publish(1, 'stage', stage='insert')
+    assert [(event['type'], event.get('stage')) for event in broker.snapshot(1)] == [('progress', None), ('stage', 'insert')]
+
+    broker.publish(2, 'stage', stage='extract')
+    broker.publish(3, 'stage', stage='extract')
+    assert broker.snapshot(1) == []
+
+
+class ConnectedRequest:
+    async def is_disconnected(self):
+        return False
+
+
+def test_stream_ends_with_gone_when_the_upload_is_deleted(database, monkeypatch):
+    monkeypatch.setattr(settings, "SSE_HEARTBEAT_SECONDS", 0.01)
+    with database() as db:
+        db.add(FileUpload(file_upload_id=1, original_filename="a.csv", file_type="csv", storage_location="local",
+                          processing_status="Processing"))
+        db.commit()
+
+    async def run():
+        response = await stream_processing_events(1, ConnectedRequest(), FileUploadDAO())
+        chunks = response.body_iterator
+        first = await chunks.__anext__()
+        with database() as db:
+            db.execute(delete(FileUpload))
+            db.commit()
+        return [first] + [chunk async for chunk in chunks]
+
+    first, *rest = asyncio.run(run())
+    assert first.startswith("event: status\n")
+    assert rest[-1].startswith("event: gone\n")
+    assert json.loads(rest[-1].split("data: ", 1)[1]) == {'type': 'gone', 'file_upload_id': 1}
@@ -0,0 +1,93 @@
+import pytest
+from app.utils.prompt_builder import (OMITTED_MARKER, PAGE_BREAK, PromptBudgetExceeded, PromptBuilder, clean_document_text,
+                                      estimate_tokens, fit_lines)
+
+SCHEMA = "invoice: invoice_number String, issue_date Date, total_amount DECIMAL\nvendor: vendor_name String"
+
+
+def test_token_estimate():
+    assert estimate_tokens("") == 0
+    # 4 letters, 3 digits or one symbol per token
+    assert estimate_tokens("invoice") == 2
+    assert estimate_tokens("1234567") == 3
+    assert estimate_tokens("a_b, c!") == 6
+
+
+def test_headers_footers_and_page_numbers_are_kept_once():
+    pages = [f"ACME Corp\nInvoice line {number}\nPage {number} of 3\nThank you" for number in range(1, 4)]
+    assert clean_document_text(PAGE_BREAK.join(pages)).split("\n") == [
+        "ACME Corp", "Invoice line 1", "Thank you", "Invoice line 2", "Invoice line 3"
+    ]
+
+
+def test_a_line_repeated_on_fewer_than_half_the_pages_stays():
+    # Four pages need the line on ceil(4/2) = 2 of them to count as a header
+    pages = ["Header\nbody 1", "Other\nbody 2", "Other 3\nbody 3", "Other 4\nbody 4"]
+    assert clean_document_text(PAGE_BREAK.join(pages)).count("Header") == 1
+    pages[1] = "Header\nbody 2"
+    assert clean_document_text(PAGE_BREAK.join(pages)).count("Header") == 1
+    # A single page never has running headers, even at the threshold floor of 2
+    assert clean_document_text("Total\nTotal due\n  spaced   out  ") == "Total\nTotal due\nspaced out"
+
+
+def test_consecutive_duplicate_lines_collapse():
+    assert clean_document_text("Paid\nPaid\nDue") == "Paid\nDue"
+
+
+def test_fit_lines_keeps_the_head_and_the_tail():
+    lines = [f"line {number} with some words" for number in range(100)]
+    text = "\n".join(lines)
+    fitted = fit_lines(text, 120)
+    assert estimate_tokens(fitted) <= 120
+    kept = fitted.split("\n")
+    marker = next(line for line in kept if line.startswith("[..."))
+    head, tail = kept[:kept.index(marker)], kept[kept.index(marker) + 1:]
+    assert head == lines[:len(head)] and tail == lines[len(lines) - len(tail):]
+    assert len(head) > len(tail) > 0
+    assert marker == OMITTED_MARKER.format(count=len(lines) - len(head) - len(tail))
+
+
+def test_fit_lines_leaves_short_text_alone():
+    assert fit_lines("short", 10) == "short"
+    assert fit_lines("short", 0) == ""
+
+
+def test_a_single_huge_line_is_cut_by_characters():
+    text = "word " * 1000
+    fitted = fit_lines(text, 50)
+    assert text.startswith(fitted)
+    assert 0 < len(fitted) < len(text)
+    assert estimate_tokens(fitted) <= 50
+
+
+def test_mapping_prompt_respects_its_budget():
+    builder = PromptBuilder(SCHEMA)
+    columns = ["Invoice No", "Date", "Amount"]
+    profiles = {column: {'type': 'string', 'distinct': 40, 'samples': ["x" * 200] * 5} for column in columns}
+    document = "\n".join(f"Note {number}: payment terms and remarks" for number in range(500))
+
+    full = builder.mapping_prompt(columns, profiles, budget=100000)
+    assert not full.truncated
+
+    budget = estimate_tokens(builder.mapping_prompt(columns, None).text) + 60
+    prompt = builder.mapping_prompt(columns, profiles, document, budget=budget)
+    assert prompt.truncated and prompt.tokens <= budget
+    assert '"Invoice No"' in prompt.text and SCHEMA in prompt.text
+
+    with pytest.raises(PromptBudgetExceeded):
+        builder.mapping_prompt(columns, profiles, budget=10)
+
+
+def test_document_prompt_respects_its_budget():
+    builder = PromptBuilder(SCHEMA)
+    document = "\n".join(f"Item {number} widget 12.50" for number in range(1000))
+    budget = 1000
+    prompt = builder.document_prompt(document, budget=budget)
+    assert prompt.truncated and prompt.tokens <= budget
+    assert "Item 0 widget" in prompt.text and "Item 999 widget" in prompt.text
+
+    short = builder.document_prompt("Invoice INV-1 total 10.00", budget=budget)
+    assert not short.truncated
+
+    with pytest.raises(PromptBudgetExceeded):
+        builder.document_prompt(document, budget=20)
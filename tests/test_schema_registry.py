@@ -0,0 +1,88 @@
+from datetime import date, datetime
+from decimal import Decimal
+import pytest
+from app.config import settings
+from app.database.schema_registry import (coerce_date, coerce_datetime, coerce_decimal, coerce_integer, coerce_string,
+                                          get_schema_registry, infer_date_order)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1,234.56", Decimal("1234.56")),
+    ("$ 1,234,567.89", Decimal("1234567.89")),
+    ("₹12,34,567.50", Decimal("1234567.50")),
+    ("1.234,56", Decimal("1234.56")),
+    ("1 234,56 EUR", Decimal("1234.56")),
+    ("12,5", Decimal("12.5")),
+    ("-1.234.567,89", Decimal("-1234567.89")),
+    ("(1,200.00)", Decimal("-1200.00")),
+    ("1,234", Decimal("1234")),
+    (12.5, Decimal("12.5")),
+])
+def test_amounts(value, expected):
+    assert coerce_decimal(value) == expected
+
+
+@pytest.mark.parametrize("value", ["1,23,4", "1.234.567", "12,345.678,9", "abc", True])
+def test_unreadable_amounts_are_refused(value):
+    with pytest.raises(ValueError):
+        coerce_decimal(value)
+
+
+def test_integers_and_strings():
+    assert coerce_integer("1,000") == 1000
+    assert coerce_integer(7) == 7
+    with pytest.raises(ValueError):
+        coerce_integer("10.5")
+    assert coerce_string(9998887777.0) == "9998887777"
+    assert coerce_string("  INV-1 ") == "INV-1"
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2025-06-01", date(2025, 6, 1)),
+    ("2025-06-01T10:30:00", date(2025, 6, 1)),
+    ("13/04/2025", date(2025, 4, 13)),
+    ("04/13/2025", date(2025, 4, 13)),
+    ("05/05/2025", date(2025, 5, 5)),
+    ("1 Jun 2025", date(2025, 6, 1)),
+    ("June 1, 2025", date(2025, 6, 1)),
+    (datetime(2025, 6, 1, 9), date(2025, 6, 1)),
+])
+def test_dates(value, expected):
+    assert coerce_date(value) == expected
+
+
+def test_ambiguous_dates_are_refused_without_an_order(monkeypatch):
+    monkeypatch.setattr(settings, "DATE_ORDER", "")
+    with pytest.raises(ValueError, match="ambiguous"):
+        coerce_date("03/04/2025")
+    assert coerce_date("03/04/2025", "DMY") == date(2025, 4, 3)
+    assert coerce_date("03/04/2025", "MDY") == date(2025, 3, 4)
+
+    monkeypatch.setattr(settings, "DATE_ORDER", "MDY")
+    assert coerce_date("03/04/2025") == date(2025, 3, 4)
+    assert coerce_datetime("03/04/2025") == datetime(2025, 3, 4)
+
+
+def test_date_order_is_inferred_from_the_column():
+    assert infer_date_order(["03/04/2025", None, "13/04/2025"]) == ("DMY", "13/04/2025")
+    assert infer_date_order(["04/13/2025", "03/04/2025"]) == ("MDY", "04/13/2025")
+    assert infer_date_order(["03/04/2025", "2025-06-01"]) is None
+    # A column that reads both ways settles nothing
+    assert infer_date_order(["13/04/2025", "04/13/2025"]) is None
+
+
+def test_compiled_mappings_read_dates_in_the_inferred_order(monkeypatch):
+    monkeypatch.setattr(settings, "DATE_ORDER", "")
+    registry = get_schema_registry()
+    mappings = [{'source_field': 'Date', 'target_table': 'invoice', 'target_column': 'issue_date'}]
+    records = [{'Date': '03/04/2025'}, {'Date': '25/04/2025'}]
+
+    date_orders = registry.date_orders(mappings, records)
+    assert date_orders == {'Date': ('DMY', '25/04/2025')}
+    compiled, _ = registry.compile_mappings(mappings, date_orders)
+    assert registry.transform(records[0], compiled)['invoice']['issue_date'] == date(2025, 4, 3)
+
+    compiled, _ = registry.compile_mappings(mappings)
+    errors = []
+    registry.transform(records[0], compiled, errors)
+    assert errors and "ambiguous" in errors[0][3]
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.utils.singleflight import AsyncSingleFlight, SingleFlight
+from app.utils.ttl_cache import TTLCache
+
+
+def test_concurrent_threads_share_one_execution():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(single_flight.do("k", fn)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(single_flight.do("k", fn)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results == ["value", "value"]
+    assert len(calls) == 1
+
+
+def test_awaiters_share_one_run():
+    async def run():
+        single_flight = AsyncSingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(single_flight.do("k", fn), single_flight.do("k", fn))
+        return results, len(calls)
+
+    assert asyncio.run(run()) == ([("value", False), ("value", True)], 1)
+
+
+def test_errors_reach_every_awaiter():
+    async def run():
+        single_flight = AsyncSingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(single_flight.do("k", fn), single_flight.do("k", fn), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [type(result) for result in results] == [ValueError, ValueError]
+
+
+def test_cancelling_the_leader_does_not_cancel_a_waiting_follower():
+    async def run():
+        single_flight = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "value"
+
+        leader = asyncio.create_task(single_flight.do("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(single_flight.do("k", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == ("value", True)
+
+
+def test_run_is_cancelled_once_every_awaiter_has_gone():
+    async def run():
+        single_flight = AsyncSingleFlight()
+        cancelled = asyncio.Event()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return "stale"
+
+        async def fresh():
+            return "fresh"
+
+        callers = [asyncio.create_task(single_flight.do("k", fn)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return len(calls), await single_flight.do("k", fresh)
+
+    assert asyncio.run(run()) == (1, ("fresh", False))
+
+
+def test_ttl_cache_expires_and_bounds_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = TTLCache(max_entries=2, ttl_seconds=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    now[0] += 10
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+
+
+def test_ttl_cache_is_disabled_by_zero_settings():
+    cache = TTLCache(max_entries=0, ttl_seconds=10)
+    cache.set("a", 1)
+    assert cache.get("a") is None
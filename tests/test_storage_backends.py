@@ -0,0 +1,77 @@
+import asyncio
+import httpx
+import pytest
+from app.utils.storage_backends import LocalStorageBackend, SupabaseStorageBackend
+
+
+def test_local_keys_resolve_inside_root(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path / "uploads"))
+
+    assert backend.resolve("a.csv") == tmp_path / "uploads" / "a.csv"
+    assert backend.resolve(str(tmp_path / "uploads" / "a.csv")) == tmp_path / "uploads" / "a.csv"
+
+
+@pytest.mark.parametrize("key", ["../secret.txt", "/etc/passwd", "nested/../../secret.txt"])
+def test_local_keys_outside_root_are_rejected(tmp_path, key):
+    backend = LocalStorageBackend(str(tmp_path / "uploads"))
+
+    with pytest.raises(ValueError):
+        backend.resolve(key)
+
+
+def test_local_put_and_read_round_trip(tmp_path):
+    backend = LocalStorageBackend(str(tmp_path / "uploads"))
+
+    async def run():
+        key = await backend.put("a.csv", b"a,b\n1,2\n")
+        return await backend.read_bytes(key), await backend.read_range(key, 0, 2)
+
+    assert asyncio.run(run()) == (b"a,b\n1,2\n", b"a,b")
+
+
+def test_supabase_client_is_closed():
+    backend = SupabaseStorageBackend("http://localhost", "key", "bucket")
+
+    asyncio.run(backend.close())
+
+    assert backend.client.is_closed
+
+
+def supabase_backend(handler, **kwargs):
+    backend = SupabaseStorageBackend("http://localhost", "key", "bucket", **kwargs)
+    backend.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return backend
+
+
+@pytest.mark.parametrize("status_code, body", [
+    (400, {"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"}),
+    (409, {"error": "Duplicate"}),
+])
+def test_put_if_absent_treats_a_lost_race_as_stored(status_code, body):
+    # The object did not exist when checked, but a concurrent upload of the same content stored it first
+    def handler(request):
+        if request.method == "HEAD":
+            return httpx.Response(404)
+        return httpx.Response(status_code, json=body)
+
+    async def run(backend):
+        try:
+            return await backend.put_if_absent("a.csv", b"a,b\n1,2\n")
+        finally:
+            await backend.close()
+
+    assert asyncio.run(run(supabase_backend(handler))) == "a.csv"
+    # The resumable (TUS) path is refused the same way when the upload is created
+    assert asyncio.run(run(supabase_backend(handler, multipart_threshold=4))) == "a.csv"
+
+
+def test_put_if_absent_still_raises_other_errors():
+    def handler(request):
+        if request.method == "HEAD":
+            return httpx.Response(404)
+        return httpx.Response(400, json={"error": "InvalidKey"})
+
+    backend = supabase_backend(handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(backend.put_if_absent("a.csv", b"a,b\n"))
+    asyncio.run(backend.close())
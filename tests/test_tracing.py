@@ -0,0 +1,123 @@
+import json
+import pytest
+from app.config import settings
+from app.utils import tracing
+from app.utils.stage_timer import StageTimer
+from app.utils.tracing import (STATUS_ERROR, BatchSpanProcessor, FileSpanExporter, otlp_payload, parse_traceparent,
+                               span, start_span)
+
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch):
+    # Tracing on, every trace sampled, spans exported to a file read back by the test
+    monkeypatch.setattr(settings, "TRACING_ENABLED", True)
+    monkeypatch.setattr(settings, "TRACING_SAMPLE_RATIO", 1.0)
+    monkeypatch.setattr(settings, "TRACING_EXPORTER", "file")
+    monkeypatch.setattr(settings, "TRACING_FILE", str(tmp_path / "traces.jsonl"))
+    processor = BatchSpanProcessor()
+    monkeypatch.setattr(tracing, "span_processor", processor)
+
+    def read():
+        processor.shutdown()
+        lines = (tmp_path / "traces.jsonl").read_text().splitlines()
+        return [item for line in lines
+                for item in json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans']]
+    return read
+
+
+def test_payload_is_otlp_json():
+    parent = start_span("upload", attributes={'app.file_upload_id': 7}, parent=None)
+    child = start_span("SQL INSERT", 'CLIENT', parent, {'db.rows': 3, 'ratio': 0.5, 'cached': False, 'tags': ['a']})
+    child.record_exception(ValueError("bad value"))
+    for item in (child, parent):
+        item.end_ns = item.start_ns + 1000
+
+    payload = otlp_payload([child, parent])
+    resource = payload['resourceSpans'][0]
+    assert resource['resource']['attributes'] == [
+        {'key': 'service.name', 'value': {'stringValue': settings.TRACING_SERVICE_NAME}}
+    ]
+    exported_child, exported_parent = resource['scopeSpans'][0]['spans']
+    assert exported_child['traceId'] == exported_parent['traceId'] and len(exported_child['traceId']) == 32
+    assert exported_child['parentSpanId'] == exported_parent['spanId'] and len(exported_child['spanId']) == 16
+    assert 'parentSpanId' not in exported_parent
+    assert exported_child['kind'] == 3
+    assert exported_child['endTimeUnixNano'] == str(child.start_ns + 1000)
+    assert exported_child['attributes'] == [
+        {'key': 'db.rows', 'value': {'intValue': '3'}},
+        {'key': 'ratio', 'value': {'doubleValue': 0.5}},
+        {'key': 'cached', 'value': {'boolValue': False}},
+        {'key': 'tags', 'value': {'arrayValue': {'values': [{'stringValue': 'a'}]}}},
+    ]
+    assert exported_child['status'] == {'code': STATUS_ERROR, 'message': 'bad value'}
+    assert exported_child['events'][0]['name'] == 'exception'
+    assert exported_parent['status'] == {}
+
+
+def test_sampling_is_decided_at_the_root(monkeypatch):
+    monkeypatch.setattr(settings, "TRACING_SAMPLE_RATIO", 0.0)
+    root = start_span("root", parent=None)
+    assert not root.recording
+    assert not start_span("child", parent=root).recording
+
+    monkeypatch.setattr(settings, "TRACING_SAMPLE_RATIO", 1.0)
+    root = start_span("root", parent=None)
+    assert root.recording and start_span("child", parent=root).recording
+
+
+def test_incoming_traceparent_decides_sampling(monkeypatch):
+    monkeypatch.setattr(settings, "TRACING_SAMPLE_RATIO", 1.0)
+    trace_id, parent_id = "ab" * 16, "cd" * 8
+    unsampled = parse_traceparent(f"00-{trace_id}-{parent_id}-00")
+    child = start_span("request", 'SERVER', unsampled)
+    assert not child.recording
+    assert (child.trace_id, child.parent_id) == (trace_id, parent_id)
+
+    assert start_span("request", 'SERVER', parse_traceparent(f"00-{trace_id}-{parent_id}-01")).recording
+    assert parse_traceparent("00-short-id-01") is None
+    assert parse_traceparent(f"00-{'zz' * 16}-{parent_id}-01") is None
+
+
+def test_spans_beyond_the_per_trace_cap_are_counted_on_the_root(exported, monkeypatch):
+    monkeypatch.setattr(settings, "TRACING_MAX_SPANS_PER_TRACE", 2)
+    with span("root"):
+        for index in range(3):
+            with span(f"child {index}"):
+                pass
+
+    spans = exported()
+    assert [item['name'] for item in spans] == ["child 0", "root"]
+    root = spans[-1]
+    assert {'key': 'tracing.dropped_spans', 'value': {'intValue': '2'}} in root['attributes']
+
+
+def test_stage_spans_nest_under_the_current_span(exported):
+    timer = StageTimer("process_uploaded_file", file_type="csv")
+    with span("POST /upload", 'SERVER'):
+        with timer.stage("extract"):
+            pass
+        with pytest.raises(RuntimeError):
+            with timer.stage("insert"):
+                raise RuntimeError("lost connection")
+
+    spans = {item['name']: item for item in exported()}
+    request = spans["POST /upload"]
+    assert spans["process_uploaded_file.extract"]['parentSpanId'] == request['spanId']
+    assert spans["process_uploaded_file.insert"]['status']['code'] == STATUS_ERROR
+    assert [stage['outcome'] for stage in timer.finish()['spans']] == ['ok', 'error']
+
+
+def test_disabled_tracing_records_nothing(monkeypatch):
+    monkeypatch.setattr(settings, "TRACING_ENABLED", False)
+    with span("anything") as current:
+        assert not current.recording
+
+
+def test_file_exporter_writes_one_request_per_line(tmp_path):
+    exporter = FileSpanExporter(str(tmp_path / "traces.jsonl"))
+    first = start_span("a", parent=None)
+    first.end_ns = first.start_ns
+    exporter.export([first])
+    exporter.export([first])
+    lines = (tmp_path / "traces.jsonl").read_text().splitlines()
+    assert len(lines) == 2 and all('resourceSpans' in json.loads(line) for line in lines)